@@ -4,8 +4,17 @@ import com.bitwig.extension.controller.api.*;
 import com.bitwig.extension.controller.ControllerExtension;
 import py4j.GatewayServer;
 
+import java.util.ArrayList;
+import java.util.HashMap;
+import java.util.List;
+import java.util.Map;
+
 public class MarkerMaticBridgeExtension extends ControllerExtension {
 
+    // Separators for the bulk marker export, chosen as they can't be typed into a marker name
+    private static final char MARKER_SEPARATOR = '\u001e';
+    private static final char FIELD_SEPARATOR = '\u001f';
+
     // Objects we want to expose to Python, accessed via getters found below.
 
     private Transport transport;
@@ -18,6 +27,26 @@ public class MarkerMaticBridgeExtension extends ControllerExtension {
     // The object that bridges Java to Python
     private GatewayServer gatewayServer;
 
+    // MarkerMatic's callback, and whether it needs to hear about changes at the next flush
+    private volatile MarkerMaticListener listener;
+    private boolean markersChanged = false;
+    private boolean transportChanged = false;
+
+    // A marker being placed by addNamedCueMarkerAtPlaybackPosition, waiting to show up in the bank
+    private PendingMarker pendingMarker;
+
+    private static final class PendingMarker {
+        final int requestId;
+        final String name;
+        final List<String> markersBefore;
+
+        PendingMarker(int requestId, String name, List<String> markersBefore) {
+            this.requestId = requestId;
+            this.name = name;
+            this.markersBefore = markersBefore;
+        }
+    }
+
     protected MarkerMaticBridgeExtension(final MarkerMaticExtensionDefinition definition, final ControllerHost host) {
         super(definition, host);
     }
@@ -30,17 +59,19 @@ public class MarkerMaticBridgeExtension extends ControllerExtension {
 
         // Setting up API objects that we want to access from Python
         this.transport = host.createTransport();
-        this.transport.isPlaying().markInterested();
-        this.transport.isArrangerRecordEnabled().markInterested();
+        this.transport.isPlaying().addValueObserver(isPlaying -> this.transportChanged = true);
+        this.transport.isArrangerRecordEnabled().addValueObserver(
+                isArrangerRecordEnabled -> this.transportChanged = true);
 
         this.arranger = host.createArranger();
 
         this.cuemarkerbank = this.arranger.createCueMarkerBank(512);
-        this.cuemarkerbank.itemCount().markInterested();
+        this.cuemarkerbank.itemCount().addValueObserver(itemCount -> this.markersChanged = true);
 
         for (int i = 0; i < 512; i++) {
-            this.cuemarkerbank.getItemAt(i).name().markInterested();
-            this.cuemarkerbank.getItemAt(i).position().markInterested();
+            this.cuemarkerbank.getItemAt(i).name().addValueObserver(name -> this.markersChanged = true);
+            this.cuemarkerbank.getItemAt(i).position().addValueObserver(
+                    position -> this.markersChanged = true);
         }
 
         this.trackbank = host.createTrackBank(MAX_TRACKS, 0, 0);
@@ -62,6 +93,72 @@ public class MarkerMaticBridgeExtension extends ControllerExtension {
         return MIQInfo;
     }
 
+    // Returns every cue marker in one call, as name and position pairs. Fields are separated by
+    // FIELD_SEPARATOR and markers by MARKER_SEPARATOR, so the whole bank costs a single round trip.
+    public String getAllCueMarkerInfo() {
+        final int markerCount = this.cuemarkerbank.itemCount().get();
+        final StringBuilder allMarkerInfo = new StringBuilder();
+        for (int i = 0; i < markerCount && i < this.cuemarkerbank.getSizeOfBank(); i++) {
+            CueMarker MarkerInQuestion = this.cuemarkerbank.getItemAt(i);
+            if (i > 0) {
+                allMarkerInfo.append(MARKER_SEPARATOR);
+            }
+            allMarkerInfo.append(MarkerInQuestion.name().get());
+            allMarkerInfo.append(FIELD_SEPARATOR);
+            allMarkerInfo.append(MarkerInQuestion.position().getAsDouble());
+        }
+        return allMarkerInfo.toString();
+    }
+
+    // Registers MarkerMatic to be pushed marker and transport changes, starting with the current state
+    public void setListener(MarkerMaticListener listener) {
+        this.listener = listener;
+        this.markersChanged = true;
+        this.transportChanged = true;
+        getHost().requestFlush();
+    }
+
+    // Adds a cue marker at the playhead and names it once it appears in the bank. The listener's
+    // markerPlaced() is called with the request ID, and the new marker's index and position.
+    // MarkerMatic places one marker at a time, so a new request replaces any that never completed.
+    public void addNamedCueMarkerAtPlaybackPosition(int requestId, String name) {
+        if (this.pendingMarker != null) {
+            getHost().println("Marker request " + this.pendingMarker.requestId + " was never placed");
+        }
+        this.pendingMarker = new PendingMarker(requestId, name, getCueMarkerKeys());
+        this.transport.addCueMarkerAtPlaybackPosition();
+        getHost().requestFlush();
+    }
+
+    private List<String> getCueMarkerKeys() {
+        final int markerCount = Math.min(this.cuemarkerbank.itemCount().get(), this.cuemarkerbank.getSizeOfBank());
+        final List<String> markerKeys = new ArrayList<>(markerCount);
+        for (int i = 0; i < markerCount; i++) {
+            CueMarker MarkerInQuestion = this.cuemarkerbank.getItemAt(i);
+            markerKeys.add(MarkerInQuestion.name().get() + FIELD_SEPARATOR + MarkerInQuestion.position().getAsDouble());
+        }
+        return markerKeys;
+    }
+
+    // Names the pending marker if it has appeared, returning its index, or -1 if it hasn't
+    private int resolvePendingMarker() {
+        final Map<String, Integer> unchangedMarkers = new HashMap<>();
+        for (String markerKey : this.pendingMarker.markersBefore) {
+            unchangedMarkers.merge(markerKey, 1, Integer::sum);
+        }
+        final List<String> markerKeys = getCueMarkerKeys();
+        for (int i = 0; i < markerKeys.size(); i++) {
+            final Integer remaining = unchangedMarkers.get(markerKeys.get(i));
+            if (remaining != null && remaining > 0) {
+                unchangedMarkers.put(markerKeys.get(i), remaining - 1);
+                continue;
+            }
+            this.cuemarkerbank.getItemAt(i).name().set(this.pendingMarker.name);
+            return i;
+        }
+        return -1;
+    }
+
     public void renameMarker(int marker_num, String MarkerName) {
         CueMarker MarkerInQuestion = this.cuemarkerbank.getItemAt(marker_num);
         MarkerInQuestion.name().set(MarkerName);
@@ -137,7 +234,37 @@ public class MarkerMaticBridgeExtension extends ControllerExtension {
 
     @Override
     public void flush() {
-        // TODO Send any updates you need here.
+        // Changes are collected by the observers, and pushed once per flush
+        final MarkerMaticListener currentListener = this.listener;
+        if (currentListener == null) {
+            return;
+        }
+        try {
+            if (this.markersChanged && this.pendingMarker != null) {
+                final int markerIndex = resolvePendingMarker();
+                if (markerIndex >= 0) {
+                    final PendingMarker placedMarker = this.pendingMarker;
+                    this.pendingMarker = null;
+                    currentListener.markerPlaced(
+                            placedMarker.requestId,
+                            markerIndex,
+                            this.cuemarkerbank.getItemAt(markerIndex).position().getAsDouble());
+                }
+            }
+            if (this.markersChanged) {
+                this.markersChanged = false;
+                currentListener.markersChanged(getAllCueMarkerInfo());
+            }
+            if (this.transportChanged) {
+                this.transportChanged = false;
+                currentListener.transportChanged(
+                        this.transport.isPlaying().get(), this.transport.isArrangerRecordEnabled().get());
+            }
+        } catch (RuntimeException e) {
+            // MarkerMatic has gone away, it will register again when it reconnects
+            this.listener = null;
+            getHost().println("MarkerMatic listener disconnected");
+        }
     }
 
 
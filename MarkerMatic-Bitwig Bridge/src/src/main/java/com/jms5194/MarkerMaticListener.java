@@ -0,0 +1,14 @@
+package com.jms5194;
+
+// Implemented in Python by MarkerMatic, so the bridge can push changes instead of being polled.
+
+public interface MarkerMaticListener {
+
+    // Called with every cue marker, in the same format as getAllCueMarkerInfo()
+    void markersChanged(String allCueMarkerInfo);
+
+    // Called once a marker from addNamedCueMarkerAtPlaybackPosition() has been created and named
+    void markerPlaced(int requestId, int markerIndex, double position);
+
+    void transportChanged(boolean isPlaying, boolean isArrangerRecordEnabled);
+}
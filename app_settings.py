@@ -2,6 +2,7 @@ import configparser
 import threading
 from configparser import ConfigParser
 from logging import Logger
+from typing import Dict
 
 import constants
 from consoles import DiGiCo
@@ -35,6 +36,14 @@ class ThreadSafeSettings:
             "external_control_midi_port": constants.MIDI_PORT_NONE,
             "allow_loading_while_playing": False,
             "cue_list_player": 1,
+            "additional_cue_list_players": "",
+            "qlab_tcp_enabled": True,
+            # Ardour OSC surface feedback and strip types, see daws/ardour.py
+            "ardour_feedback": 24,
+            "ardour_strip_types": 0,
+            # Seconds between checks of the running processes, see
+            # daws/process_watcher.py
+            "process_check_interval": 2,
         }
 
     @property
@@ -281,6 +290,74 @@ class ThreadSafeSettings:
                 raise ValueError("Invalid ControlPointAddress for CueListPlayer")
             self._settings["cue_list_player"] = cue_list_player_num
 
+    @property
+    def additional_cue_list_players(self) -> str:
+        with self._lock:
+            return self._settings["additional_cue_list_players"]
+
+    @additional_cue_list_players.setter
+    def additional_cue_list_players(self, value: str):
+        with self._lock:
+            # Raises ValueError if any of the players are invalid
+            parse_cue_list_players(value)
+            self._settings["additional_cue_list_players"] = value
+
+    @property
+    def cue_list_players(self) -> Dict[int, str]:
+        """All of the Cue List Players to follow, with the marker prefix for each"""
+        with self._lock:
+            cue_list_players = {self._settings["cue_list_player"]: ""}
+            try:
+                additional_cue_list_players = parse_cue_list_players(
+                    self._settings["additional_cue_list_players"]
+                )
+            except ValueError as e:
+                logger.warning(f"Ignoring the additional Cue List Players: {e}")
+                additional_cue_list_players = {}
+        for cue_list_player_num, prefix in additional_cue_list_players.items():
+            cue_list_players.setdefault(cue_list_player_num, prefix)
+        return cue_list_players
+
+    @property
+    def qlab_tcp_enabled(self) -> bool:
+        with self._lock:
+            return self._settings["qlab_tcp_enabled"]
+
+    @qlab_tcp_enabled.setter
+    def qlab_tcp_enabled(self, value: bool):
+        with self._lock:
+            self._settings["qlab_tcp_enabled"] = value
+
+    @property
+    def ardour_feedback(self) -> int:
+        with self._lock:
+            return self._settings["ardour_feedback"]
+
+    @ardour_feedback.setter
+    def ardour_feedback(self, value: int):
+        with self._lock:
+            self._settings["ardour_feedback"] = int(value)
+
+    @property
+    def ardour_strip_types(self) -> int:
+        with self._lock:
+            return self._settings["ardour_strip_types"]
+
+    @ardour_strip_types.setter
+    def ardour_strip_types(self, value: int):
+        with self._lock:
+            self._settings["ardour_strip_types"] = int(value)
+
+    @property
+    def process_check_interval(self) -> int:
+        with self._lock:
+            return self._settings["process_check_interval"]
+
+    @process_check_interval.setter
+    def process_check_interval(self, value: int):
+        with self._lock:
+            self._settings["process_check_interval"] = int(value)
+
     def update_from_config_file(self, path: str) -> None:
         """Updates the currently loaded settings from the contents of the config file"""
         logger.info("Loading settings from config file")
@@ -297,6 +374,7 @@ class ThreadSafeSettings:
                 "console_type": "console_type",
                 "daw_type": "daw_type",
                 "external_control_midi_port": "external_control_midi_port",
+                "additional_cue_list_players": "additional_cue_list_players",
             }
             for settings_name, config_name in string_properties.items():
                 self._settings[settings_name] = config.get(
@@ -312,6 +390,9 @@ class ThreadSafeSettings:
                 "reaper_receive_port": "default_reaper_receive_port",
                 "external_control_osc_port": "external_control_osc_port",
                 "cue_list_player": "cue_list_player",
+                "ardour_feedback": "ardour_feedback",
+                "ardour_strip_types": "ardour_strip_types",
+                "process_check_interval": "process_check_interval",
             }
             for settings_name, config_name in int_properties.items():
                 self._settings[settings_name] = config.getint(
@@ -325,6 +406,7 @@ class ThreadSafeSettings:
                 "mmc_control_enabled": "mmc_control_enabled",
                 "allow_loading_while_playing": "allow_loading_while_playing",
                 "macros_enabled": "macros_enabled",
+                "qlab_tcp_enabled": "qlab_tcp_enabled",
             }
             for settings_name, config_name in boolean_properties.items():
                 self._settings[settings_name] = config.getboolean(
@@ -368,3 +450,21 @@ def validate_port_num(port_num: int) -> bool:
 def validate_cue_list_player(cue_list_player_num: int) -> bool:
     """Validate that a Cue List Player's index is a valid human-readable/display value, between 1 and 127, inclusive"""
     return 1 <= cue_list_player_num <= 127
+
+
+def parse_cue_list_players(value: str) -> Dict[int, str]:
+    """Parses a comma separated list of Cue List Player indexes, each optionally
+    followed by a colon and the prefix to add to its cue numbers, e.g. "2:FX, 3".
+    The prefix goes directly before the cue number, so name-only matching still
+    sees the cue name.
+    """
+    cue_list_players: Dict[int, str] = {}
+    for entry in value.split(","):
+        if not entry.strip():
+            continue
+        cue_list_player, _, prefix = entry.partition(":")
+        cue_list_player_num = int(cue_list_player)
+        if not validate_cue_list_player(cue_list_player_num):
+            raise ValueError(f"Invalid Cue List Player index: {cue_list_player_num}")
+        cue_list_players[cue_list_player_num] = prefix.strip()
+    return cue_list_players
@@ -1,6 +1,7 @@
+import threading
 import time
 from enum import Enum
-from typing import Any, Callable, List
+from typing import Any, Callable, Dict, List, Optional
 
 from pubsub import pub
 from pythonosc import udp_client
@@ -11,6 +12,12 @@ from logger_config import logger
 
 from . import Console, Feature
 
+# Number of entries the show file holds for each show control mode
+SHOW_TABLE_SIZES = {"cue": 500, "scene": 100, "snippet": 100}
+# Pace the show file table requests so neither end drops replies
+SHOW_TABLE_REQUEST_BATCH = 20
+SHOW_TABLE_REQUEST_INTERVAL_SECONDS = 0.02
+
 
 class BehringerX32ShowControlMode(Enum):
     CUE = 0
@@ -29,6 +36,15 @@ class BehringerX32(Console):
         self._console_name: str
         self._snapshot_name: str
         self._show_control_mode: BehringerX32ShowControlMode
+        self._show_table_requested = threading.Event()
+        self._show_table_lock = threading.Lock()
+        # Show file names for each mode, and the display numbers of cues, keyed by internal index
+        self._show_names: Dict[BehringerX32ShowControlMode, Dict[int, str]] = {
+            show_control_mode: {} for show_control_mode in BehringerX32ShowControlMode
+        }
+        self._cue_numbers: Dict[int, str] = {}
+        self._pending_cue_index: Optional[int] = None
+        self._pending_cue_arrival_time: Optional[float] = None
 
     def start_managed_threads(
         self, start_managed_thread: Callable[[str, Callable[..., Any]], None]
@@ -66,6 +82,8 @@ class BehringerX32(Console):
                 while not self._shutdown_server_event.is_set():
                     self._client.handle_messages(constants.MESSAGE_TIMEOUT_SECONDS)
             except Exception:
+                # Refresh the show file table once the console is reachable again
+                self._show_table_requested.clear()
                 time.sleep(constants.CONNECTION_RECONNECTION_DELAY_SECONDS)
 
     def _show_control_mode_received(
@@ -77,45 +95,130 @@ class BehringerX32(Console):
     def _internal_cue_number_received(
         self, _address: str, internal_cue_number: int
     ) -> None:
+        arrival_time = time.monotonic()
         self._message_received()
-        self._cue_number = internal_cue_number
-        if self._show_control_mode is BehringerX32ShowControlMode.CUE:
+        if internal_cue_number == -1:
+            return
+        show_control_mode = self._show_control_mode
+        with self._show_table_lock:
+            self._pending_cue_index = internal_cue_number
+            self._pending_cue_arrival_time = arrival_time
+            cue_name = self._show_names[show_control_mode].get(internal_cue_number)
+            cue_number = self._get_display_number(
+                show_control_mode, internal_cue_number
+            )
+        if cue_name is not None and cue_number is not None:
+            # Already in the show table, so there's no need to wait on the console
+            self._publish_pending_cue(internal_cue_number)
+            return
+        # Fall back to asking the console for whatever isn't cached yet
+        mode_name = show_control_mode.name.lower()
+        if cue_number is None:
             self._client.send_message(
-                f"/-show/showfile/{self._show_control_mode.name.lower()}/{internal_cue_number:03}/numb",
-                None,
+                f"/-show/showfile/{mode_name}/{internal_cue_number:03}/numb", None
             )
-        if internal_cue_number != -1:
+        if cue_name is None:
             self._client.send_message(
-                f"/-show/showfile/{self._show_control_mode.name.lower()}/{internal_cue_number:03}/name",
-                None,
+                f"/-show/showfile/{mode_name}/{internal_cue_number:03}/name", None
+            )
+
+    def _get_display_number(
+        self, show_control_mode: BehringerX32ShowControlMode, internal_cue_number: int
+    ) -> Optional[str]:
+        """Returns the number shown to the user for a show file entry, or None if
+        it's not known yet. Must be called with the show table lock held."""
+        if show_control_mode is BehringerX32ShowControlMode.CUE:
+            return self._cue_numbers.get(internal_cue_number)
+        return str(internal_cue_number)
+
+    def _publish_pending_cue(self, internal_cue_number: int) -> None:
+        """Sends a cue load for the last recalled entry, if it is the given entry
+        and both its number and name are known"""
+        with self._show_table_lock:
+            if self._pending_cue_index != internal_cue_number:
+                return
+            show_control_mode = self._show_control_mode
+            cue_name = self._show_names[show_control_mode].get(internal_cue_number)
+            cue_number = self._get_display_number(
+                show_control_mode, internal_cue_number
             )
+            if cue_name is None or cue_number is None:
+                return
+            self._pending_cue_index = None
+            arrival_time = self._pending_cue_arrival_time
+        pub.sendMessage(
+            PyPubSubTopics.HANDLE_CUE_LOAD,
+            cue=f"{cue_number} {cue_name}",
+            arrival_time=arrival_time,
+        )
+
+    @staticmethod
+    def _get_show_table_index(address: str) -> int:
+        # Addresses are in the form /-show/showfile/<mode>/<index>/<field>
+        return int(address.split("/")[4])
 
-    def _cue_cue_number_received(self, _address: str, cue_number: int) -> None:
-        self._cue_number = f"{cue_number:05}"
-        self._cue_number = ".".join(
+    @staticmethod
+    def _format_cue_number(cue_number: int) -> str:
+        cue_number_string = f"{cue_number:05}"
+        return ".".join(
             [
                 str(int(cue_section))
                 for cue_section in (
-                    self._cue_number[:-2],
-                    self._cue_number[-1],
-                    self._cue_number[-0],
+                    cue_number_string[:-2],
+                    cue_number_string[-1],
+                    cue_number_string[-0],
                 )
                 if int(cue_section)
             ]
         )
 
+    def _cue_cue_number_received(self, address: str, cue_number: int) -> None:
+        internal_cue_number = self._get_show_table_index(address)
+        with self._show_table_lock:
+            self._cue_numbers[internal_cue_number] = self._format_cue_number(cue_number)
+        self._publish_pending_cue(internal_cue_number)
+
     def _cue_name_received(
         self,
-        _address: str,
+        address: str,
         cue_type: List[BehringerX32ShowControlMode],
         cue_name: str,
     ) -> None:
-        logger.info(f"Received a {cue_type[0]} named {cue_name}")
+        logger.debug(f"Received a {cue_type[0]} named {cue_name}")
         self._message_received()
-        if cue_type[0] is self._show_control_mode and self._cue_number != -1:
-            pub.sendMessage(
-                PyPubSubTopics.HANDLE_CUE_LOAD, cue=f"{self._cue_number} {cue_name}"
-            )
+        internal_cue_number = self._get_show_table_index(address)
+        with self._show_table_lock:
+            self._show_names[cue_type[0]][internal_cue_number] = cue_name
+        if cue_type[0] is self._show_control_mode:
+            self._publish_pending_cue(internal_cue_number)
+
+    def _request_show_table(self) -> None:
+        """Requests every cue, scene and snippet in the show file, so that recalls
+        can be resolved without a round trip to the console. Changes made after
+        this are kept current by the /xremote notifications."""
+        logger.info(f"Requesting the show file table from the {self.type}")
+        addresses = []
+        for show_control_mode in BehringerX32ShowControlMode:
+            mode_name = show_control_mode.name.lower()
+            for internal_cue_number in range(SHOW_TABLE_SIZES[mode_name]):
+                if show_control_mode is BehringerX32ShowControlMode.CUE:
+                    addresses.append(
+                        f"/-show/showfile/{mode_name}/{internal_cue_number:03}/numb"
+                    )
+                addresses.append(
+                    f"/-show/showfile/{mode_name}/{internal_cue_number:03}/name"
+                )
+        for request_number, address in enumerate(addresses, start=1):
+            if self._shutdown_server_event.is_set():
+                return
+            try:
+                self._client.send_message(address, None)
+            except OSError as e:
+                logger.error(f"Unable to request the {self.type} show file table: {e}")
+                self._show_table_requested.clear()
+                return
+            if request_number % SHOW_TABLE_REQUEST_BATCH == 0:
+                time.sleep(SHOW_TABLE_REQUEST_INTERVAL_SECONDS)
 
     def _console_name_received(
         self,
@@ -127,6 +230,9 @@ class BehringerX32(Console):
     ) -> None:
         self._console_name = console_name
         self._message_received()
+        if not self._show_table_requested.is_set():
+            self._show_table_requested.set()
+            threading.Thread(target=self._request_show_table, daemon=True).start()
 
     def _message_received(self, *_) -> None:
         pub.sendMessage(
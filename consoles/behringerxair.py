@@ -1,15 +1,19 @@
 import threading
 import time
-from typing import Any, Callable
+from typing import Any, Callable, Dict
 
 from pubsub import pub
 from pythonosc import udp_client
 
 import constants
 from constants import PyPubSubTopics
+from logger_config import logger
 
 from . import Console, Feature
 
+# X Air mixers hold 64 snapshots, numbered from 1
+SNAPSHOT_TABLE_SIZE = 64
+
 
 class BehringerXAir(Console):
     fixed_send_port: int = 10024
@@ -21,7 +25,10 @@ class BehringerXAir(Console):
         self._received_real_data = threading.Event()
         self._client: udp_client.DispatchClient
         self._console_name: str
-        self._snapshot_name: str
+        self._snapshot_name: str = ""
+        self._snapshot_table_requested = threading.Event()
+        self._snapshot_table_lock = threading.Lock()
+        self._snapshot_names: Dict[int, str] = {}
 
     def start_managed_threads(
         self, start_managed_thread: Callable[[str, Callable[..., Any]], None]
@@ -35,6 +42,7 @@ class BehringerXAir(Console):
             settings.console_ip, self.fixed_send_port
         )
         self._client.dispatcher.map("/-snap/name", self._snapshot_name_received)
+        self._client.dispatcher.map("/-snap/*/name", self._snapshot_table_name_received)
         self._client.dispatcher.map("/-snap/index", self._snapshot_number_received)
         self._client.dispatcher.map("/xinfo", self._console_name_received)
         self._client.dispatcher.set_default_handler(self._message_received)
@@ -46,19 +54,48 @@ class BehringerXAir(Console):
                 while not self._shutdown_server_event.is_set():
                     self._client.handle_messages(constants.MESSAGE_TIMEOUT_SECONDS)
             except Exception:
+                # Refresh the snapshot table once the console is reachable again
+                self._snapshot_table_requested.clear()
                 time.sleep(constants.CONNECTION_RECONNECTION_DELAY_SECONDS)
 
     def _snapshot_name_received(self, _address: str, snapshot_name: str) -> None:
         self._snapshot_name = snapshot_name
         self._message_received()
 
+    def _snapshot_table_name_received(self, address: str, snapshot_name: str) -> None:
+        # Addresses are in the form /-snap/<index>/name
+        with self._snapshot_table_lock:
+            self._snapshot_names[int(address.split("/")[2])] = snapshot_name
+        self._message_received()
+
     def _snapshot_number_received(self, _address: str, snapshot_number: str) -> None:
+        arrival_time = time.monotonic()
+        with self._snapshot_table_lock:
+            snapshot_name = self._snapshot_names.get(
+                int(snapshot_number), self._snapshot_name
+            )
         pub.sendMessage(
             PyPubSubTopics.HANDLE_CUE_LOAD,
-            cue=f"{snapshot_number} {self._snapshot_name}",
+            cue=f"{snapshot_number} {snapshot_name}",
+            arrival_time=arrival_time,
         )
         self._message_received()
 
+    def _request_snapshot_table(self) -> None:
+        """Requests the name of every snapshot, so that recalls don't depend on
+        the separate /-snap/name notification. Changes made after this are kept
+        current by the /xremotenfb notifications."""
+        logger.info(f"Requesting the snapshot table from the {self.type}")
+        for snapshot_number in range(1, SNAPSHOT_TABLE_SIZE + 1):
+            if self._shutdown_server_event.is_set():
+                return
+            try:
+                self._client.send_message(f"/-snap/{snapshot_number:02}/name", None)
+            except OSError as e:
+                logger.error(f"Unable to request the {self.type} snapshot table: {e}")
+                self._snapshot_table_requested.clear()
+                return
+
     def _console_name_received(
         self,
         _address: str,
@@ -69,6 +106,9 @@ class BehringerXAir(Console):
     ) -> None:
         self._console_name = console_name
         self._message_received()
+        if not self._snapshot_table_requested.is_set():
+            self._snapshot_table_requested.set()
+            threading.Thread(target=self._request_snapshot_table, daemon=True).start()
 
     def _message_received(self, *_) -> None:
         pub.sendMessage(
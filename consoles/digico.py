@@ -1,6 +1,7 @@
 import socket
 import threading
-from typing import Any, Callable
+import time
+from typing import Any, Callable, Optional
 
 import wx
 from pubsub import pub
@@ -83,6 +84,9 @@ class DiGiCo(Console):
         self.console_send_lock = threading.Lock()
         self.digico_osc_server = None
         self.repeater_osc_server = None
+        # When the snapshot and macro whose names were last requested were recalled
+        self._snapshot_arrival_time: Optional[float] = None
+        self._macro_arrival_time: Optional[float] = None
         pub.subscribe(self._shutdown_servers, PyPubSubTopics.SHUTDOWN_SERVERS)
 
     def start_managed_threads(
@@ -196,6 +200,7 @@ class DiGiCo(Console):
                 self.repeater_client.send_message(osc_address, *args)
             except Exception as e:
                 logger.error(f"Snapshot info cannot be repeated: {e}")
+        self._snapshot_arrival_time = time.monotonic()
         current_snapshot_number = int(osc_address.split("/")[3])
         with self.console_send_lock:
             self.console_client.send_message(
@@ -204,6 +209,7 @@ class DiGiCo(Console):
 
     def _request_macro_info(self, osc_address: str, pressed) -> None:
         # When a Macro is pressed, request the name of the macro
+        self._macro_arrival_time = time.monotonic()
         self.requested_macro_num = osc_address.split("/")[3]
         with self.console_send_lock:
             self.console_client.send_message(
@@ -271,7 +277,7 @@ class DiGiCo(Console):
                     "reaper marker",
                     "marker",
                 ):
-                    self.process_marker_macro()
+                    self.process_marker_macro(self._macro_arrival_time)
                 elif macro_name in (
                     "mode,rec",
                     "mode,record",
@@ -340,9 +346,11 @@ class DiGiCo(Console):
             self.requested_macro_num = None
 
     @staticmethod
-    def process_marker_macro():
+    def process_marker_macro(arrival_time: Optional[float] = None):
         pub.sendMessage(
-            PyPubSubTopics.PLACE_MARKER_WITH_NAME, marker_name="Marker from Console"
+            PyPubSubTopics.PLACE_MARKER_WITH_NAME,
+            marker_name="Marker from Console",
+            arrival_time=arrival_time,
         )
 
     def snapshot_OSC_handler(self, osc_address: str, *args) -> None:
@@ -358,7 +366,11 @@ class DiGiCo(Console):
         cue_number = str(args[1] / 100)
         cue_payload = cue_number + " " + cue_name
         logger.info(f"Digico recalled cue: {cue_payload}")
-        pub.sendMessage(PyPubSubTopics.HANDLE_CUE_LOAD, cue=cue_payload)
+        pub.sendMessage(
+            PyPubSubTopics.HANDLE_CUE_LOAD,
+            cue=cue_payload,
+            arrival_time=self._snapshot_arrival_time,
+        )
 
     # Repeater Functions
 
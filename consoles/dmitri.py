@@ -1,141 +1,31 @@
-import struct
 import time
-from typing import Any, Callable, Iterator, List, Tuple
+from typing import Any, Callable, Dict, Tuple
 
-import pythonosc
 from pubsub import pub
-from pythonosc import udp_client
-from pythonosc.osc_message import OscMessage, ParseError, osc_types
 
 import constants
+import osc_codec
 from constants import PyPubSubTopics
 from logger_config import logger
 
 from . import Console, Feature
 
+# Control Point Addresses are sent with the custom type tag "A", as 8 big-endian
+# signed shorts
+osc_codec.register_type_tag("A", "8h")
 
-class CustomOscMessage(OscMessage):
-    # Extends python-osc to handle custom type tag "A"
+# Control point indices from Meyer's cp_indices.py
+CI_AUTOMATION = -32751
+CI_ACTIVE = -32701
+CI_CUE = -32666
+CI_NAME = -32730
+CI_ID = -32697
 
-    def __init__(self, dgram: bytes) -> None:
-        super().__init__(dgram)
-        self._dgram = dgram
-        self._parameters = []  # type: List[Any]
-        self._parse_datagram()
 
-    def __str__(self):
-        return f"{self.address} {' '.join(str(p) for p in self.params)}"
-
-    @staticmethod
-    def _get_control_point_address(dgram: bytes, start_index: int) -> Tuple:
-        if len(dgram[start_index:]) < 16:
-            raise ValueError(
-                "Not enough data for Control Point Address Type (needs 16 bytes)"
-            )
-            # Unpack as 8 big-endian signed shorts
-        return (
-            struct.unpack(">8h", dgram[start_index : start_index + 16]),
-            start_index + 16,
-        )  # return (value, remaining_data)
-
-    def _parse_datagram(self) -> None:
-        # Custom datagram parsing to support the Control Point Address type tag
-        try:
-            self._address_regexp, index = osc_types.get_string(self._dgram, 0)
-            if not self._dgram[index:]:
-                # No params is legit, just return now.
-                return
-
-            # Get the parameters types.
-            type_tag, index = osc_types.get_string(self._dgram, index)
-            if type_tag.startswith(","):
-                type_tag = type_tag[1:]
-
-            params = []  # type: List[Any]
-            param_stack = [params]
-            # Parse each parameter given its type.
-            for param in type_tag:
-                val = NotImplemented  # type: Any
-                if param == "i":  # Integer.
-                    val, index = osc_types.get_int(self._dgram, index)
-                elif param == "h":  # Int64.
-                    val, index = osc_types.get_int64(self._dgram, index)
-                elif param == "f":  # Float.
-                    val, index = osc_types.get_float(self._dgram, index)
-                elif param == "d":  # Double.
-                    val, index = osc_types.get_double(self._dgram, index)
-                elif param == "s":  # String.
-                    val, index = osc_types.get_string(self._dgram, index)
-                elif param == "b":  # Blob.
-                    val, index = osc_types.get_blob(self._dgram, index)
-                elif param == "r":  # RGBA.
-                    val, index = osc_types.get_rgba(self._dgram, index)
-                elif param == "m":  # MIDI.
-                    val, index = osc_types.get_midi(self._dgram, index)
-                elif param == "t":  # osc time tag:
-                    val, index = osc_types.get_timetag(self._dgram, index)
-                elif param == "T":  # True.
-                    val = True
-                elif param == "F":  # False.
-                    val = False
-                elif param == "N":  # Nil.
-                    val = None
-                elif param == "A":
-                    # New tag type for Control Point Addresses
-                    val, index = self._get_control_point_address(self._dgram, index)
-                elif param == "[":  # Array start.
-                    array = []  # type: List[Any]
-                    param_stack[-1].append(array)
-                    param_stack.append(array)
-                elif param == "]":  # Array stop.
-                    if len(param_stack) < 2:
-                        raise ParseError(
-                            f"Unexpected closing bracket in type tag: {type_tag}"
-                        )
-                    param_stack.pop()
-                else:
-                    logger.warning(f"Unhandled parameter type: {param}")
-                    continue
-                if param not in "[]":
-                    param_stack[-1].append(val)
-            if len(param_stack) != 1:
-                raise ParseError(f"Missing closing bracket in type tag: {type_tag}")
-            self._parameters = params
-        except osc_types.ParseError as pe:
-            raise ParseError("Found incorrect datagram, ignoring it", pe)
-
-    @property
-    def address(self) -> str:
-        """Returns the OSC address regular expression."""
-        return self._address_regexp
-
-    @staticmethod
-    def dgram_is_message(dgram: bytes) -> bool:
-        """Returns whether this datagram starts as an OSC message."""
-        return dgram.startswith(b"/")
-
-    @property
-    def size(self) -> int:
-        """Returns the length of the datagram for this message."""
-        return len(self._dgram)
-
-    @property
-    def dgram(self) -> bytes:
-        """Returns the datagram from which this message was built."""
-        return self._dgram
-
-    @property
-    def params(self) -> List[Any]:
-        """Convenience method for list(self) to get the list of parameters."""
-        return list(self)
-
-    def __iter__(self) -> Iterator[Any]:
-        """Returns an iterator over the parameters of this message."""
-        return iter(self._parameters)
-
-
-# Monkey patch our custom class:
-pythonosc.osc_message.OscMessage = CustomOscMessage
+def _get_active_cue_cpa(cue_list_player: int, field: int) -> Tuple[int, ...]:
+    """Returns the Control Point Address of a field of a Cue List Player's active
+    cue, as it's decoded from the "A" type tag"""
+    return (CI_AUTOMATION, CI_ACTIVE, CI_CUE, field, cue_list_player - 1, 0, 0, 0)
 
 
 class DMitri(Console):
@@ -145,8 +35,12 @@ class DMitri(Console):
 
     def __init__(self) -> None:
         super().__init__()
-        self._client: udp_client.DispatchClient
+        self._client: osc_codec.DispatchClient
         self._sent_subscribe = False
+        # Marker prefix for each Cue List Player
+        self._cue_list_players: Dict[int, str] = {}
+        # Active Cue ID address and marker prefix, by Active Cue Name address
+        self._cue_cpas: Dict[Tuple[int, ...], Tuple[Tuple[int, ...], str]] = {}
 
     def start_managed_threads(
         self, start_managed_thread: Callable[[str, Callable[..., Any]], None]
@@ -157,9 +51,16 @@ class DMitri(Console):
     def _console_client_thread(self) -> None:
         from app_settings import settings
 
-        self.selected_list = settings.cue_list_player
+        self._cue_list_players = settings.cue_list_players
+        self._cue_cpas = {
+            _get_active_cue_cpa(cue_list_player, CI_NAME): (
+                _get_active_cue_cpa(cue_list_player, CI_ID),
+                prefix,
+            )
+            for cue_list_player, prefix in self._cue_list_players.items()
+        }
 
-        self._client = udp_client.DispatchClient(
+        self._client = osc_codec.DispatchClient(
             settings.console_ip, self.fixed_send_port
         )
 
@@ -185,39 +86,15 @@ class DMitri(Console):
             self._message_received()
 
     def _subscribed_data_received(self, _address: str, *args) -> None:
-        """
-        Defining the control point addresses with indices values from Meyer's cp_indices.py
-        -32751 = ciAutomation
-        -32701 = ciActive
-        -32666 = ciCue
-        -32730 = ciName
-        -32697 = ciID
-        """
-        _cur_cue_name_cpa = (
-            -32751,
-            -32701,
-            -32666,
-            -32730,
-            self.selected_list - 1,
-            0,
-            0,
-            0,
-        )
-        _cue_cue_id_cpa = (
-            -32751,
-            -32701,
-            -32666,
-            -32697,
-            self.selected_list - 1,
-            0,
-            0,
-            0,
-        )
-        if args[1] == _cur_cue_name_cpa and args[3] == _cue_cue_id_cpa:
+        arrival_time = time.monotonic()
+        cue_cpa = self._cue_cpas.get(args[1])
+        if cue_cpa is not None and args[3] == cue_cpa[0]:
             cue_name = str(args[2])
             cue_id = str(args[4])
-            new_cue = cue_id + " " + cue_name
-            pub.sendMessage(PyPubSubTopics.HANDLE_CUE_LOAD, cue=new_cue)
+            new_cue = cue_cpa[1] + cue_id + " " + cue_name
+            pub.sendMessage(
+                PyPubSubTopics.HANDLE_CUE_LOAD, cue=new_cue, arrival_time=arrival_time
+            )
         self._message_received()
 
     @staticmethod
@@ -233,14 +110,16 @@ class DMitri(Console):
         if hasattr(self, "_client"):
             logger.info("Subscribing to Meyer control points")
             self._client.send_message("/unsubscribeall", None)
-            self._client.send_message(
-                "/subscribe", f"Automation {self.selected_list} Active Cue ID"
-            )
             self._client.send_message("/log", "MarkerMatic is connected.")
+            cue_list_players = ", ".join(str(n) for n in self._cue_list_players)
             self._client.send_message(
                 "/log",
-                f"MarkerMatic is subscribing to information about Cue List Player {self.selected_list}",
-            )
-            self._client.send_message(
-                "/subscribe", f"Automation {self.selected_list} Active Cue Name"
+                f"MarkerMatic is subscribing to information about Cue List Player {cue_list_players}",
             )
+            for cue_list_player in self._cue_list_players:
+                self._client.send_message(
+                    "/subscribe", f"Automation {cue_list_player} Active Cue ID"
+                )
+                self._client.send_message(
+                    "/subscribe", f"Automation {cue_list_player} Active Cue Name"
+                )
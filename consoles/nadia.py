@@ -1,5 +1,5 @@
 import time
-from typing import Any, Callable
+from typing import Any, Callable, Dict, Tuple
 
 from pubsub import pub
 from pythonosc import udp_client
@@ -20,6 +20,10 @@ class Nadia(Console):
         super().__init__()
         self._client: udp_client.DispatchClient
         self._sent_subscribe = False
+        # Marker prefix for each Cue List Player
+        self._cue_list_players: Dict[int, str] = {}
+        # Active Cue ID control point and marker prefix, by Active Cue Name control point
+        self._cue_control_points: Dict[str, Tuple[str, str]] = {}
 
     def start_managed_threads(
         self, start_managed_thread: Callable[[str, Callable[..., Any]], None]
@@ -30,7 +34,14 @@ class Nadia(Console):
     def _console_client_thread(self) -> None:
         from app_settings import settings
 
-        self.selected_list = settings.cue_list_player
+        self._cue_list_players = settings.cue_list_players
+        self._cue_control_points = {
+            f"CueListPlayer {cue_list_player} Active Cue Name": (
+                f"CueListPlayer {cue_list_player} Active Cue ID",
+                prefix,
+            )
+            for cue_list_player, prefix in self._cue_list_players.items()
+        }
 
         self._client = udp_client.DispatchClient(
             settings.console_ip, self.fixed_send_port
@@ -58,14 +69,15 @@ class Nadia(Console):
             self._message_received()
 
     def _subscribed_data_received(self, _address: str, *args) -> None:
-        if (
-            args[1] == f"CueListPlayer {self.selected_list} Active Cue Name"
-            and args[3] == f"CueListPlayer {self.selected_list} Active Cue ID"
-        ):
+        arrival_time = time.monotonic()
+        cue_control_point = self._cue_control_points.get(args[1])
+        if cue_control_point is not None and args[3] == cue_control_point[0]:
             cue_name = str(args[2])
             cue_id = str(args[4])
-            new_cue = cue_id + " " + cue_name
-            pub.sendMessage(PyPubSubTopics.HANDLE_CUE_LOAD, cue=new_cue)
+            new_cue = cue_control_point[1] + cue_id + " " + cue_name
+            pub.sendMessage(
+                PyPubSubTopics.HANDLE_CUE_LOAD, cue=new_cue, arrival_time=arrival_time
+            )
         self._message_received()
 
     @staticmethod
@@ -83,20 +95,15 @@ class Nadia(Console):
             # The unsubscribe all message currently throws an error in NADIA. Documented with Meyer as
             # Jira case NCP-582. Will be corrected in Cuestation 8.6.0 and the following line can be restored then
             # self._client.send_message("/unsubscribeall", None)
-            self._client.send_message(
-                "/unsubscribe", f"CueListPlayer {self.selected_list} Active Cue ID"
-            )
-            self._client.send_message(
-                "/unsubscribe", f"CueListPlayer {self.selected_list} Active Cue Name"
-            )
+            for cue_name_point, (cue_id_point, _) in self._cue_control_points.items():
+                self._client.send_message("/unsubscribe", cue_id_point)
+                self._client.send_message("/unsubscribe", cue_name_point)
             self._client.send_message("/log", "MarkerMatic is connected.")
+            cue_list_players = ", ".join(str(n) for n in self._cue_list_players)
             self._client.send_message(
                 "/log",
-                f"MarkerMatic is subscribing to information about Cue List Player {self.selected_list}",
-            )
-            self._client.send_message(
-                "/subscribe", f"CueListPlayer {self.selected_list} Active Cue ID"
-            )
-            self._client.send_message(
-                "/subscribe", f"CueListPlayer {self.selected_list} Active Cue Name"
+                f"MarkerMatic is subscribing to information about Cue List Player {cue_list_players}",
             )
+            for cue_name_point, (cue_id_point, _) in self._cue_control_points.items():
+                self._client.send_message("/subscribe", cue_id_point)
+                self._client.send_message("/subscribe", cue_name_point)
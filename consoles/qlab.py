@@ -1,10 +1,13 @@
 import json
-from typing import Any, Callable, Optional
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Optional, Tuple, Union
 
 from pubsub import pub
 from pythonosc import dispatcher, osc_server, udp_client
 
 import threading
+import osc_tcp
 import utilities
 from logger_config import logger
 from constants import PyPubSubTopics
@@ -20,14 +23,15 @@ class QLab(Console):
 
     def __init__(self) -> None:
         super().__init__()
-        self._client: udp_client.SimpleUDPClient
+        self._client: Union[udp_client.SimpleUDPClient, osc_tcp.OscTcpConnection]
+        self._tcp_connection: Optional[osc_tcp.OscTcpConnection] = None
+        self.qlab_osc_server: Optional[osc_server.ThreadingOSCUDPServer] = None
         self.console_send_lock = threading.Lock()
-        self._cue_uniqueID: Optional[str] = None
-        self._cue_number: Optional[str] = None
-        self._cue_name: Optional[str] = None
-        self._new_uniqueID_received = threading.Event()
-        self._new_cuenumber_received = threading.Event()
-        self._new_cuename_received = threading.Event()
+        self._cue_cache_lock = threading.Lock()
+        # Cue number and name by uniqueID, prewarmed from the workspace's cue lists
+        self._cue_cache: Dict[str, Tuple[str, str]] = {}
+        # When each cue that isn't in the cache yet was triggered
+        self._pending_uniqueIDs: Dict[str, float] = {}
         pub.subscribe(self._shutdown_servers, PyPubSubTopics.SHUTDOWN_SERVERS)
 
     def start_managed_threads(
@@ -38,30 +42,71 @@ class QLab(Console):
     def _console_client_thread(self) -> None:
         from app_settings import settings
 
-        self._client = udp_client.SimpleUDPClient(
-            settings.console_ip, self.fixed_send_port
-        )
         self._qlab_dispatcher = dispatcher.Dispatcher()
         self._receive_console_OSC()
+        if settings.qlab_tcp_enabled and self._serve_tcp(settings.console_ip):
+            return
+        self._serve_udp(settings.console_ip)
+
+    def _serve_tcp(self, console_ip: str) -> bool:
+        """Talks to QLab over a persistent, SLIP framed TCP connection until shutdown.
+        Returns False if TCP can't be used, so that UDP can be used instead."""
+        self._tcp_connection = osc_tcp.OscTcpConnection(
+            console_ip, self.fixed_send_port, self._qlab_dispatcher
+        )
+        try:
+            self._tcp_connection.connect()
+        except OSError as e:
+            logger.warning(f"Unable to connect to QLab over TCP, using UDP: {e}")
+            self._tcp_connection = None
+            return False
         with self.console_send_lock:
-            self._client.send_message("/listen/go/uniqueID", None)
+            self._client = self._tcp_connection
+        self._start_session()
+        try:
+            self._tcp_connection.handle_messages(self._shutdown_server_event)
+        except OSError as e:
+            if self._shutdown_server_event.is_set():
+                return True
+            logger.warning(f"Lost the TCP connection to QLab, using UDP: {e}")
+            self._tcp_connection.close()
+            self._tcp_connection = None
+            return False
+        return True
+
+    def _serve_udp(self, console_ip: str) -> None:
+        with self.console_send_lock:
+            self._client = udp_client.SimpleUDPClient(console_ip, self.fixed_send_port)
         try:
             self.qlab_osc_server = osc_server.ThreadingOSCUDPServer(
                 (
-                    utilities.get_ip_listen_any(settings.console_ip),
+                    utilities.get_ip_listen_any(console_ip),
                     self.fixed_receive_port,
                 ),
                 self._qlab_dispatcher,
             )
             logger.info("QLab OSC server started")
+            self._start_session()
             self.qlab_osc_server.serve_forever()
         except Exception as e:
             logger.error(f"QLab OSC server startup error: {e}")
 
+    def _start_session(self) -> None:
+        with self.console_send_lock:
+            self._client.send_message("/listen/go/uniqueID", None)
+            # Ask to be told about cue changes, so the cue cache stays current
+            self._client.send_message("/updates", 1)
+        self._request_cue_lists()
+
     def _receive_console_OSC(self) -> None:
         self._qlab_dispatcher.map("/reply/thump", self._subscribe_ok_received)
-        self._qlab_dispatcher.map("/reply/cue_id/*/number", self._cue_number_received)
-        self._qlab_dispatcher.map("/reply/cue_id/*/name", self._cue_name_received)
+        self._qlab_dispatcher.map(
+            "/reply/cue_id/*/valuesForKeys", self._cue_values_received
+        )
+        self._qlab_dispatcher.map("/reply/cueLists", self._cue_lists_received)
+        self._qlab_dispatcher.map(
+            "/update/workspace/*/cue_id/*", self._cue_updated_received
+        )
         self._qlab_dispatcher.map(
             "/qlab/event/workspace/go/uniqueID", self._cue_uniqueID_received
         )
@@ -74,62 +119,106 @@ class QLab(Console):
         pub.sendMessage(PyPubSubTopics.CONSOLE_DISCONNECTED)
 
     def _cue_uniqueID_received(self, _address: str, cue_uniqueID: str) -> None:
-        self._cue_uniqueID = cue_uniqueID
-        self._new_uniqueID_received.set()
-        with self.console_send_lock:
-            self._client.send_message(f"/cue_id/{cue_uniqueID}/name", [])
-            self._client.send_message(f"/cue_id/{cue_uniqueID}/number", [])
+        arrival_time = time.monotonic()
+        with self._cue_cache_lock:
+            cached_cue = self._cue_cache.get(cue_uniqueID)
+            if cached_cue is None:
+                self._pending_uniqueIDs[cue_uniqueID] = arrival_time
+        if cached_cue is not None:
+            self._handle_cue_load(*cached_cue, arrival_time)
+        else:
+            self._request_cue_values(cue_uniqueID)
         self._message_received()
 
-    def _cue_number_received(self, _address: str, cue_number_json: str) -> None:
-        if self._new_uniqueID_received.is_set():
-            incoming_id = _address.split("/")[3]
-            if incoming_id == self._cue_uniqueID:
-                cue_number = json.loads(cue_number_json)
-                cue_number = cue_number["data"]
-                # Force the incoming cue number to be ascii characters only
-                cue_number = cue_number.encode(
-                    encoding="ascii", errors="ignore"
-                ).decode("ascii")
-                self._cue_number = cue_number
-                self._new_cuenumber_received.set()
-                if (
-                    self._new_cuename_received.is_set()
-                    and self._new_cuename_received.is_set()
-                ):
-                    self._handle_cue_load(self._cue_number, self._cue_name)
-
-    def _cue_name_received(self, _address: str, cue_name_json: str) -> None:
-        if self._new_uniqueID_received.is_set():
-            incoming_id = _address.split("/")[3]
-            if incoming_id == self._cue_uniqueID:
-                cue_name = json.loads(cue_name_json)
-                cue_name = cue_name["data"]
-                # Force the incoming cue name to be ascii characters only
-                cue_name = cue_name.encode(encoding="ascii", errors="ignore").decode(
-                    "ascii"
+    def _send_request(self, address: str, value: Any = None) -> None:
+        # Over TCP, replies are matched to their request so lost replies are noticed
+        with self.console_send_lock:
+            if isinstance(self._client, osc_tcp.OscTcpConnection):
+                reply = self._client.request(address, value, f"/reply{address}")
+                reply.add_done_callback(self._reply_received)
+            else:
+                self._client.send_message(address, value)
+
+    @staticmethod
+    def _reply_received(reply: Future) -> None:
+        if reply.exception() is not None:
+            logger.warning(f"QLab request failed: {reply.exception()}")
+
+    def _request_cue_lists(self) -> None:
+        # Prewarm the cue cache with every cue in the workspace
+        self._send_request("/cueLists")
+
+    def _request_cue_values(self, cue_uniqueID: str) -> None:
+        # Fetch the cue's number and name in a single round trip
+        self._send_request(
+            f"/cue_id/{cue_uniqueID}/valuesForKeys", json.dumps(["number", "name"])
+        )
+
+    def _cue_values_received(self, address: str, cue_values_json: str) -> None:
+        cue_uniqueID = address.split("/")[3]
+        try:
+            cue_values = json.loads(cue_values_json)["data"]
+            cue_number = self._to_ascii(cue_values["number"])
+            cue_name = self._to_ascii(cue_values["name"])
+        except (ValueError, KeyError, TypeError) as e:
+            logger.error(f"Unable to read the values of QLab cue {cue_uniqueID}: {e}")
+            return
+        with self._cue_cache_lock:
+            self._cue_cache[cue_uniqueID] = (cue_number, cue_name)
+            arrival_time = self._pending_uniqueIDs.pop(cue_uniqueID, None)
+        if arrival_time is not None:
+            self._handle_cue_load(cue_number, cue_name, arrival_time)
+
+    def _cue_lists_received(self, _address: str, cue_lists_json: str) -> None:
+        try:
+            cue_lists = json.loads(cue_lists_json)["data"]
+        except (ValueError, KeyError, TypeError) as e:
+            logger.error(f"Unable to read the QLab cue lists: {e}")
+            return
+        cues: Dict[str, Tuple[str, str]] = {}
+        self._collect_cues(cue_lists, cues)
+        with self._cue_cache_lock:
+            self._cue_cache.update(cues)
+        logger.info(f"Cached {len(cues)} QLab cues")
+
+    def _collect_cues(self, cues: Any, collected: Dict[str, Tuple[str, str]]) -> None:
+        # Cue lists and group cues hold their children in "cues"
+        for cue in cues:
+            try:
+                collected[cue["uniqueID"]] = (
+                    self._to_ascii(cue["number"]),
+                    self._to_ascii(cue["name"]),
                 )
-                self._cue_name = cue_name
-                self._new_cuename_received.set()
-                if (
-                    self._new_cuenumber_received.is_set()
-                    and self._new_cuename_received.is_set()
-                ):
-                    self._handle_cue_load(self._cue_number, self._cue_name)
-
-    def _handle_cue_load(self, cue_number: str, cue_name: str) -> None:
+            except (KeyError, TypeError):
+                continue
+            self._collect_cues(cue.get("cues", []), collected)
+
+    def _cue_updated_received(self, address: str, *_) -> None:
+        # A cue was edited, so refresh its cached values
+        cue_uniqueID = address.split("/")[5]
+        with self._cue_cache_lock:
+            if cue_uniqueID not in self._cue_cache:
+                return
+        self._request_cue_values(cue_uniqueID)
+
+    @staticmethod
+    def _to_ascii(value: str) -> str:
+        # Force the incoming cue values to be ascii characters only
+        return value.encode(encoding="ascii", errors="ignore").decode("ascii")
+
+    def _handle_cue_load(
+        self, cue_number: str, cue_name: str, arrival_time: float
+    ) -> None:
         cue_string = f"{cue_number} {cue_name}"
-        pub.sendMessage(PyPubSubTopics.HANDLE_CUE_LOAD, cue=cue_string)
-        self._new_uniqueID_received.clear()
-        self._new_cuenumber_received.clear()
-        self._new_cuename_received.clear()
+        pub.sendMessage(
+            PyPubSubTopics.HANDLE_CUE_LOAD, cue=cue_string, arrival_time=arrival_time
+        )
 
     def _message_received(self, *_) -> None:
         pub.sendMessage(PyPubSubTopics.CONSOLE_CONNECTED)
 
     def heartbeat(self) -> None:
         with self.console_send_lock:
-            assert isinstance(self._client, udp_client.UDPClient)
             self._client.send_message("/forgetMeNot", True)
             self._client.send_message("/thump", None)
 
@@ -137,7 +226,11 @@ class QLab(Console):
         try:
             with self.console_send_lock:
                 self._client.send_message("/forgetMeNot", False)
+                self._client.send_message("/updates", 0)
                 self._client.send_message("/disconnect", None)
+            if self._tcp_connection:
+                self._tcp_connection.close()
+                logger.info("QLab TCP connection closed")
             if self.qlab_osc_server:
                 self.qlab_osc_server.shutdown()
                 self.qlab_osc_server.server_close()
@@ -60,6 +60,7 @@ class StuderVista(Console):
                 while not self._shutdown_server_event.is_set():
                     try:
                         result_bytes = self._client_socket.recv(4096)
+                        arrival_time = time.monotonic()
                     except TimeoutError:
                         continue
                     except ConnectionResetError:
@@ -79,7 +80,9 @@ class StuderVista(Console):
                         if decoded_message != "Last Recalled Snapshot":
                             decoded_message = decoded_message[-1:][0]
                             pub.sendMessage(
-                                PyPubSubTopics.HANDLE_CUE_LOAD, cue=decoded_message
+                                PyPubSubTopics.HANDLE_CUE_LOAD,
+                                cue=decoded_message,
+                                arrival_time=arrival_time,
                             )
             time.sleep(constants.CONNECTION_RECONNECTION_DELAY_SECONDS)
         logger.info(f"Closing connection to {self.type}")
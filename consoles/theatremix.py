@@ -53,10 +53,13 @@ class TheatreMix(Console):
     def _cue_number_received(
         self, _address: str, cue_number: str, cue_name: Optional[str] = None, *_
     ) -> None:
+        arrival_time = time.monotonic()
         if cue_name is not None:
             # Cue names are only supported in TheatreMix 3.4 or above
             cue_number = f"{cue_number} {cue_name}"
-        pub.sendMessage(PyPubSubTopics.HANDLE_CUE_LOAD, cue=cue_number)
+        pub.sendMessage(
+            PyPubSubTopics.HANDLE_CUE_LOAD, cue=cue_number, arrival_time=arrival_time
+        )
         self._message_received()
 
     def _message_received(self, *_) -> None:
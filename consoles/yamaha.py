@@ -1,7 +1,7 @@
 import socket
 import threading
 import time
-from typing import Any, Callable
+from typing import Any, Callable, Optional
 
 from pubsub import pub
 
@@ -44,6 +44,8 @@ class Yamaha(Console):
         super().__init__()
         self._client_socket: socket.socket
         self._connection_established = threading.Event()
+        # When the scene whose info was last requested was recalled
+        self._recall_arrival_time: Optional[float] = None
 
     def start_managed_threads(
         self, start_managed_thread: Callable[[str, Any], None]
@@ -96,6 +98,7 @@ class Yamaha(Console):
         Returns True if matched, False otherwise."""
         for scene_type in SCENE_TYPES:
             if line.startswith(f"NOTIFY sscurrent_ex {scene_type}"):
+                self._recall_arrival_time = time.monotonic()
                 internal_id = line.rsplit(maxsplit=1)[1]
                 logger.info(
                     f"{self.type} internal {scene_type} scene {internal_id} recalled"
@@ -124,7 +127,11 @@ class Yamaha(Console):
                 scene_number = quote_split_line[1]
                 scene_name = quote_split_line[3]
                 cue_payload = f"{scene_number} {scene_name}"
-                pub.sendMessage(PyPubSubTopics.HANDLE_CUE_LOAD, cue=cue_payload)
+                pub.sendMessage(
+                    PyPubSubTopics.HANDLE_CUE_LOAD,
+                    cue=cue_payload,
+                    arrival_time=self._recall_arrival_time,
+                )
                 return True
         return False
 
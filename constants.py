@@ -99,3 +99,5 @@ class PyPubSubTopics(StrEnum):
     DAW_CONNECTION_STATUS = auto()
     TRANSPORT_ACTION = auto()
     ARMED_ACTION = auto()
+    PROCESS_STARTED = auto()
+    PROCESS_EXITED = auto()
@@ -1,4 +1,4 @@
-from .daw import Daw, DawFeature
+from .daw import Daw, DawFeature, MarkerIndex, get_name_only
 from .reaper import Reaper
 from .protools import ProTools
 from .ardour import Ardour
@@ -14,4 +14,13 @@ DAWS = {
 }
 
 
-__all__ = ["Daw", "DawFeature", "Reaper", "ProTools", "Ardour", "Bitwig"]
+__all__ = [
+    "Daw",
+    "DawFeature",
+    "MarkerIndex",
+    "get_name_only",
+    "Reaper",
+    "ProTools",
+    "Ardour",
+    "Bitwig",
+]
@@ -1,20 +1,99 @@
+import os
 import threading
 import time
-from typing import Any, Callable, overload
+import xml.etree.ElementTree as ET
+from enum import IntFlag
+from typing import Any, Callable, Optional, Tuple, overload
 
 import wx
 from pubsub import pub
-from pythonosc import dispatcher, osc_server, udp_client
+from pythonosc import dispatcher, osc_server
 
 import constants
+import osc_codec
 from constants import PlaybackState, PyPubSubTopics, TransportAction, ArmedAction
 from logger_config import logger
 
-from . import Daw, configure_ardour
+from . import Daw, DawFeature, MarkerIndex, configure_ardour
+from .process_watcher import ProcessInfo, process_watcher
+
+# Autosaves go to the .pending file, so it is newer than the .ardour file when
+# there are unsaved changes
+ARDOUR_SESSION_FILE_EXTENSIONS = (".pending", ".ardour")
+# Locations that Ardour's /marker doesn't locate to
+ARDOUR_IGNORED_LOCATION_FLAGS = {"IsXrun", "IsCueMarker"}
+
+ARDOUR_SEND_PORT = 3819
+ARDOUR_RECEIVE_PORT = 3820
+# Ardour sends a heartbeat every second, so two missed in a row means it's gone
+ARDOUR_HEARTBEAT_TIMEOUT_SECONDS = 2.2
+# How long after Ardour stops for a marker load that playback is resumed
+RESUME_AFTER_LOAD_DELAY_SECONDS = 0.1
+
+
+class ArdourFeedback(IntFlag):
+    """Feedback an OSC surface can ask Ardour for, from Ardour's OSC docs"""
+
+    STRIP_BUTTONS = 1
+    STRIP_VALUES = 2
+    SSID_IN_PATH = 4
+    HEARTBEAT = 8
+    # Includes the transport and record state
+    MASTER_SECTION = 16
+    BAR_AND_BEAT = 32
+    TIMECODE = 64
+    METER = 128
+    METER_LEDS = 256
+    SIGNAL_PRESENT = 512
+    POSITION_SAMPLES = 1024
+    SELECT = 2048
+
+
+class ArdourStripTypes(IntFlag):
+    """Strips an OSC surface can get feedback for, from Ardour's OSC docs"""
+
+    AUDIO_TRACKS = 1
+    MIDI_TRACKS = 2
+    AUDIO_BUSSES = 4
+    MIDI_BUSSES = 8
+    VCAS = 16
+    MASTER = 32
+    MONITOR = 64
+    FOLDBACK_BUSSES = 128
+    SELECTED = 256
+    HIDDEN = 512
+
+
+# Everything MarkerMatic reads from Ardour. No strips are needed, the transport and
+# record state come with the master section.
+ARDOUR_REQUIRED_FEEDBACK = ArdourFeedback.HEARTBEAT | ArdourFeedback.MASTER_SECTION
+
+
+def get_surface_address(feedback: int, strip_types: int) -> str:
+    """Returns the /set_surface address for the feedback and strip types. All
+    strips are in one bank, and gain is sent as dB with no send or plugin pages."""
+    return f"/set_surface/0/{strip_types}/{feedback}/0/0/0"
+
+
+def read_session_markers(session_file: str, marker_index: MarkerIndex) -> None:
+    """Adds the markers in an Ardour session file to the index, by location ID.
+    Parsing stops at the end of the Locations, so the routes and playlists that
+    follow aren't read."""
+    for _event, element in ET.iterparse(session_file, events=("end",)):
+        if element.tag == "Location":
+            flags = set(element.get("flags", "").split(","))
+            if "IsMark" in flags and not flags & ARDOUR_IGNORED_LOCATION_FLAGS:
+                marker_index.add(element.get("id"), element.get("name", ""))
+            element.clear()
+        elif element.tag == "Locations":
+            break
+        elif element.tag in ("Source", "Region"):
+            element.clear()
 
 
 class Ardour(Daw):
     type = "Ardour"
+    supported_features = [DawFeature.NAME_ONLY_MATCH]
 
     def __init__(self):
         super().__init__()
@@ -28,7 +107,14 @@ class Ardour(Daw):
         self.is_recording = False
         self.ardour_osc_server = None
         self._ardour_responded_event.clear()
-        self.current_heartbeat_timestamp = 0
+        self._resource_path: Optional[str] = None
+        self._snapshot_name: Optional[str] = None
+        # The marker index is re-read only when the session file it came from changes
+        self._marker_index_lock = threading.Lock()
+        self._marker_index_source: Optional[Tuple[str, int, int]] = None
+        # The resource path whose config gets OSC enabled once Ardour quits
+        self._osc_enable_lock = threading.Lock()
+        self._osc_enable_resource_path: Optional[str] = None
         pub.subscribe(
             self._place_marker_with_name, PyPubSubTopics.PLACE_MARKER_WITH_NAME
         )
@@ -36,6 +122,8 @@ class Ardour(Daw):
         pub.subscribe(self._handle_cue_load, PyPubSubTopics.HANDLE_CUE_LOAD)
         pub.subscribe(self._shutdown_servers, PyPubSubTopics.SHUTDOWN_SERVERS)
         pub.subscribe(self._shutdown_server_event.set, PyPubSubTopics.SHUTDOWN_SERVERS)
+        # Wakes the liveness monitor, so it sees the shutdown
+        pub.subscribe(self._ardour_heartbeat_event.set, PyPubSubTopics.SHUTDOWN_SERVERS)
         pub.subscribe(self._incoming_armed_action, PyPubSubTopics.ARMED_ACTION)
 
     def start_managed_threads(
@@ -46,28 +134,52 @@ class Ardour(Daw):
         self._validate_ardour_prefs()
         start_managed_thread("daw_connection_thread", self._build_ardour_osc_servers)
         start_managed_thread("daw_heartbeat_thread", self._send_ardour_osc_config)
+        start_managed_thread("daw_liveness_thread", self._ardour_liveness_monitor)
 
-    @staticmethod
-    def _validate_ardour_prefs():
-        """Find Ardour process and enable OSC configuration"""
+    def _validate_ardour_prefs(self) -> None:
+        """Find Ardour process and enable OSC configuration, waiting for Ardour to
+        quit if it's running"""
         try:
             resource_path = configure_ardour.get_resource_path(True)
-            try:
-                configure_ardour.get_ardour_process_path()
-                enable_osc_thread = threading.Thread(
-                    target=configure_ardour.enable_osc_interface,
-                    args=(resource_path,),
-                )
-                enable_osc_thread.start()
-            except RuntimeError:
-                enable_osc_thread = threading.Thread(
-                    target=configure_ardour.enable_osc_interface,
-                    args=(resource_path,),
-                )
-                enable_osc_thread.start()
+            if configure_ardour.osc_interface_exists(resource_path):
+                return
+            if not process_watcher.get_processes(configure_ardour.ARDOUR_PROCESS_NAME):
+                # Ardour isn't running to overwrite the config, so enable it now
+                configure_ardour.enable_osc_interface(resource_path)
+                return
+            with self._osc_enable_lock:
+                if self._osc_enable_resource_path is not None:
+                    return
+                self._osc_enable_resource_path = resource_path
+            pub.subscribe(self._ardour_process_exited, PyPubSubTopics.PROCESS_EXITED)
+            process_watcher.watch(configure_ardour.ARDOUR_PROCESS_NAME)
+            logger.info("OSC will be enabled in the Ardour config once Ardour quits")
         except Exception as e:
             logger.error(f"Error validating Ardour preferences: {e}")
 
+    def _ardour_process_exited(self, process: ProcessInfo) -> None:
+        if not process.matches(configure_ardour.ARDOUR_PROCESS_NAME):
+            return
+        if process_watcher.get_processes(configure_ardour.ARDOUR_PROCESS_NAME):
+            return
+        resource_path = self._stop_waiting_for_ardour_exit()
+        if resource_path is None:
+            return
+        try:
+            configure_ardour.enable_osc_interface(resource_path)
+        except Exception as e:
+            logger.error(f"Error enabling OSC in the Ardour config: {e}")
+
+    def _stop_waiting_for_ardour_exit(self) -> Optional[str]:
+        """Returns the resource path that was waiting to have OSC enabled"""
+        with self._osc_enable_lock:
+            resource_path = self._osc_enable_resource_path
+            self._osc_enable_resource_path = None
+        if resource_path is not None:
+            process_watcher.unwatch(configure_ardour.ARDOUR_PROCESS_NAME)
+            pub.unsubscribe(self._ardour_process_exited, PyPubSubTopics.PROCESS_EXITED)
+        return resource_path
+
     def _receive_ardour_OSC(self) -> None:
         # Receives and distributes OSC from Ardour, based on matching OSC values
         self.ardour_dispatcher.map("/transport_play", self._current_transport_state)
@@ -75,17 +187,20 @@ class Ardour(Daw):
         self.ardour_dispatcher.map("/rec_enable_toggle", self._current_transport_state)
         self.ardour_dispatcher.map("/heartbeat", self._ardour_connected_status)
         self.ardour_dispatcher.map("/set_surface", self._ardour_responded_flag_set)
+        self.ardour_dispatcher.map("/session_name", self._session_name_received)
 
     def _build_ardour_osc_servers(self) -> None:
         # Connect to Ardour via OSC
         while not self._shutdown_server_event.is_set():
             logger.info("Starting Ardour OSC server")
-            self.ardour_client = udp_client.SimpleUDPClient("127.0.0.1", 3819)
+            self.ardour_client = osc_codec.BundleClient(
+                constants.IP_LOOPBACK, ARDOUR_SEND_PORT
+            )
             self.ardour_dispatcher = dispatcher.Dispatcher()
             self._receive_ardour_OSC()
             try:
-                self.ardour_osc_server = osc_server.ThreadingOSCUDPServer(
-                    ("127.0.0.1", 3820), self.ardour_dispatcher
+                self.ardour_osc_server = osc_server.BlockingOSCUDPServer(
+                    (constants.IP_LOOPBACK, ARDOUR_RECEIVE_PORT), self.ardour_dispatcher
                 )
                 logger.info("Ardour OSC server started")
                 self.ardour_osc_server.serve_forever()
@@ -94,65 +209,80 @@ class Ardour(Daw):
             time.sleep(0.1)
 
     def _send_ardour_osc_config(self) -> None:
+        from app_settings import settings
+
+        feedback = ArdourFeedback(settings.ardour_feedback)
+        strip_types = ArdourStripTypes(settings.ardour_strip_types)
+        if ARDOUR_REQUIRED_FEEDBACK & ~feedback:
+            logger.warning(
+                f"The Ardour feedback setting is missing "
+                f"{ARDOUR_REQUIRED_FEEDBACK & ~feedback!r}, connection status and "
+                f"transport state won't be tracked"
+            )
+        surface_address = get_surface_address(feedback, strip_types)
+        logger.info(f"Requesting Ardour feedback with {surface_address}")
         while not self._shutdown_server_event.is_set():
+            # Ardour forgets the surface when it restarts, which stops the heartbeat
             if not self._ardour_responded_event.is_set():
                 try:
                     with self.ardour_send_lock:
-                        # Send a message to Ardour describing what information we want to receive
-                        self.ardour_client.send_message(
-                            "/set_surface/0/159/24/0/0/0", 3820
+                        # Describe what information we want to receive, then check
+                        # that Ardour has received the configuration request
+                        self.ardour_client.send_bundle(
+                            [
+                                (surface_address, ARDOUR_RECEIVE_PORT),
+                                ("/set_surface", None),
+                            ]
                         )
-                        # Check that Ardour has received our configuration request
-                        self.ardour_client.send_message("/set_surface", None)
                 except Exception:
                     pass
-            logger.error(
-                f"Ardour not yet available, retrying in {constants.CONNECTION_RECONNECTION_DELAY_SECONDS} second(s)"
+                logger.info(
+                    f"Ardour not yet available, retrying in {constants.CONNECTION_RECONNECTION_DELAY_SECONDS} second(s)"
+                )
+            self._shutdown_server_event.wait(
+                constants.CONNECTION_RECONNECTION_DELAY_SECONDS
             )
-            time.sleep(constants.CONNECTION_RECONNECTION_DELAY_SECONDS)
 
     def _ardour_connected_status(self, osc_address: str, val) -> None:
-        # Watches if Ardour is connected to the OSC server.
-        if osc_address == "/heartbeat":
-            if val == 1:
-                self.current_heartbeat_timestamp = time.time()
+        # Each heartbeat pushes back the deadline in the liveness monitor
+        self._ardour_heartbeat_event.set()
 
     def _ardour_responded_flag_set(self, osc_address: str, *args) -> None:
         # Watches if Ardour has responded to the OSC server.
+        if not self._ardour_responded_event.is_set():
+            logger.info("Ardour has responded to OSC server")
         self._ardour_responded_event.set()
-        self._ardour_heartbeat_check()
-        logger.info("Ardour has responded to OSC server")
 
-    def _ardour_heartbeat_check(self) -> None:
-        # Checks if Ardour is still connected and updates the UI
-        # Initial delay to allow Ardour to respond
-        time.sleep(2)
+    def _ardour_liveness_monitor(self) -> None:
+        """Tracks whether Ardour is connected from its heartbeats, and updates the
+        UI only when that changes"""
+        connected = False
         while not self._shutdown_server_event.is_set():
-            if self._ardour_responded_event.is_set():
-                if time.time() - self.current_heartbeat_timestamp > 2.2:
-                    # If Ardour has not sent a heartbeat in the last 5 seconds, it is disconnected.
-                    wx.CallAfter(
-                        pub.sendMessage,
-                        PyPubSubTopics.DAW_CONNECTION_STATUS,
-                        connected=False,
-                    )
-                    logger.error("MarkerMatic has lost connection to Ardour. Retrying.")
-                    try:
-                        if self.ardour_osc_server:
-                            self.ardour_osc_server.shutdown()
-                            self.ardour_osc_server.server_close()
-                    except Exception as e:
-                        logger.error(f"Error while shutting down Ardour server: {e}")
-                    self._ardour_responded_event.clear()
-                    break
-                else:
-                    # If Ardour is still connected, set the connection status to True.
+            heartbeat_received = self._ardour_heartbeat_event.wait(
+                ARDOUR_HEARTBEAT_TIMEOUT_SECONDS
+            )
+            if self._shutdown_server_event.is_set():
+                break
+            if heartbeat_received:
+                self._ardour_heartbeat_event.clear()
+                if not connected:
+                    connected = True
+                    logger.info("Ardour is connected")
                     wx.CallAfter(
                         pub.sendMessage,
                         PyPubSubTopics.DAW_CONNECTION_STATUS,
                         connected=True,
                     )
-            time.sleep(1)
+            elif connected:
+                connected = False
+                logger.error("MarkerMatic has lost connection to Ardour. Retrying.")
+                wx.CallAfter(
+                    pub.sendMessage,
+                    PyPubSubTopics.DAW_CONNECTION_STATUS,
+                    connected=False,
+                )
+                # Ardour forgets the surface when it restarts, so send it again
+                self._ardour_responded_event.clear()
 
     def _current_transport_state(self, osc_address: str, val) -> None:
         # Watches what the Ardour playhead is doing.
@@ -177,9 +307,13 @@ class Ardour(Daw):
             logger.info("Ardour is not playing")
             if self._resume_after_load and was_previously_playing:
                 self._resume_after_load = False
-                time.sleep(0.1)
-                logger.info("Resuming playback after marker load")
-                self._ardour_play()
+                # Played from a timer, so the OSC server carries on handling
+                # messages in the meantime
+                resume_timer = threading.Timer(
+                    RESUME_AFTER_LOAD_DELAY_SECONDS, self._resume_after_marker_load
+                )
+                resume_timer.daemon = True
+                resume_timer.start()
         if recording is True:
             self.is_recording = True
             logger.info("Ardour is recording")
@@ -187,29 +321,113 @@ class Ardour(Daw):
             self.is_recording = False
             logger.info("Ardour is not recording")
 
+    def _resume_after_marker_load(self) -> None:
+        logger.info("Resuming playback after marker load")
+        self._ardour_play()
+
+    def _session_name_received(self, osc_address: str, snapshot_name: str, *_) -> None:
+        self._snapshot_name = snapshot_name
+
+    def _get_session_file(self) -> Optional[str]:
+        """Returns the file of the open session, guessed from the most recently
+        opened session that still exists"""
+        if self._resource_path is None:
+            self._resource_path = configure_ardour.get_resource_path(True)
+        for session_name, session_directory in configure_ardour.get_recent_sessions(
+            self._resource_path
+        ):
+            snapshot_names = [session_name]
+            if self._snapshot_name and self._snapshot_name != session_name:
+                snapshot_names.insert(0, self._snapshot_name)
+            session_files = [
+                os.path.join(session_directory, snapshot_name + extension)
+                for snapshot_name in snapshot_names
+                for extension in ARDOUR_SESSION_FILE_EXTENSIONS
+            ]
+            existing_files = [path for path in session_files if os.path.exists(path)]
+            if existing_files:
+                return max(existing_files, key=os.path.getmtime)
+        return None
+
+    def _find_marker(self, name: str, name_only: bool) -> Optional[str]:
+        """Returns the name of the session's marker matching the cue. Raises
+        LookupError if there's no session file to read."""
+        session_file = self._get_session_file()
+        if session_file is None:
+            raise LookupError("No recent Ardour session was found")
+        stat = os.stat(session_file)
+        source = (session_file, stat.st_mtime_ns, stat.st_size)
+        with self._marker_index_lock:
+            if source != self._marker_index_source:
+                start_time = time.monotonic()
+                marker_index = self._new_marker_index()
+                read_session_markers(session_file, marker_index)
+                self._marker_index = marker_index
+                self._marker_index_source = source
+                logger.info(
+                    f"Indexed {len(marker_index)} markers from {session_file} "
+                    f"in {(time.monotonic() - start_time) * 1000:.1f} ms"
+                )
+            marker = self._marker_index.find(name, name_only)
+        return marker.name if marker is not None else None
+
+    def _add_to_marker_index(self, marker_name: str) -> None:
+        # Markers we place aren't in the session file until Ardour saves it
+        with self._marker_index_lock:
+            self._marker_index.add(("placed", marker_name), marker_name)
+
     def _goto_marker_by_name(self, marker_name: str) -> None:
         with self.ardour_send_lock:
             self.ardour_client.send_message("/marker", marker_name)
 
     def get_marker_id_by_name(self, name: str) -> None:
-        pass
+        # Resolves the cue to a marker in the session, and locates to it
+        from app_settings import settings
+
+        marker_name = None
+        try:
+            marker_name = self._find_marker(name, settings.name_only_match)
+            if marker_name is None:
+                logger.info(f"No marker in the Ardour session matches {name}")
+        except (OSError, RuntimeError, LookupError, ET.ParseError) as e:
+            logger.warning(f"Unable to read the markers of the Ardour session: {e}")
+        # Ardour may still have the marker, if it was made outside of MarkerMatic
+        # since the session was last saved
+        self._goto_marker_by_name(marker_name or name)
 
     @overload
     def _place_marker_with_name(self, marker_name: str) -> None:
         pass
 
     @overload
-    def _place_marker_with_name(self, marker_name: str, as_thread: bool = True) -> None:
+    def _place_marker_with_name(
+        self,
+        marker_name: str,
+        as_thread: bool = True,
+        arrival_time: Optional[float] = None,
+    ) -> None:
         pass
 
-    def _place_marker_with_name(self, marker_name: str, as_thread: bool = True) -> None:
+    def _place_marker_with_name(
+        self,
+        marker_name: str,
+        as_thread: bool = True,
+        arrival_time: Optional[float] = None,
+    ) -> None:
         if as_thread:
             threading.Thread(
-                target=self._place_marker_with_name, args=(marker_name, False)
+                target=self._place_marker_with_name,
+                args=(marker_name, False, arrival_time),
             ).start()
             return
         with self.ardour_send_lock:
+            sent_time = time.monotonic()
             self.ardour_client.send_message("/add_marker", marker_name)
+        self._add_to_marker_index(marker_name)
+        # Ardour only adds markers at the playhead, so the delay can't be taken out
+        self._log_marker_placement(
+            marker_name, self._get_cue_delay(arrival_time, sent_time)
+        )
 
     def _incoming_transport_action(self, transport_action: TransportAction) -> None:
         try:
@@ -250,9 +468,13 @@ class Ardour(Daw):
             selected_mode=PlaybackState.RECORDING,
         )
         with self.ardour_send_lock:
-            self.ardour_client.send_message("/goto_end", None)
-            self.ardour_client.send_message("/rec_enable_toggle", 1.0)
-            self.ardour_client.send_message("/transport_play", 1.0)
+            self.ardour_client.send_bundle(
+                [
+                    ("/goto_end", None),
+                    ("/rec_enable_toggle", 1.0),
+                    ("/transport_play", 1.0),
+                ]
+            )
 
     def _ardour_arm_all(self) -> None:
         with self.ardour_send_lock:
@@ -262,7 +484,7 @@ class Ardour(Daw):
         with self.ardour_send_lock:
             self.ardour_client.send_message("/access_action", "Recorder/arm-none")
 
-    def _handle_cue_load(self, cue: str) -> None:
+    def _handle_cue_load(self, cue: str, arrival_time: Optional[float] = None) -> None:
         from app_settings import settings
 
         if (
@@ -270,7 +492,7 @@ class Ardour(Daw):
             and self.is_recording is True
             and self.is_playing is True
         ):
-            self._place_marker_with_name(cue)
+            self._place_marker_with_name(cue, arrival_time=arrival_time)
         elif (
             settings.marker_mode is PlaybackState.PLAYBACK_TRACK
             and self.is_playing is False
@@ -278,10 +500,11 @@ class Ardour(Daw):
         ):
             if self.is_playing and settings.allow_loading_while_playing:
                 self._resume_after_load = True
-            self._goto_marker_by_name(cue)
-            # TODO: Add name only logic here
+            self.get_marker_id_by_name(cue)
 
     def _shutdown_servers(self) -> None:
+        # The next connection checks the config again
+        self._stop_waiting_for_ardour_exit()
         try:
             if self.ardour_osc_server:
                 self.ardour_osc_server.shutdown()
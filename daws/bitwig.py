@@ -1,10 +1,14 @@
+import itertools
+import queue
 import threading
 import time
-from typing import Any, Callable
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 import wx
 from pubsub import pub
-from py4j.java_gateway import JavaGateway
+from py4j.java_gateway import CallbackServerParameters, JavaGateway
 from py4j.protocol import Py4JError, Py4JJavaError, Py4JNetworkError
 
 import constants
@@ -13,6 +17,41 @@ from logger_config import logger
 
 from . import Daw, configure_bitwig, DawFeature
 
+# Separators used by the bridge's bulk marker export
+MARKER_SEPARATOR = "\x1e"
+FIELD_SEPARATOR = "\x1f"
+
+
+def _parse_all_cue_marker_info(all_marker_info: str) -> Dict[int, List[str]]:
+    # Each marker is its name and position, in bank order
+    if not all_marker_info:
+        return {}
+    return {
+        i: marker_info.split(FIELD_SEPARATOR, 1)
+        for i, marker_info in enumerate(all_marker_info.split(MARKER_SEPARATOR))
+    }
+
+
+class _BridgeListener:
+    """Receives the marker and transport changes pushed by the bridge extension"""
+
+    def __init__(self, bitwig: "Bitwig") -> None:
+        self._bitwig = bitwig
+
+    def markersChanged(self, all_cue_marker_info: str) -> None:
+        self._bitwig._markers_changed(all_cue_marker_info)
+
+    def markerPlaced(self, request_id: int, marker_index: int, position: float) -> None:
+        self._bitwig._marker_placed(request_id, marker_index, position)
+
+    def transportChanged(
+        self, is_playing: bool, is_arranger_record_enabled: bool
+    ) -> None:
+        self._bitwig._transport_changed(is_playing, is_arranger_record_enabled)
+
+    class Java:
+        implements = ["com.jms5194.MarkerMaticListener"]
+
 
 class Bitwig(Daw):
     type = "Bitwig Studio"
@@ -23,7 +62,24 @@ class Bitwig(Daw):
         self._shutdown_or_restart_server_event = threading.Event()
         self.bitwig_send_lock = threading.Lock()
         self.gateway_entry_point = None
-        self.marker_dict = {}
+        # Guards the marker index, which holds marker positions by bank index
+        self._marker_index_lock = threading.Lock()
+        # Cleared if the installed bridge predates the bulk marker export
+        self._bulk_marker_export = True
+        # A live mirror of Bitwig's state, kept up to date by the bridge
+        self._listener = _BridgeListener(self)
+        self._push_updates = False
+        self._transport_lock = threading.Lock()
+        self._is_playing: Optional[bool] = None
+        self._is_arranger_record_enabled: Optional[bool] = None
+        # Markers are placed one at a time, in the order the cues arrived
+        # Names of the markers to place, and when their cues arrived
+        self._marker_queue: "queue.Queue[Tuple[str, Optional[float]]]" = queue.Queue()
+        self._marker_request_ids = itertools.count()
+        self._placed_markers_lock = threading.Lock()
+        self._placed_markers: Dict[int, Future] = {}
+        # Cleared if the installed bridge can't place named markers itself
+        self._confirmed_marker_placement = True
         self.gateway = None
         pub.subscribe(
             self._place_marker_with_name, PyPubSubTopics.PLACE_MARKER_WITH_NAME
@@ -45,6 +101,7 @@ class Bitwig(Daw):
         )
         logger.info("Starting Bitwig Connection thread")
         start_managed_thread("daw_connection_thread", self._open_bitwig_connection)
+        start_managed_thread("daw_marker_thread", self._marker_placement_thread)
 
     @staticmethod
     def _validate_bitwig_prefs():
@@ -59,7 +116,11 @@ class Bitwig(Daw):
     def _open_bitwig_connection(self) -> None:
         while not self._shutdown_server_event.is_set():
             try:
-                self.gateway = JavaGateway()
+                self.gateway = JavaGateway(
+                    callback_server_parameters=CallbackServerParameters(
+                        daemonize=True, daemonize_connections=True
+                    )
+                )
                 logger.info("Attempting to Connect to Bitwig")
                 self.gateway_entry_point = self.gateway.entry_point
                 host = self.gateway_entry_point.getHost()
@@ -76,10 +137,14 @@ class Bitwig(Daw):
                 self.bitwig_arranger = self.gateway_entry_point.getArranger()
                 self.bitwig_cuemarkerbank = self.gateway_entry_point.getCueMarkerBank()
                 self.bitwig_trackbank = self.gateway_entry_point.getTrackBank()
-                self._build_marker_dict()
+                self._register_listener()
+                if not self._push_updates:
+                    self._build_marker_index()
                 self._shutdown_or_restart_server_event.wait()
             except Exception:
                 logger.error("Unable to connect to Bitwig. Retrying")
+                # Frees the callback server's port for the next attempt
+                self._close_gateway()
                 time.sleep(constants.CONNECTION_RECONNECTION_DELAY_SECONDS)
 
     def _incoming_transport_action(self, transport_action: TransportAction) -> None:
@@ -102,14 +167,77 @@ class Bitwig(Daw):
         except Exception as e:
             logger.error(f"Error processing armed macros: {e}")
 
-    def _build_marker_dict(self) -> None:
+    def _register_listener(self) -> None:
+        # Ask the bridge to push changes, which starts with the current state
         try:
+            self.gateway_entry_point.setListener(self._listener)
+            self._push_updates = True
+        except (Py4JNetworkError, Py4JJavaError):
+            raise
+        except Py4JError:
+            logger.info(
+                "The Bitwig bridge can't push changes, markers and transport will be polled"
+            )
+            self._push_updates = False
+
+    def _markers_changed(self, all_cue_marker_info: str) -> None:
+        self._set_markers(_parse_all_cue_marker_info(all_cue_marker_info))
+
+    def _set_markers(self, markers: Dict[int, List[str]]) -> None:
+        # The index is replaced rather than changed, so it's never seen half built
+        marker_index = self._new_marker_index()
+        for i, (marker_name, marker_position) in markers.items():
+            marker_index.add(i, marker_name, marker_position)
+        with self._marker_index_lock:
+            self._marker_index = marker_index
+
+    def _transport_changed(
+        self,
+        is_playing: Optional[bool],
+        is_arranger_record_enabled: Optional[bool],
+    ) -> None:
+        with self._transport_lock:
+            self._is_playing = is_playing
+            self._is_arranger_record_enabled = is_arranger_record_enabled
+
+    def _get_transport_state(self) -> Tuple[bool, bool]:
+        """Returns whether Bitwig is playing, and whether arranger record is
+        enabled, from the mirror if the bridge is pushing changes"""
+        with self._transport_lock:
+            is_playing = self._is_playing
+            is_arranger_record_enabled = self._is_arranger_record_enabled
+        if (
+            self._push_updates
+            and is_playing is not None
+            and is_arranger_record_enabled is not None
+        ):
+            return is_playing, is_arranger_record_enabled
+        return (
+            self.bitwig_transport.isPlaying().get(),
+            self.bitwig_transport.isArrangerRecordEnabled().get(),
+        )
+
+    def _build_marker_index(self) -> None:
+        try:
+            if self._bulk_marker_export:
+                try:
+                    all_marker_info = self.gateway_entry_point.getAllCueMarkerInfo()
+                    self._set_markers(_parse_all_cue_marker_info(all_marker_info))
+                    return
+                except (Py4JNetworkError, Py4JJavaError):
+                    raise
+                except Py4JError:
+                    logger.info(
+                        "The Bitwig bridge can't export all markers at once, fetching them one at a time"
+                    )
+                    self._bulk_marker_export = False
             cur_marker_qty = self.bitwig_cuemarkerbank.itemCount().get()
-            self.marker_dict = {}
-            for i in range(0, cur_marker_qty):
-                cur_marker_info = self.gateway_entry_point.getCueMarkerInfo(i)
-                cur_marker_split = cur_marker_info.split("<>")
-                self.marker_dict[i] = cur_marker_split
+            self._set_markers(
+                {
+                    i: self.gateway_entry_point.getCueMarkerInfo(i).split("<>")
+                    for i in range(0, cur_marker_qty)
+                }
+            )
         except (
             AttributeError,
             Py4JError,
@@ -117,39 +245,47 @@ class Bitwig(Daw):
             Py4JJavaError,
             ConnectionRefusedError,
             IndexError,
+            ValueError,
         ):
             logger.error("Lost Connection to Bitwig. Attempting reconnect")
             self._bitwig_reconnect_attempt()
 
-    def _add_to_marker_dict(self, new_marker_num: int) -> None:
+    def _add_to_marker_index(self, new_marker_num: int) -> None:
         try:
             cur_marker_info = self.gateway_entry_point.getCueMarkerInfo(new_marker_num)
-            cur_marker_split = cur_marker_info.split("<>")
-            self.marker_dict[new_marker_num] = cur_marker_split
+            marker_name, marker_position = cur_marker_info.split("<>")
+            with self._marker_index_lock:
+                self._marker_index.add(new_marker_num, marker_name, marker_position)
         except (
             Py4JError,
             Py4JNetworkError,
             Py4JJavaError,
             ConnectionRefusedError,
             IndexError,
+            ValueError,
         ):
             logger.error("Lost Connection to Bitwig. Attempting reconnect")
             self._bitwig_reconnect_attempt()
 
-    def _place_marker_with_name(self, marker_name: str, as_thread: bool = True) -> None:
+    def _place_marker_with_name(
+        self,
+        marker_name: str,
+        as_thread: bool = True,
+        arrival_time: Optional[float] = None,
+    ) -> None:
         # Bitwig markers can only be placed on a bar/beat reference, so will never be 100% accurate
         if as_thread:
-            threading.Thread(
-                target=self._place_marker_with_name, args=(marker_name, False)
-            ).start()
+            self._marker_queue.put((marker_name, arrival_time))
             return
         try:
-            cur_marker_qty = self.bitwig_cuemarkerbank.itemCount().get()
-            self.bitwig_transport.addCueMarkerAtPlaybackPosition()
-            time.sleep(0.1)
-            self.gateway_entry_point.renameMarker(cur_marker_qty, marker_name)
-            time.sleep(0.1)
-            self._add_to_marker_dict(cur_marker_qty)
+            delay = self._get_cue_delay(arrival_time, time.monotonic())
+            if self._push_updates and self._confirmed_marker_placement:
+                self._place_confirmed_marker(marker_name)
+            else:
+                self._place_timed_marker(marker_name)
+            if delay is not None:
+                # Bitwig only adds markers at the playhead, so the delay stays in
+                self._log_marker_placement(marker_name, delay)
         except (
             AttributeError,
             Py4JError,
@@ -161,7 +297,72 @@ class Bitwig(Daw):
             logger.error("Lost Connection to Bitwig. Attempting reconnect")
             self._bitwig_reconnect_attempt()
 
+    def _marker_placement_thread(self, stop_event: threading.Event) -> None:
+        while not stop_event.is_set():
+            try:
+                marker_name, arrival_time = self._marker_queue.get(
+                    timeout=constants.CONNECTION_TIMEOUT_SECONDS
+                )
+            except queue.Empty:
+                continue
+            self._place_marker_with_name(marker_name, False, arrival_time)
+
+    def _place_confirmed_marker(self, marker_name: str) -> None:
+        # The bridge adds and names the marker in one step, and reports where it went
+        request_id = next(self._marker_request_ids)
+        placed_marker: Future = Future()
+        with self._placed_markers_lock:
+            self._placed_markers[request_id] = placed_marker
+        start_time = time.monotonic()
+        try:
+            try:
+                self.gateway_entry_point.addNamedCueMarkerAtPlaybackPosition(
+                    request_id, marker_name
+                )
+            except (Py4JNetworkError, Py4JJavaError):
+                raise
+            except Py4JError:
+                logger.info(
+                    "The Bitwig bridge can't place named markers, falling back to renaming them"
+                )
+                self._confirmed_marker_placement = False
+                self._place_timed_marker(marker_name)
+                return
+            try:
+                marker_index, position = placed_marker.result(
+                    constants.MESSAGE_TIMEOUT_SECONDS
+                )
+            except FutureTimeoutError:
+                logger.error(f"Bitwig didn't confirm the marker {marker_name}")
+                return
+        finally:
+            with self._placed_markers_lock:
+                del self._placed_markers[request_id]
+        logger.info(
+            f"Placed marker {marker_name} at index {marker_index}, beat {position} in {(time.monotonic() - start_time) * 1000:.0f} ms"
+        )
+
+    def _marker_placed(
+        self, request_id: int, marker_index: int, position: float
+    ) -> None:
+        with self._placed_markers_lock:
+            placed_marker = self._placed_markers.get(request_id)
+        if placed_marker is not None and not placed_marker.done():
+            placed_marker.set_result((marker_index, position))
+
+    def _place_timed_marker(self, marker_name: str) -> None:
+        # For bridges that can't report the new marker, guess its index and give
+        # Bitwig time to catch up
+        cur_marker_qty = self.bitwig_cuemarkerbank.itemCount().get()
+        self.bitwig_transport.addCueMarkerAtPlaybackPosition()
+        time.sleep(0.1)
+        self.gateway_entry_point.renameMarker(cur_marker_qty, marker_name)
+        time.sleep(0.1)
+        self._add_to_marker_index(cur_marker_qty)
+
     def _bitwig_reconnect_attempt(self) -> None:
+        self._push_updates = False
+        self._transport_changed(None, None)
         wx.CallAfter(
             pub.sendMessage,
             PyPubSubTopics.DAW_CONNECTION_STATUS,
@@ -170,17 +371,17 @@ class Bitwig(Daw):
         self._shutdown_servers()
         self._shutdown_or_restart_server_event.set()
 
-    def _handle_cue_load(self, cue: str) -> None:
+    def _handle_cue_load(self, cue: str, arrival_time: Optional[float] = None) -> None:
         from app_settings import settings
 
         try:
-            is_playing: bool = self.bitwig_transport.isPlaying().get()
+            is_playing, is_arranger_record_enabled = self._get_transport_state()
             if (
                 settings.marker_mode is PlaybackState.RECORDING
                 and is_playing
-                and self.bitwig_transport.isArrangerRecordEnabled().get()
+                and is_arranger_record_enabled
             ):
-                self._place_marker_with_name(cue)
+                self._place_marker_with_name(cue, arrival_time=arrival_time)
             elif settings.marker_mode is PlaybackState.PLAYBACK_TRACK and (
                 not is_playing or settings.allow_loading_while_playing
             ):
@@ -201,40 +402,13 @@ class Bitwig(Daw):
     def _goto_marker_by_name(self, cue: str) -> None:
         from app_settings import settings
 
-        possible_markers = []
         try:
-            if settings.name_only_match:
-                cue_name_only_list = cue.split(" ")[1:]
-                cue_name_only = " ".join(cue_name_only_list)
-                try:
-                    for key, value in self.marker_dict.items():
-                        value_full_name = value[0]
-                        value_name_only_list = value_full_name.split(" ")[1:]
-                        value_name_only = " ".join(value_name_only_list)
-                        if value_name_only == cue_name_only:
-                            possible_markers.append(key)
-                except Exception:
-                    logger.info("Bitwig found no matching marker")
-                    return
-                if possible_markers[0]:
-                    marker_to_nav = self.marker_dict[possible_markers[0]]
-                    marker_time_to_nav = marker_to_nav[1]
-                    self.gateway_entry_point.loadPlaybackPosition(marker_time_to_nav)
-                pass
-            else:
-                try:
-                    possible_markers = [
-                        key
-                        for key, value in self.marker_dict.items()
-                        if value[0] == cue
-                    ]
-                except Exception:
-                    logger.info("Bitwig found no matching marker")
-                    return
-                if possible_markers[0]:
-                    marker_to_nav = self.marker_dict[possible_markers[0]]
-                    marker_time_to_nav = marker_to_nav[1]
-                    self.gateway_entry_point.loadPlaybackPosition(marker_time_to_nav)
+            with self._marker_index_lock:
+                marker = self._marker_index.find(cue, settings.name_only_match)
+            if marker is None:
+                logger.info("Bitwig found no matching marker")
+                return
+            self.gateway_entry_point.loadPlaybackPosition(marker.value)
         except (
             AttributeError,
             Py4JError,
@@ -248,7 +422,7 @@ class Bitwig(Daw):
 
     def _bitwig_play(self) -> None:
         try:
-            if not self.bitwig_transport.isPlaying().get():
+            if not self._get_transport_state()[0]:
                 self.bitwig_transport.play()
         except (
             AttributeError,
@@ -307,7 +481,7 @@ class Bitwig(Daw):
 
     def _bitwig_rec(self) -> None:
         try:
-            if not self.bitwig_transport.isPlaying().get():
+            if not self._get_transport_state()[0]:
                 self.bitwig_transport.record()
                 self.bitwig_transport.play()
             else:
@@ -327,4 +501,13 @@ class Bitwig(Daw):
 
     def _shutdown_servers(self) -> None:
         logger.info("Closing connection to Bitwig")
-        self.gateway.close()
+        self._close_gateway()
+
+    def _close_gateway(self) -> None:
+        # Closes the connection and shuts down the callback server
+        gateway, self.gateway = self.gateway, None
+        if gateway is not None:
+            try:
+                gateway.close()
+            except Exception as e:
+                logger.debug(f"Error closing the Bitwig gateway: {e}")
@@ -2,11 +2,14 @@ import os
 import shutil
 import xml.etree.ElementTree
 from logger_config import logger
-import psutil
 import sys
 import xml.etree.ElementTree as ET
-import time
-import re
+from typing import List, Tuple
+
+from .process_watcher import process_watcher
+
+# Matched against process names by the process watcher
+ARDOUR_PROCESS_NAME = "ardour(\\d+|gui)"
 
 
 def backup_config_file(config_file_path):
@@ -22,22 +25,20 @@ def backup_config_file(config_file_path):
 
 
 def enable_osc_interface(resource_path):
+    # Ardour writes its config when it quits, so this must only be done while
+    # it isn't running
+    backup_config_file(resource_path)
     # Parse the XML configuration document
-    try:
-        while get_ardour_process_path() is not None:
-            time.sleep(1.0)
-    except RuntimeError:
-        backup_config_file(resource_path)
-        config_path = os.path.join(resource_path, "config")
-        config = ET.parse(config_path)
-        root = config.getroot()
-        osc_config = root.find(
-            "./ControlProtocols/Protocol[@name='Open Sound Control (OSC)']"
-        )
-        assert isinstance(osc_config, xml.etree.ElementTree.Element)
-        osc_config.attrib["active"] = "1"
-        config.write(config_path)
-        logger.info("Wrote an updated Ardour config file with OSC enabled")
+    config_path = os.path.join(resource_path, "config")
+    config = ET.parse(config_path)
+    root = config.getroot()
+    osc_config = root.find(
+        "./ControlProtocols/Protocol[@name='Open Sound Control (OSC)']"
+    )
+    assert isinstance(osc_config, xml.etree.ElementTree.Element)
+    osc_config.attrib["active"] = "1"
+    config.write(config_path)
+    logger.info("Wrote an updated Ardour config file with OSC enabled")
 
 
 def osc_interface_exists(resource_path):
@@ -62,6 +63,14 @@ def osc_interface_exists(resource_path):
         return False
 
 
+def get_recent_sessions(resource_path) -> List[Tuple[str, str]]:
+    """Return the (name, directory) of Ardour's recent sessions, most recent first"""
+    with open(os.path.join(resource_path, "recent"), encoding="utf-8") as recent_file:
+        lines = recent_file.read().splitlines()
+    # Each session is stored as its name, followed by its directory
+    return list(zip(lines[::2], lines[1::2]))
+
+
 def get_resource_path(detect_portable_install):
     for i in get_candidate_directories(detect_portable_install):
         if i is not None:
@@ -105,15 +114,12 @@ def is_windows() -> bool:
 
 def get_ardour_process_path() -> str:
     """Return the path to the currently running Ardour process"""
-    processes = [
-        p
-        for p in psutil.process_iter(["name", "exe"])
-        if re.match(
-            "^ardour(\\d+|gui)$", os.path.splitext(p.name())[0].lower(), re.IGNORECASE
-        )
-    ]
+    processes = process_watcher.get_processes(ARDOUR_PROCESS_NAME)
     if not processes:
         raise RuntimeError("No Ardour instance is currently running.")
     elif len(processes) > 1:
         raise RuntimeError("More than one Ardour instance is currently running.")
-    return processes[0].exe()
+    process_path = processes[0].exe
+    if process_path is None:
+        raise RuntimeError("Unable to get the Ardour executable.")
+    return process_path
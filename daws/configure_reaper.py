@@ -1,17 +1,76 @@
 import os
 import pathlib
+import shlex
 import shutil
 import sys
+import threading
 from collections import OrderedDict
 from configparser import ConfigParser
-
-import psutil
+from typing import Dict, List, Optional, Tuple
 
 import constants
 from logger_config import logger
 
+from .process_watcher import process_watcher
+
 # Many thanks to the programmers of Reapy and Reapy-boost for much of this code.
 
+# Matched against process names by the process watcher
+REAPER_PROCESS_NAME = "reaper"
+CSURF_NAME = "MarkerMatic Link"
+# Reaper looks for pattern configs in the OSC folder of its resource path
+PATTERN_CONFIG_DIRECTORY = "OSC"
+PATTERN_CONFIG_FILE_NAME = "MarkerMatic.ReaperOSC"
+# Only what MarkerMatic sends and listens for. Reaper's default pattern config
+# also sends track, FX and meter feedback, which would just be thrown away.
+PATTERN_CONFIG = """\
+# OSC pattern config file, generated by MarkerMatic. Changes to this file will be
+# overwritten, make a copy with a different name to customize it.
+
+# For basic information about OSC and REAPER, see
+# http://www.cockos.com/reaper/sdk/osc/osc.php .
+
+DEVICE_TRACK_COUNT 0
+DEVICE_SEND_COUNT 0
+DEVICE_RECEIVE_COUNT 0
+DEVICE_FX_COUNT 0
+DEVICE_FX_PARAM_COUNT 0
+DEVICE_FX_INST_PARAM_COUNT 0
+DEVICE_MARKER_COUNT 0
+DEVICE_REGION_COUNT 0
+
+REAPER_TRACK_FOLLOWS REAPER
+DEVICE_TRACK_FOLLOWS DEVICE
+DEVICE_TRACK_BANK_FOLLOWS DEVICE
+DEVICE_FX_FOLLOWS DEVICE
+
+RECORD t/record
+STOP t/stop
+PLAY t/play
+
+GOTO_MARKER i/marker
+
+MARKER_NAME s/marker/@/name
+LAST_MARKER_NAME s/lastmarker/name
+LAST_MARKER_NUMBER s/lastmarker/number/str
+LAST_MARKER_TIME f/lastmarker/time
+MARKERID_NAME s/marker_id/@/name
+MARKERID_TIME f/marker_id/@/time
+
+ACTION i/action
+
+DEVICE_MARKER_COUNT i/device/marker/count
+"""
+
+# Fields of an OSC csurf entry, once the quoted name has been split out
+CSURF_SEND_PORT_FIELD = 3
+CSURF_RECEIVE_PORT_FIELD = 5
+
+# The csurf entries of each reaper.ini that has been scanned, with the
+# (mtime, size) of the file when it was scanned
+_csurf_cache: Dict[str, Tuple[Tuple[int, int], List[str]]] = {}
+_csurf_cache_lock = threading.Lock()
+
 
 class CaseInsensitiveDict(OrderedDict):
     """OrderedDict with case-insensitive keys."""
@@ -84,9 +143,19 @@ def add_OSC_interface(resource_path, rcv_port=8000, snd_port=9000):
     snd_port : int
         OSC device port. Default= ``9000``.
     """
+    install_pattern_config(resource_path)
     if osc_interface_exists(resource_path, rcv_port, snd_port):
         return
-    config = Config(os.path.join(resource_path, "reaper.ini"))
+    ini_file = os.path.join(resource_path, "reaper.ini")
+    existing_index = find_osc_interface(read_csurfs(ini_file), rcv_port, snd_port)
+    config = Config(ini_file)
+    csurf = get_csurf(rcv_port, snd_port)
+
+    if existing_index is not None:
+        # Point an interface added by an older version at the pattern config
+        config["reaper"][f"csurf_{existing_index}"] = csurf
+        config.write()
+        return
 
     if config.has_option("reaper", "csurf_cnt"):
         csurf_count = int(config["reaper"].get("csurf_cnt", "0"))
@@ -96,13 +165,111 @@ def add_OSC_interface(resource_path, rcv_port=8000, snd_port=9000):
         config["reaper"]["csurf_cnt"] = "1"
         csurf_count = 1
     key = f"csurf_{csurf_count - 1}"
-    config["reaper"][key] = (
-        f'OSC "MarkerMatic Link" 3 {snd_port} "{constants.IP_LOOPBACK}" {rcv_port} 1024 10 ""'
-    )
+    config["reaper"][key] = csurf
     config["reaper"]["csurf_cnt"] = str(csurf_count)
     config.write()
 
 
+def get_csurf(rcv_port, snd_port):
+    """Return the reaper.ini entry for MarkerMatic's OSC interface."""
+    return (
+        f'OSC "{CSURF_NAME}" 3 {snd_port} "{constants.IP_LOOPBACK}" {rcv_port} '
+        f'1024 10 "{PATTERN_CONFIG_FILE_NAME}"'
+    )
+
+
+def install_pattern_config(resource_path):
+    """Write MarkerMatic's OSC pattern config to REAPER's OSC folder, unless it's
+    already up to date.
+
+    Returns
+    -------
+    bool
+        Whether the file was written.
+    """
+    if pattern_config_installed(resource_path):
+        return False
+    pattern_config_directory = os.path.join(resource_path, PATTERN_CONFIG_DIRECTORY)
+    os.makedirs(pattern_config_directory, exist_ok=True)
+    with open(
+        os.path.join(pattern_config_directory, PATTERN_CONFIG_FILE_NAME),
+        "w",
+        encoding="utf8",
+    ) as f:
+        f.write(PATTERN_CONFIG)
+    logger.info(f"Installed REAPER OSC pattern config {PATTERN_CONFIG_FILE_NAME}")
+    return True
+
+
+def pattern_config_installed(resource_path):
+    """Return whether MarkerMatic's OSC pattern config is installed and current."""
+    try:
+        with open(
+            os.path.join(
+                resource_path, PATTERN_CONFIG_DIRECTORY, PATTERN_CONFIG_FILE_NAME
+            ),
+            encoding="utf8",
+        ) as f:
+            return f.read() == PATTERN_CONFIG
+    except OSError:
+        return False
+
+
+def read_csurfs(ini_file) -> List[str]:
+    """Return the control surface entries of a reaper.ini file, in order.
+
+    Only the csurf lines of the ``[reaper]`` section are read, and the result
+    is reused until the file's modification time or size changes.
+    """
+    try:
+        stat = os.stat(ini_file)
+    except OSError:
+        return []
+    source = (stat.st_mtime_ns, stat.st_size)
+    with _csurf_cache_lock:
+        cached = _csurf_cache.get(ini_file)
+        if cached is not None and cached[0] == source:
+            return cached[1]
+    csurfs = _scan_csurfs(ini_file)
+    with _csurf_cache_lock:
+        _csurf_cache[ini_file] = (source, csurfs)
+    return csurfs
+
+
+def _scan_csurfs(ini_file) -> List[str]:
+    # Keys are case insensitive, as they are for Config
+    values: Dict[str, str] = {}
+    in_reaper_section = False
+    with open(ini_file, encoding="utf8", errors="replace") as f:
+        for line in f:
+            if line.startswith("["):
+                in_reaper_section = line.strip().lower() == "[reaper]"
+            elif in_reaper_section and line[:5].lower() == "csurf":
+                key, delimiter, value = line.partition("=")
+                if delimiter:
+                    values[key.strip().lower()] = value.strip()
+    csurf_count = int(values.get("csurf_cnt", "0"))
+    return [values.get(f"csurf_{i}", "") for i in range(csurf_count)]
+
+
+def find_osc_interface(csurfs, rcv_port, snd_port) -> Optional[int]:
+    """Return the index of the REAPER OSC Interface at the given ports, if there
+    is one."""
+    for i, csurf in enumerate(csurfs):
+        if not csurf.startswith("OSC"):  # It's not an OSC interface
+            continue
+        try:
+            fields = shlex.split(csurf)
+        except ValueError:
+            continue
+        if len(fields) > CSURF_RECEIVE_PORT_FIELD and (
+            fields[CSURF_SEND_PORT_FIELD] == str(snd_port)
+            and fields[CSURF_RECEIVE_PORT_FIELD] == str(rcv_port)
+        ):  # It's the one
+            return i
+    return None
+
+
 def osc_interface_exists(resource_path, rcv_port, snd_port):
     """Return whether a REAPER OSC Interface exists at a given port.
 
@@ -119,21 +286,20 @@ def osc_interface_exists(resource_path, rcv_port, snd_port):
     Returns
     -------
     bool
-        Whether a REAPER OSC Interface exists at ``port``.
+        Whether a REAPER OSC Interface exists at ``port``. MarkerMatic's own
+        interface must also be using its pattern config.
     """
-    config = Config(os.path.join(resource_path, "reaper.ini"))
-    if config.has_option("reaper", "csurf_cnt"):
-        csurf_count = int(config["reaper"].get("csurf_cnt", "0"))
-        for i in range(csurf_count):
-            string = config["reaper"][f"csurf_{i}"]
-            if string.startswith("OSC"):  # It's an OSC interface
-                if string.split(" ")[4] == str(snd_port) and string.split(" ")[
-                    6
-                ] == str(rcv_port):  # It's the one
-                    return True
+    csurfs = read_csurfs(os.path.join(resource_path, "reaper.ini"))
+    index = find_osc_interface(csurfs, rcv_port, snd_port)
+    if index is None:
         return False
-    else:
+    csurf = csurfs[index]
+    if not csurf.startswith(f'OSC "{CSURF_NAME}"'):
+        # Set up by hand, so it's left as it is
+        return True
+    if not csurf.endswith(f'"{PATTERN_CONFIG_FILE_NAME}"'):
         return False
+    return pattern_config_installed(resource_path)
 
 
 def get_resource_path(detect_portable_install):
@@ -175,19 +341,15 @@ def get_reaper_process_path():
         When zero or more than one REAPER instances are currently
         running.
     """
-    processes = [
-        p
-        for p in psutil.process_iter(["name", "exe"])
-        if os.path.splitext(
-            p.info["name"]  # type:ignore
-        )[0].lower()
-        == "reaper"
-    ]
+    processes = process_watcher.get_processes(REAPER_PROCESS_NAME)
     if not processes:
         raise RuntimeError("No REAPER instance is currently running.")
     elif len(processes) > 1:
         raise RuntimeError("More than one REAPER instance is currently running.")
-    return processes[0].info["exe"]  # type:ignore
+    process_path = processes[0].exe
+    if process_path is None:
+        raise RuntimeError("Unable to get the REAPER executable.")
+    return process_path
 
 
 def is_apple() -> bool:
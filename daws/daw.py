@@ -1,21 +1,214 @@
-from typing import Callable
+from typing import Any, Callable, Dict, Hashable, List, Optional
 import threading
 from pubsub import pub
 from enum import IntEnum, auto
 from constants import PyPubSubTopics
+from logger_config import logger
 
 
 class DawFeature(IntEnum):
     NAME_ONLY_MATCH = auto()
 
 
+def get_name_only(name: str) -> str:
+    """Returns a cue or marker name without the cue number at its start"""
+    return name.partition(" ")[2]
+
+
+class MarkerIndexEntry:
+    """A marker in a MarkerIndex. The value is whatever the DAW needs to go to
+    the marker, such as its position."""
+
+    __slots__ = ("marker_id", "name", "name_only", "value", "order", "truncated")
+
+    def __init__(
+        self,
+        marker_id: Hashable,
+        name: str,
+        value: Any,
+        order: int,
+        truncated: bool,
+    ) -> None:
+        self.marker_id = marker_id
+        self.name = name
+        self.name_only = get_name_only(name)
+        self.value = value
+        self.order = order
+        self.truncated = truncated
+
+
+class MarkerIndex:
+    """Markers by their full name and their name only, so that cues can be
+    matched without scanning every marker. DAWs that cut long names short give
+    a max_name_length, and names that reach it are matched on the part that was
+    kept. When several markers match, the first added is used, or the last if
+    prefer_last is set.
+
+    Not thread safe, adapters either lock around it or replace it whole."""
+
+    def __init__(
+        self, max_name_length: Optional[int] = None, prefer_last: bool = False
+    ) -> None:
+        self.max_name_length = max_name_length
+        self.prefer_last = prefer_last
+        self._entries: Dict[Hashable, MarkerIndexEntry] = {}
+        self._next_order = 0
+        # Entries by lookup key, for full names and names only
+        self._exact: Dict[bool, Dict[str, List[MarkerIndexEntry]]] = {
+            False: {},
+            True: {},
+        }
+        self._truncated: Dict[bool, Dict[str, List[MarkerIndexEntry]]] = {
+            False: {},
+            True: {},
+        }
+        # How many truncated keys there are of each length
+        self._truncated_lengths: Dict[bool, Dict[int, int]] = {False: {}, True: {}}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, marker_id: Hashable) -> bool:
+        return marker_id in self._entries
+
+    def get(self, marker_id: Hashable) -> Optional[MarkerIndexEntry]:
+        return self._entries.get(marker_id)
+
+    def entries(self) -> List[MarkerIndexEntry]:
+        return list(self._entries.values())
+
+    def add(
+        self, marker_id: Hashable, name: str, value: Any = None
+    ) -> MarkerIndexEntry:
+        """Adds a marker, replacing any marker with the same ID"""
+        old_entry = self._entries.get(marker_id)
+        if old_entry is not None:
+            self._unindex(old_entry)
+            order = old_entry.order
+        else:
+            order = self._next_order
+            self._next_order += 1
+        truncated = False
+        if self.max_name_length is not None:
+            name = name[: self.max_name_length]
+            truncated = len(name) == self.max_name_length
+        entry = MarkerIndexEntry(marker_id, name, value, order, truncated)
+        self._entries[marker_id] = entry
+        self._index(entry)
+        return entry
+
+    def rename(self, marker_id: Hashable, name: str) -> Optional[MarkerIndexEntry]:
+        """Renames a marker, keeping its value and its place in the order"""
+        entry = self._entries.get(marker_id)
+        if entry is None:
+            return None
+        return self.add(marker_id, name, entry.value)
+
+    def remove(self, marker_id: Hashable) -> Optional[MarkerIndexEntry]:
+        entry = self._entries.pop(marker_id, None)
+        if entry is not None:
+            self._unindex(entry)
+        return entry
+
+    def clear(self) -> None:
+        self._entries.clear()
+        for name_only in (False, True):
+            self._exact[name_only].clear()
+            self._truncated[name_only].clear()
+            self._truncated_lengths[name_only].clear()
+
+    def find(self, cue: str, name_only: bool = False) -> Optional[MarkerIndexEntry]:
+        """Returns the marker matching the cue, if there is one"""
+        if name_only:
+            cue = get_name_only(cue)
+        candidates = list(self._exact[name_only].get(cue, ()))
+        truncated = self._truncated[name_only]
+        for length in self._truncated_lengths[name_only]:
+            if len(cue) >= length:
+                candidates.extend(truncated.get(cue[:length], ()))
+        if not candidates:
+            return None
+        if self.prefer_last:
+            return max(candidates, key=lambda entry: entry.order)
+        return min(candidates, key=lambda entry: entry.order)
+
+    def _index(self, entry: MarkerIndexEntry) -> None:
+        for name_only, key in ((False, entry.name), (True, entry.name_only)):
+            if entry.truncated:
+                self._truncated[name_only].setdefault(key, []).append(entry)
+                lengths = self._truncated_lengths[name_only]
+                lengths[len(key)] = lengths.get(len(key), 0) + 1
+            else:
+                self._exact[name_only].setdefault(key, []).append(entry)
+
+    def _unindex(self, entry: MarkerIndexEntry) -> None:
+        for name_only, key in ((False, entry.name), (True, entry.name_only)):
+            keys = (
+                self._truncated[name_only]
+                if entry.truncated
+                else self._exact[name_only]
+            )
+            matching_entries = keys.get(key, [])
+            if entry in matching_entries:
+                matching_entries.remove(entry)
+                if not matching_entries:
+                    del keys[key]
+            if entry.truncated:
+                lengths = self._truncated_lengths[name_only]
+                lengths[len(key)] -= 1
+                if not lengths[len(key)]:
+                    del lengths[len(key)]
+
+
 class Daw:
     type = "Unknown"
     supported_features: list[DawFeature] = []
+    # Longest marker name the DAW reports, if it cuts long names short
+    marker_name_max_length: Optional[int] = None
+    # Whether the last of several markers with the same name is used
+    prefer_last_marker = False
 
     def __init__(self) -> None:
         self._shutdown_server_event = threading.Event()
         pub.subscribe(self._shutdown_server_event.set, PyPubSubTopics.SHUTDOWN_SERVERS)
+        self._marker_index = self._new_marker_index()
+
+    def _new_marker_index(self) -> MarkerIndex:
+        return MarkerIndex(self.marker_name_max_length, self.prefer_last_marker)
+
+    @staticmethod
+    def _get_cue_delay(
+        arrival_time: Optional[float], placed_time: float
+    ) -> Optional[float]:
+        """Returns how many seconds after the cue arrived from the console the
+        marker was placed, or None if the cue wasn't timestamped. Both times are
+        from time.monotonic()."""
+        if arrival_time is None:
+            return None
+        return max(0.0, placed_time - arrival_time)
+
+    def _log_marker_placement(
+        self,
+        marker_name: str,
+        delay: Optional[float],
+        residual: Optional[float] = None,
+    ) -> None:
+        """Reports how far each marker is from its cue. The residual is the error
+        that's left once the marker has been moved back by the delay, and is None
+        if the marker couldn't be moved."""
+        if delay is None:
+            logger.info(f"Placed marker for cue: {marker_name}")
+        elif residual is None:
+            logger.info(
+                f"Placed marker for cue: {marker_name}, "
+                f"{delay * 1000:.1f} ms after the cue arrived"
+            )
+        else:
+            logger.info(
+                f"Placed marker for cue: {marker_name}, moved back "
+                f"{delay * 1000:.1f} ms to when the cue arrived, "
+                f"with a residual error of up to {residual * 1000:.1f} ms"
+            )
 
     def start_managed_threads(
         self, start_managed_thread: Callable[[str, Callable], None]
@@ -1,22 +1,120 @@
 import threading
 import time
-from typing import Any, Callable, overload
+from concurrent.futures import Future
+from typing import Any, Callable, Optional, Tuple, overload
 
 from pubsub import pub
-from pythonosc import tcp_client, osc_message_builder
+from pythonosc import dispatcher, osc_message_builder
 
-from zeroconf import Zeroconf, ServiceInfo
+from zeroconf import ServiceBrowser, ServiceListener, Zeroconf
 
 import constants
+import osc_codec
+import osc_tcp
 from constants import PlaybackState, PyPubSubTopics, TransportAction
 from logger_config import logger
 
 from . import Daw, DawFeature
 
+ZEROCONF_SERVICE_TYPE = "_osc._tcp.local."
+ZEROCONF_SERVICE_NAME = "Digital Performer OSC." + ZEROCONF_SERVICE_TYPE
+# How long to wait for the service to be announced before checking for shutdown
+ZEROCONF_SERVICE_WAIT_SECONDS = 1.0
+ZEROCONF_RESOLVE_TIMEOUT_MS = 3000
+# Digital Performer answers on loopback, so a reply this late isn't coming
+REQUEST_TIMEOUT_SECONDS = 2.0
+# DP only reports the first 36 characters of a marker's name over OSC
+MARKER_NAME_MAX_LENGTH = 36
+# DP doesn't report the sample rate, so it's measured from the playhead while
+# recording, and rounded to the nearest of these
+SAMPLE_RATES = (44100, 48000, 88200, 96000, 176400, 192000)
+SAMPLE_RATE_TOLERANCE = 0.02
+SAMPLE_RATE_PROBE_SECONDS = 0.1
+
+
+class DigitalPerformerServiceBrowser(ServiceListener):
+    """Tracks Digital Performer's OSC service in the background, so the current
+    port is known as soon as the connection needs to be rebuilt"""
+
+    def __init__(self) -> None:
+        self._zeroconf: Optional[Zeroconf] = None
+        self._browser: Optional[ServiceBrowser] = None
+        self._port_lock = threading.Lock()
+        self._port: Optional[int] = None
+        self._service_present = threading.Event()
+
+    def start(self) -> None:
+        self._zeroconf = Zeroconf()
+        self._browser = ServiceBrowser(
+            self._zeroconf, ZEROCONF_SERVICE_TYPE, listener=self
+        )
+
+    def close(self) -> None:
+        self._service_present.clear()
+        if self._browser is not None:
+            self._browser.cancel()
+            self._browser = None
+        if self._zeroconf is not None:
+            self._zeroconf.close()
+            self._zeroconf = None
+
+    def add_service(self, zc: Zeroconf, type_: str, name: str) -> None:
+        if name == ZEROCONF_SERVICE_NAME:
+            # The port is resolved by the next caller, not on the browser's thread
+            with self._port_lock:
+                self._port = None
+            self._service_present.set()
+
+    def update_service(self, zc: Zeroconf, type_: str, name: str) -> None:
+        self.add_service(zc, type_, name)
+
+    def remove_service(self, zc: Zeroconf, type_: str, name: str) -> None:
+        if name == ZEROCONF_SERVICE_NAME:
+            logger.info("Digital Performer's OSC service has gone away")
+            self._service_present.clear()
+            with self._port_lock:
+                self._port = None
+
+    def get_port(self, stop_event: threading.Event) -> Optional[int]:
+        """Returns the port of Digital Performer's OSC server, waiting until it
+        is announced. Returns None if stop_event is set first."""
+        logged_waiting = False
+        while not stop_event.is_set():
+            if not self._service_present.wait(ZEROCONF_SERVICE_WAIT_SECONDS):
+                if not logged_waiting:
+                    logger.info("No Digital Performer instance running.")
+                    logged_waiting = True
+                continue
+            with self._port_lock:
+                port = self._port
+            if port is not None:
+                return port
+            zeroconf = self._zeroconf
+            if zeroconf is None:
+                return None
+            try:
+                info = zeroconf.get_service_info(
+                    ZEROCONF_SERVICE_TYPE,
+                    ZEROCONF_SERVICE_NAME,
+                    timeout=ZEROCONF_RESOLVE_TIMEOUT_MS,
+                )
+            except Exception as e:
+                logger.error(f"Zeroconf error: {e}")
+                info = None
+            if info is None or not info.port:
+                stop_event.wait(ZEROCONF_SERVICE_WAIT_SECONDS)
+                continue
+            with self._port_lock:
+                self._port = info.port
+            logger.info(f"Digital Performer's OSC server can be found at: {info.port}")
+            return info.port
+        return None
+
 
 class DigitalPerformer(Daw):
     type = "Digital Performer"
     supported_features = [DawFeature.NAME_ONLY_MATCH]
+    marker_name_max_length = MARKER_NAME_MAX_LENGTH
 
     def __init__(self) -> None:
         super().__init__()
@@ -24,28 +122,30 @@ class DigitalPerformer(Daw):
         self._connected = threading.Event()
         self._connection_check_lock = threading.Lock()
         self._connection_timeout_counter = 0
-        self.digitalperformer_send_lock = threading.Lock()
-        self.name_to_match = ""
-        self.new_marker_name = ""
         self.is_playing = False
         self.is_recording = False
-        self.transport_state_validated = threading.Event()
-        self.digitalperformer_osc_server = None
         self.markers_to_ignore = [
             "Auto Record Start",
             "Memory Start",
             "Sequence Start",
             "Sequence End",
         ]
-        self._current_track_quantity = 0
-        self._track_quantity_validated = threading.Event()
-        self.digitalperformer_client = None
+        self._dispatcher = dispatcher.Dispatcher()
+        self._dispatcher.set_default_handler(self._message_received)
+        self._connection: Optional[osc_tcp.OscTcpConnection] = None
+        # The marker index holds the markers of this SelList, kept across cues and
+        # replaced when the markers may have changed
+        self._marker_index_lock = threading.Lock()
+        self._sel_list_cookie: Optional[int] = None
+        self._sample_rate: Optional[int] = None
+        self._service_browser: Optional[DigitalPerformerServiceBrowser] = None
         pub.subscribe(
             self._place_marker_with_name, PyPubSubTopics.PLACE_MARKER_WITH_NAME
         )
         pub.subscribe(self._incoming_transport_action, PyPubSubTopics.TRANSPORT_ACTION)
         pub.subscribe(self._handle_cue_load, PyPubSubTopics.HANDLE_CUE_LOAD)
         pub.subscribe(self._shutdown_servers, PyPubSubTopics.SHUTDOWN_SERVERS)
+        pub.subscribe(self._close_service_browser, PyPubSubTopics.SHUTDOWN_SERVERS)
         pub.subscribe(self._shutdown_server_event.set, PyPubSubTopics.SHUTDOWN_SERVERS)
         pub.subscribe(self._incoming_armed_action, PyPubSubTopics.ARMED_ACTION)
 
@@ -54,6 +154,9 @@ class DigitalPerformer(Daw):
     ) -> None:
         logger.info("Starting Digital Performer Connection threads")
         self._shutdown_server_event.clear()
+        if self._service_browser is None:
+            self._service_browser = DigitalPerformerServiceBrowser()
+            self._service_browser.start()
         start_managed_thread(
             "daw_connection_thread", self._build_digitalperformer_osc_servers
         )
@@ -76,71 +179,47 @@ class DigitalPerformer(Daw):
                     )
                     self._connection_timeout_counter = 0
 
-    def _get_current_digital_performer_osc_port(self):
-        zeroconf_type = "_osc._tcp.local."
-        zeroconf_name = "Digital Performer OSC"
-        with Zeroconf() as zc:
-            info = None
-            while not info and not self._shutdown_server_event.is_set():
-                try:
-                    full_name = zeroconf_name + "." + zeroconf_type
-                    info = ServiceInfo(zeroconf_type, full_name)
-                    success = info.request(zc, timeout=1.0)
-                    if not success:
-                        logger.info("No Digital Performer instance running.")
-                        time.sleep(1)
-                        info = None
-                except Exception as e:
-                    logger.error(f"Zeroconf error: {e}")
-                    time.sleep(1)
-
-            dp_port = info.port
-            logger.info(f"Digital Performer's OSC server can be found at: {dp_port}")
-            return dp_port
+    def _get_current_digital_performer_osc_port(self) -> Optional[int]:
+        if self._service_browser is None:
+            return None
+        return self._service_browser.get_port(self._shutdown_server_event)
 
     def _build_digitalperformer_osc_servers(self) -> None:
         # Connect to Digital Performer via OSC
         logger.info("Starting Digital Performer OSC server")
         while not self._shutdown_server_event.is_set():
+            dp_port = self._get_current_digital_performer_osc_port()
+            if dp_port is None:
+                break
+            connection = osc_tcp.OscTcpConnection(
+                constants.IP_LOOPBACK,
+                dp_port,
+                self._dispatcher,
+                mode=osc_tcp.MODE_1_0,
+                request_timeout=REQUEST_TIMEOUT_SECONDS,
+            )
             try:
-                self.digitalperformer_client = tcp_client.TCPDispatchClient(
-                    constants.IP_LOOPBACK,
-                    self._get_current_digital_performer_osc_port(),
-                    mode="1.0",
-                )
-                self._receive_digitalperformer_OSC()
+                connection.connect()
+                self._connection = connection
                 self._connected.set()
-            except Exception:
+                self._refresh_control_surfaces()
+                connection.handle_messages(self._shutdown_server_event)
+            except OSError as e:
+                if self._shutdown_server_event.is_set():
+                    break
+                logger.warning(f"Lost the connection to Digital Performer: {e}")
+                self._connected.clear()
                 time.sleep(constants.CONNECTION_RECONNECTION_DELAY_SECONDS)
-            while (
-                not self._shutdown_server_event.is_set()
-            ) and self._connected.is_set():
-                try:
-                    self._refresh_control_surfaces()
-                    while not self._shutdown_server_event.is_set():
-                        self.digitalperformer_client.handle_messages(
-                            constants.MESSAGE_TIMEOUT_SECONDS
-                        )
-                except Exception:
-                    time.sleep(constants.CONNECTION_RECONNECTION_DELAY_SECONDS)
-
-    def _receive_digitalperformer_OSC(self) -> None:
-        # Receives and distributes OSC from Digital Performer, based on matching OSC values
-        self.digitalperformer_client.dispatcher.map(
-            "/MarkersSelList/SelList_Ready", self._marker_matcher
-        )
-        self.digitalperformer_client.dispatcher.map(
-            "/TransportState/Get", self._current_transport_state
-        )
-        self.digitalperformer_client.dispatcher.map(
-            "/Get_Time", self._place_marker_at_time
-        )
-        self.digitalperformer_client.dispatcher.map(
-            "/TrackList/Get", self._set_current_track_quantity
-        )
-        self.digitalperformer_client.dispatcher.set_default_handler(
-            self._message_received
-        )
+            finally:
+                if self._connection is connection:
+                    self._connection = None
+                connection.close()
+                # SelLists don't outlive the connection they were made on
+                with self._marker_index_lock:
+                    self._sel_list_cookie = None
+                    self._marker_index.clear()
+                # A different project may be open once DP is back
+                self._sample_rate = None
 
     def _message_received(self, *_) -> None:
         if not self._connected.is_set():
@@ -149,52 +228,86 @@ class DigitalPerformer(Daw):
         with self._connection_check_lock:
             self._connection_timeout_counter = 0
 
-    def _marker_matcher(self, osc_address: str, *args) -> None:
-        from app_settings import settings
-
-        sel_list_cookie = int(args[0])
-        marker_qty = int(args[2])
-
-        for i in range(3, marker_qty + 3):
-            max_length = 36
-            test_name = args[i]
+    def _get_connection(self) -> osc_tcp.OscTcpConnection:
+        connection = self._connection
+        if connection is None:
+            raise ConnectionError("Not connected to Digital Performer")
+        return connection
+
+    def _request(
+        self, address: str, value: Any = None, reply_address: Optional[str] = None
+    ) -> osc_codec.DecodedMessage:
+        """Sends a request and waits for its reply. Raises TimeoutError if the
+        reply doesn't arrive in time, or OSError if the connection is down."""
+        sent_time = time.monotonic()
+        reply: "Future[osc_codec.DecodedMessage]" = self._get_connection().request(
+            address, value, reply_address
+        )
+        # The connection fails the future once its deadline passes
+        message = reply.result(REQUEST_TIMEOUT_SECONDS + osc_tcp.RECEIVE_POLL_SECONDS)
+        latency = time.monotonic() - sent_time
+        logger.debug(f"{address} was answered in {latency * 1000:.1f} ms")
+        return message
+
+    def _send_message(self, address: str, value: Any = None) -> None:
+        self._get_connection().send_message(address, value)
+
+    def _refresh_marker_index(self) -> int:
+        """Fills the marker index from a new SelList of all the markers in the
+        project, returning its cookie. Must be called with the marker index lock
+        held."""
+        self._discard_marker_index()
+        start_time = time.monotonic()
+        marker_reply = self._request(
+            "/MarkersSelList/Get_NewSelList",
+            reply_address="/MarkersSelList/SelList_Ready",
+        )
+        sel_list_cookie = int(marker_reply.params[0])
+        marker_qty = int(marker_reply.params[2])
+        ignored_prefixes = tuple(self.markers_to_ignore)
+        for marker_id, marker_name in enumerate(
+            marker_reply.params[3 : marker_qty + 3]
+        ):
             # Remove the timestamp at the end of the name that DP returns
-            test_list = test_name.split("\t")
-            test_name = test_list[0]
-            test_name = test_name[:max_length]
-
-            if not test_name.startswith(tuple(self.markers_to_ignore)):
-                if settings.name_only_match:
-                    try:
-                        test_name = test_name.split(" ")
-                        # Remove string slices from max_length to deal with removed number
-                        max_length = max_length - len(test_name[0])
-                        test_name = test_name[1:]
-                        test_name = " ".join(test_name)
-                    except Exception as e:
-                        logger.error(f"Unable to format string for name only match:{e}")
-                # DP will only build OSC markers that are 36 characters of text or shorter, so slice matching string
-                if test_name == self.name_to_match[:max_length]:
-                    self._goto_marker_by_id(sel_list_cookie, i - 3)
-                    break
+            marker_name = marker_name.split("\t")[0]
+            if not marker_name.startswith(ignored_prefixes):
+                self._marker_index.add(marker_id, marker_name)
+        self._sel_list_cookie = sel_list_cookie
+        logger.info(
+            f"Indexed {len(self._marker_index)} Digital Performer markers "
+            f"in {(time.monotonic() - start_time) * 1000:.1f} ms"
+        )
+        return sel_list_cookie
 
-        # Sel List must be deleted after use
-        with self.digitalperformer_send_lock:
-            self.digitalperformer_client.send_message(
-                "/SelList_Delete", sel_list_cookie
-            )
+    def _discard_marker_index(self) -> None:
+        # Must be called with the marker index lock held
+        sel_list_cookie, self._sel_list_cookie = self._sel_list_cookie, None
+        self._marker_index.clear()
+        if sel_list_cookie is not None:
+            try:
+                # Sel List must be deleted after use
+                self._send_message("/SelList_Delete", sel_list_cookie)
+            except OSError as e:
+                logger.debug(f"Unable to delete a Digital Performer SelList: {e}")
 
-    def _update_current_transport_state(self) -> None:
-        with self.digitalperformer_send_lock:
-            self.digitalperformer_client.send_message("/TransportState/Get", None)
+    def _invalidate_marker_index(self) -> None:
+        with self._marker_index_lock:
+            self._discard_marker_index()
 
-    def _update_track_quantity(self) -> None:
-        with self.digitalperformer_send_lock:
-            self.digitalperformer_client.send_message("/TrackList/Get", None)
+    def _refresh_transport_state(self) -> None:
+        try:
+            reply = self._request("/TransportState/Get")
+        except (OSError, TimeoutError) as e:
+            logger.warning(
+                f"Unable to get the Digital Performer transport state, "
+                f"using the last known state: {e}"
+            )
+            return
+        self._current_transport_state(reply.address, *reply.params)
 
-    def _set_current_track_quantity(self, osc_address: str, track_qty: int) -> None:
-        self._track_quantity_validated.set()
-        self._current_track_quantity = track_qty
+    def _get_track_quantity(self) -> int:
+        reply = self._request("/TrackList/Get")
+        return int(reply.params[0])
 
     def _current_transport_state(self, osc_address: str, val) -> None:
         # Watches what the Digital Performer playhead is doing.
@@ -222,80 +335,124 @@ class DigitalPerformer(Daw):
         elif recording is False:
             self.is_recording = False
             logger.info("Digital Performer is not recording")
-        self.transport_state_validated.set()
 
     def _refresh_control_surfaces(self) -> None:
-        if self.digitalperformer_client is not None:
-            with self.digitalperformer_send_lock:
-                # Use the API version response as a keep alive
-                try:
-                    self.digitalperformer_client.send_message("/API_Version/Get", None)
-                except BrokenPipeError:
-                    self._connected.clear()
-                    self._shutdown_servers()
+        connection = self._connection
+        if connection is not None:
+            # Use the API version response as a keep alive
+            try:
+                connection.send_message("/API_Version/Get", None)
+            except OSError:
+                # Wakes the connection thread, which reconnects
+                self._connected.clear()
+                connection.close()
 
     def _goto_marker_by_id(self, list_cookie: int, marker_id: int) -> None:
-        with self.digitalperformer_send_lock:
-            # Selecting a marker in a SelList moves the playhead to that location
-            self.digitalperformer_client.send_message(
-                "/SelList_Set", [list_cookie, marker_id]
-            )
+        # Selecting a marker in a SelList moves the playhead to that location
+        self._send_message("/SelList_Set", [list_cookie, marker_id])
 
     @overload
     def _place_marker_with_name(self, marker_name: str) -> None:
         pass
 
     @overload
-    def _place_marker_with_name(self, marker_name: str, as_thread: bool = True) -> None:
+    def _place_marker_with_name(
+        self,
+        marker_name: str,
+        as_thread: bool = True,
+        arrival_time: Optional[float] = None,
+    ) -> None:
         pass
 
-    def _place_marker_with_name(self, marker_name: str, as_thread: bool = True) -> None:
+    def _place_marker_with_name(
+        self,
+        marker_name: str,
+        as_thread: bool = True,
+        arrival_time: Optional[float] = None,
+    ) -> None:
         if as_thread:
             threading.Thread(
-                target=self._place_marker_with_name, args=(marker_name, False)
+                target=self._place_marker_with_name,
+                args=(marker_name, False, arrival_time),
             ).start()
             return
-        with self.digitalperformer_send_lock:
-            self.new_marker_name = marker_name
-            # Get our current playhead time in samples
-            self.digitalperformer_client.send_message("/Get_Time", 6)
+        try:
+            # Get our current playhead time in samples. Each placement waits on its
+            # own reply, so overlapping cues keep their own names.
+            cur_pos, sampled_time, residual = self._get_playhead_samples()
+            delay = self._get_cue_delay(arrival_time, sampled_time)
+            sample_rate = (
+                self._get_sample_rate(cur_pos, sampled_time) if delay else None
+            )
+        except (OSError, TimeoutError, IndexError) as e:
+            logger.error(f"Unable to resolve current playhead time: {e}")
+            return
+        if sample_rate is not None and delay:
+            # Move the marker back to when the cue arrived
+            cur_pos = max(0.0, cur_pos - delay * sample_rate)
+        try:
+            msg = osc_message_builder.OscMessageBuilder(address="/MakeMarker")
+            # Arg1 value 6 indicates we want to work in samples
+            msg.add_arg(6)
+            # Arg2 is the position, it must be sent as a double, not float
+            msg.add_arg(cur_pos, arg_type="d")
+            msg.add_arg(marker_name)
+            self._get_connection().send(msg.build().dgram)
+        except OSError as e:
+            logger.error(f"Unable to place marker for cue {marker_name}: {e}")
+            return
+        self._invalidate_marker_index()
+        self._log_marker_placement(
+            marker_name, delay, residual if sample_rate is not None else None
+        )
 
-    def _place_marker_at_time(self, osc_address: str, *args) -> None:
-        if osc_address == "/Get_Time":
-            try:
-                cur_pos = args[0]
-                with self.digitalperformer_send_lock:
-                    msg = osc_message_builder.OscMessageBuilder(address="/MakeMarker")
-                    # Arg1 value 6 indicates we want to work in samples
-                    msg.add_arg(6)
-                    # Arg2 is the position, it must be sent as a double, not float
-                    msg.add_arg(cur_pos, arg_type="d")
-                    msg.add_arg(self.new_marker_name)
-                    osc_message = msg.build()
-                    self.digitalperformer_client.send(osc_message)
-            except Exception as e:
-                logger.error(f"Unable to resolve current playhead time: {e}")
-            logger.info(f"Placed marker for cue: {self.new_marker_name}")
+    def _get_playhead_samples(self) -> Tuple[float, float, float]:
+        """Returns the playhead position in samples, when it was read, and how far
+        either side of that it could have been read"""
+        request_time = time.monotonic()
+        samples = self._request("/Get_Time", 6).params[0]
+        reply_time = time.monotonic()
+        return samples, (request_time + reply_time) / 2, (reply_time - request_time) / 2
+
+    def _get_sample_rate(self, samples: float, sampled_time: float) -> Optional[int]:
+        """Returns the project's sample rate, measured against a second reading of
+        the playhead the first time it's needed. The playhead must be moving."""
+        if self._sample_rate is None:
+            if self._shutdown_server_event.wait(SAMPLE_RATE_PROBE_SECONDS):
+                return None
+            later_samples, later_sampled_time, _ = self._get_playhead_samples()
+            measured_rate = (later_samples - samples) / (
+                later_sampled_time - sampled_time
+            )
+            sample_rate = min(SAMPLE_RATES, key=lambda rate: abs(rate - measured_rate))
+            if abs(sample_rate - measured_rate) <= sample_rate * SAMPLE_RATE_TOLERANCE:
+                self._sample_rate = sample_rate
+            else:
+                logger.warning(
+                    f"Unable to measure the Digital Performer sample rate, "
+                    f"the playhead moved at {measured_rate:.0f} samples per second"
+                )
+        return self._sample_rate
 
     def get_marker_id_by_name(self, name: str) -> None:
-        # Asks for current marker information based upon number of markers.
+        # Looks the cue up in the marker index, refreshing it if the cue isn't there
         from app_settings import settings
 
-        self.transport_state_validated.wait()
         if (not self.is_playing) or settings.allow_loading_while_playing:
-            self.name_to_match = name
-            if settings.name_only_match:
-                try:
-                    self.name_to_match = self.name_to_match.split(" ")
-                    self.name_to_match = self.name_to_match[1:]
-                    self.name_to_match = " ".join(self.name_to_match)
-                except Exception as e:
-                    logger.error(f"Unable to format incoming cue string{e}")
-            with self.digitalperformer_send_lock:
-                # Request the list of all markers currently in project
-                self.digitalperformer_client.send_message(
-                    "/MarkersSelList/Get_NewSelList", None
-                )
+            try:
+                with self._marker_index_lock:
+                    sel_list_cookie = self._sel_list_cookie
+                    marker = None
+                    if sel_list_cookie is not None:
+                        marker = self._marker_index.find(name, settings.name_only_match)
+                    if marker is None:
+                        # The marker may have been added since the index was made
+                        sel_list_cookie = self._refresh_marker_index()
+                        marker = self._marker_index.find(name, settings.name_only_match)
+                    if marker is not None:
+                        self._goto_marker_by_id(sel_list_cookie, marker.marker_id)
+            except (OSError, TimeoutError, IndexError, ValueError) as e:
+                logger.error(f"Unable to get the Digital Performer markers: {e}")
 
     def _incoming_transport_action(self, transport_action: TransportAction) -> None:
         try:
@@ -318,32 +475,29 @@ class DigitalPerformer(Daw):
             logger.error(f"Error processing armed macros: {e}")
 
     def _digitalperformer_arm_all(self) -> None:
-        self._update_track_quantity()
-        self._track_quantity_validated.wait()
-        for i in range(0, self._current_track_quantity):
-            with self.digitalperformer_send_lock:
-                self.digitalperformer_client.send_message(
-                    f"/TrackList/{i}/RecordEnable", 1
-                )
-        self._track_quantity_validated.clear()
+        self._set_all_tracks_record_enabled(1)
 
     def _digitalperformer_disarm_all(self) -> None:
-        self._update_track_quantity()
-        self._track_quantity_validated.wait()
-        for i in range(0, self._current_track_quantity):
-            with self.digitalperformer_send_lock:
-                self.digitalperformer_client.send_message(
-                    f"/TrackList/{i}/RecordEnable", 0
-                )
-        self._track_quantity_validated.clear()
+        self._set_all_tracks_record_enabled(0)
+
+    def _set_all_tracks_record_enabled(self, record_enable: int) -> None:
+        start_time = time.monotonic()
+        track_quantity = self._get_track_quantity()
+        # One bundle for every track, rather than a message each
+        self._get_connection().send_bundle(
+            (f"/TrackList/{i}/RecordEnable", record_enable)
+            for i in range(track_quantity)
+        )
+        logger.info(
+            f"Set record enable to {record_enable} on {track_quantity} tracks "
+            f"in {(time.monotonic() - start_time) * 1000:.1f} ms"
+        )
 
     def _digitalperformer_play(self) -> None:
-        with self.digitalperformer_send_lock:
-            self.digitalperformer_client.send_message("/TransportState", 2)
+        self._send_message("/TransportState", 2)
 
     def _digitalperformer_stop(self) -> None:
-        with self.digitalperformer_send_lock:
-            self.digitalperformer_client.send_message("/TransportState", 0)
+        self._send_message("/TransportState", 0)
 
     def _digitalperformer_rec(self) -> None:
         from app_settings import settings
@@ -352,27 +506,31 @@ class DigitalPerformer(Daw):
         pub.sendMessage(
             PyPubSubTopics.CHANGE_PLAYBACK_STATE, selected_mode=PlaybackState.RECORDING
         )
-        with self.digitalperformer_send_lock:
-            self.digitalperformer_client.send_message("/TransportState", 4)
+        self._send_message("/TransportState", 4)
 
-    def _handle_cue_load(self, cue: str) -> None:
+    def _handle_cue_load(self, cue: str, arrival_time: Optional[float] = None) -> None:
         from app_settings import settings
 
-        self._update_current_transport_state()
-        self.transport_state_validated.clear()
+        self._refresh_transport_state()
         if (
             settings.marker_mode is PlaybackState.RECORDING
             and self.is_recording is True
         ):
-            self._place_marker_with_name(cue)
+            self._place_marker_with_name(cue, arrival_time=arrival_time)
         elif settings.marker_mode is PlaybackState.PLAYBACK_TRACK:
             self.get_marker_id_by_name(cue)
 
     def _shutdown_servers(self) -> None:
         try:
-            if self.digitalperformer_client:
-                self.digitalperformer_client.close()
-                self.digitalperformer_client = None
+            connection, self._connection = self._connection, None
+            if connection:
+                connection.close()
             logger.info("Digital Performer OSC Server shutdown completed")
         except Exception as e:
             logger.error(f"Error shutting down Digital Performer server: {e}")
+
+    def _close_service_browser(self) -> None:
+        # Kept open across reconnects, so a restarted Digital Performer is found at once
+        if self._service_browser is not None:
+            self._service_browser.close()
+            self._service_browser = None
@@ -0,0 +1,172 @@
+import os
+import re
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import psutil
+from pubsub import pub
+
+from constants import PyPubSubTopics
+from logger_config import logger
+
+# One sampler of the running processes, shared by everything that needs to find
+# a DAW's process. Samples only read process names, the executable is read when a
+# process is looked up. Lookups reuse a sample taken within the check interval,
+# and processes are only sampled in the background while a name is watched.
+
+# Lower bound for the process_check_interval setting
+MINIMUM_CHECK_INTERVAL_SECONDS = 0.5
+
+
+def get_process_name(name: str) -> str:
+    """Returns a process name without its extension, in lower case"""
+    return os.path.splitext(name)[0].lower()
+
+
+class ProcessInfo:
+    """A running process. Names are matched with get_process_name() applied."""
+
+    __slots__ = ("name", "pid", "_exe")
+
+    def __init__(self, name: str, pid: int) -> None:
+        self.name = name
+        self.pid = pid
+        self._exe: Optional[str] = None
+
+    @property
+    def exe(self) -> Optional[str]:
+        """The path to the executable, or None if it can't be read"""
+        if self._exe is None:
+            try:
+                self._exe = psutil.Process(self.pid).exe()
+            except psutil.Error as e:
+                logger.debug(f"Unable to get the executable of {self.name}: {e}")
+        return self._exe
+
+    def matches(self, pattern: str) -> bool:
+        """Returns whether the whole name matches the regular expression"""
+        return re.fullmatch(pattern, self.name) is not None
+
+
+class ProcessWatcher:
+    """Shared table of running processes by name. While a name pattern is
+    watched, processes are sampled in the background and PROCESS_STARTED and
+    PROCESS_EXITED are sent for the processes that match it."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        # Held while sampling, so callers arriving together share one sample
+        self._sample_lock = threading.Lock()
+        self._processes: Dict[int, ProcessInfo] = {}
+        self._processes_by_name: Dict[str, List[ProcessInfo]] = {}
+        self._sample_time: Optional[float] = None
+        # Number of watchers of each pattern
+        self._watched: Dict[str, int] = {}
+        self._thread: Optional[threading.Thread] = None
+
+    def get_processes(self, pattern: str) -> List[ProcessInfo]:
+        """Returns the running processes whose name matches the pattern"""
+        self._sample_and_send(max_age=self._get_check_interval())
+        with self._lock:
+            return [
+                process
+                for name, processes in self._processes_by_name.items()
+                if re.fullmatch(pattern, name)
+                for process in processes
+            ]
+
+    def watch(self, pattern: str) -> None:
+        """Starts sending process events for the pattern, until unwatch() is
+        called as many times as watch() was"""
+        with self._lock:
+            self._watched[pattern] = self._watched.get(pattern, 0) + 1
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._watch_processes, daemon=True
+                )
+                self._thread.start()
+
+    def unwatch(self, pattern: str) -> None:
+        with self._lock:
+            watchers = self._watched.get(pattern, 0) - 1
+            if watchers > 0:
+                self._watched[pattern] = watchers
+            else:
+                self._watched.pop(pattern, None)
+
+    def _watch_processes(self) -> None:
+        while True:
+            self._sample_and_send()
+            with self._lock:
+                if not self._watched:
+                    self._thread = None
+                    return
+            time.sleep(self._get_check_interval())
+
+    @staticmethod
+    def _get_check_interval() -> float:
+        from app_settings import settings
+
+        return max(MINIMUM_CHECK_INTERVAL_SECONDS, settings.process_check_interval)
+
+    def _sample_and_send(self, max_age: Optional[float] = None) -> None:
+        with self._sample_lock:
+            if (
+                max_age is not None
+                and self._sample_time is not None
+                and time.monotonic() - self._sample_time < max_age
+            ):
+                return
+            started, exited = self._sample()
+        # Sent without the locks, so listeners can look up processes
+        for process in started:
+            pub.sendMessage(PyPubSubTopics.PROCESS_STARTED, process=process)
+        for process in exited:
+            pub.sendMessage(PyPubSubTopics.PROCESS_EXITED, process=process)
+
+    def _sample(self) -> Tuple[List[ProcessInfo], List[ProcessInfo]]:
+        """Updates the table, returning the watched processes that have started
+        and exited since the last sample"""
+        start_time = time.monotonic()
+        old_processes = self._processes
+        processes: Dict[int, ProcessInfo] = {}
+        processes_by_name: Dict[str, List[ProcessInfo]] = {}
+        for sampled in psutil.process_iter(["name"]):
+            if not sampled.info["name"]:
+                continue
+            name = get_process_name(sampled.info["name"])
+            process = old_processes.get(sampled.pid)
+            # Keep the executable already read for the process
+            if process is None or process.name != name:
+                process = ProcessInfo(name, sampled.pid)
+            processes[sampled.pid] = process
+            processes_by_name.setdefault(name, []).append(process)
+        with self._lock:
+            first_sample = self._sample_time is None
+            self._processes = processes
+            self._processes_by_name = processes_by_name
+            self._sample_time = time.monotonic()
+            watched = list(self._watched)
+        logger.debug(
+            f"Sampled {len(processes)} processes in "
+            f"{(time.monotonic() - start_time) * 1000:.1f} ms"
+        )
+        if first_sample or not watched:
+            return [], []
+        started = [
+            process
+            for pid, process in processes.items()
+            if old_processes.get(pid) is not process
+            and any(process.matches(pattern) for pattern in watched)
+        ]
+        exited = [
+            process
+            for pid, process in old_processes.items()
+            if processes.get(pid) is not process
+            and any(process.matches(pattern) for pattern in watched)
+        ]
+        return started, exited
+
+
+process_watcher = ProcessWatcher()
@@ -1,6 +1,19 @@
 import threading
 import time
-from typing import Any, Callable, overload
+from collections import deque
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from contextlib import contextmanager
+from typing import (
+    Any,
+    Callable,
+    Deque,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    overload,
+)
 
 import grpc
 import grpc._channel
@@ -15,17 +28,193 @@ from logger_config import logger
 
 from . import Daw, DawFeature
 
+# How often to check Pro Tools for memory locations added or changed by the user
+MEMORY_LOCATION_CHECK_SECONDS = 2.0
+# How often to refresh the cached transport state, and how old it can get before
+# a cue has to ask Pro Tools directly
+TRANSPORT_STATE_REFRESH_SECONDS = 0.2
+TRANSPORT_STATE_MAX_AGE_SECONDS = 1.0
+# Most tracks to arm or disarm in one call, so cues aren't held up behind a large
+# session
+TRACK_RECORD_ENABLE_CHUNK_SIZE = 64
+# Delay between connection attempts, doubling after each failure
+RECONNECT_INITIAL_DELAY_SECONDS = 1.0
+RECONNECT_MAX_DELAY_SECONDS = 8.0
+# How long macros and marker placement wait for Pro Tools to reconnect. Cues
+# that arrive while it's disconnected are dropped straight away.
+CONNECTION_WAIT_SECONDS = constants.CONNECTION_TIMEOUT_SECONDS
+
+
+class ProToolsNotConnected(ConnectionError):
+    """Raised when a command can't be sent because Pro Tools isn't connected"""
+
+
+class _TimedEngine:
+    """Wraps a PTSL engine, timing each RPC made through it"""
+
+    def __init__(self, engine: ptsl.engine.Engine, latencies: Deque[float]) -> None:
+        self._engine = engine
+        self._latencies = latencies
+
+    def __getattr__(self, name: str) -> Any:
+        attribute = getattr(self._engine, name)
+        if not callable(attribute):
+            return attribute
+
+        def timed_rpc(*args, **kwargs) -> Any:
+            start_time = time.monotonic()
+            try:
+                return attribute(*args, **kwargs)
+            finally:
+                latency = time.monotonic() - start_time
+                self._latencies.append(latency)
+                logger.debug(f"PTSL {name} took {latency * 1000:.1f} ms")
+
+        return timed_rpc
+
+
+class ProToolsConnection:
+    """Owns the connection to Pro Tools' PTSL scripting interface. It reconnects
+    with backoff on its own thread, and serializes the commands sent to Pro Tools
+    through session()."""
+
+    def __init__(self, on_disconnected: Callable[[], None]) -> None:
+        self._on_disconnected = on_disconnected
+        self._send_lock = threading.Lock()
+        self._state_lock = threading.Lock()
+        self._engine: Optional[ptsl.engine.Engine] = None
+        self._ready: Future = Future()
+        self._disconnected = threading.Event()
+        self._disconnected.set()
+        self._disconnected_time = time.monotonic()
+        # Time taken to (re)connect, and round trip times of recent RPCs, in seconds
+        self.reconnect_times: Deque[float] = deque(maxlen=20)
+        self.rpc_latencies: Deque[float] = deque(maxlen=100)
+
+    @property
+    def ready(self) -> Future:
+        """A future that resolves once Pro Tools is connected"""
+        with self._state_lock:
+            return self._ready
+
+    def is_connected(self) -> bool:
+        return self.ready.done()
+
+    def run(self, stop_event: threading.Event) -> None:
+        # Open a connection to Pro Tools using the PTSL scripting interface, and
+        # open it again whenever it's lost
+        delay = RECONNECT_INITIAL_DELAY_SECONDS
+        while not stop_event.is_set():
+            if not self._disconnected.wait(constants.MESSAGE_TIMEOUT_SECONDS):
+                continue
+            try:
+                self._connect()
+            except Exception as e:
+                logger.error(
+                    f"Unable to connect to Pro Tools. Retrying in {delay:.0f} seconds"
+                )
+                logger.debug(f"Pro Tools connection error: {e}")
+                stop_event.wait(delay)
+                delay = min(delay * 2, RECONNECT_MAX_DELAY_SECONDS)
+                continue
+            delay = RECONNECT_INITIAL_DELAY_SECONDS
+
+    def _connect(self) -> None:
+        engine = ptsl.engine.Engine(
+            company_name=constants.APPLICATION_AUTHOR,
+            application_name=constants.APPLICATION_NAME,
+        )
+        ptsl_version = engine.ptsl_version()
+        with self._state_lock:
+            self._engine = engine
+            self._disconnected.clear()
+            reconnect_time = time.monotonic() - self._disconnected_time
+            ready = self._ready
+        self.reconnect_times.append(reconnect_time)
+        logger.info(
+            f"Connection established to Pro Tools in {reconnect_time:.1f} seconds, PTSL Version {ptsl_version}"
+        )
+        pub.sendMessage(PyPubSubTopics.DAW_CONNECTION_STATUS, connected=True)
+        ready.set_result(None)
+        # Subscribe to the channel connectivity status
+        engine.client.channel.subscribe(
+            lambda status: self._on_connectivity_status(engine, status)
+        )
+
+    def _on_connectivity_status(
+        self, engine: ptsl.engine.Engine, status: ChannelConnectivity
+    ) -> None:
+        if status is not ChannelConnectivity.READY:
+            self.mark_disconnected(engine)
+
+    def mark_disconnected(self, engine: Optional[ptsl.engine.Engine] = None) -> None:
+        """Drops the engine, and wakes the connection thread to reconnect. If an
+        engine is given, only it is dropped, so stale channels can't disconnect a
+        newer connection."""
+        with self._state_lock:
+            if self._disconnected.is_set():
+                return
+            if engine is not None and engine is not self._engine:
+                return
+            # Clear the engine connection so further messages can't be sent
+            # since this makes the app hang and gRPC gets mad
+            self._engine = None
+            self._ready = Future()
+            self._disconnected_time = time.monotonic()
+            self._disconnected.set()
+        logger.error("Pro Tools connection lost, Retrying connection")
+        pub.sendMessage(PyPubSubTopics.DAW_CONNECTION_STATUS, connected=False)
+        self._on_disconnected()
+
+    @contextmanager
+    def session(self, timeout: float = 0) -> Iterator[_TimedEngine]:
+        """Holds the send lock and yields the engine. Waits up to timeout seconds
+        for Pro Tools to connect, raising ProToolsNotConnected if it doesn't, or if
+        the connection is lost during the session."""
+        try:
+            self.ready.result(timeout)
+        except FutureTimeoutError:
+            raise ProToolsNotConnected("Pro Tools is not connected") from None
+        with self._send_lock:
+            engine = self._engine
+            if engine is None:
+                raise ProToolsNotConnected("Pro Tools is not connected")
+            try:
+                yield _TimedEngine(engine, self.rpc_latencies)
+            except grpc._channel._InactiveRpcError as e:
+                self.mark_disconnected(engine)
+                raise ProToolsNotConnected("Pro Tools connection lost") from e
+
+    def close(self) -> None:
+        with self._state_lock:
+            engine, self._engine = self._engine, None
+        if engine is not None:
+            engine.close()
+            logger.info("Disconnected from Pro Tools")
+
 
 class ProTools(Daw):
     type = "ProTools"
     supported_features = [DawFeature.NAME_ONLY_MATCH]
+    # Later locations win, as they did when every location was jumped to in turn
+    prefer_last_marker = True
 
     def __init__(self):
         super().__init__()
         self._shutdown_server_event = threading.Event()
-        self.connected = threading.Event()
-        self.pt_engine_connection = None
-        self.pt_send_lock = threading.Lock()
+        self._connection = ProToolsConnection(on_disconnected=self._connection_lost)
+        # Guards the marker index, which holds memory locations by number
+        self._memory_locations_lock = threading.Lock()
+        self._memory_locations_fingerprint: Optional[Tuple[Any, ...]] = None
+        self._transport_lock = threading.Lock()
+        self._transport_state: Optional[str] = None
+        self._transport_armed: Optional[bool] = None
+        self._transport_updated = 0.0
+        self._tracks_lock = threading.Lock()
+        # Names of the audio and MIDI tracks, fetched when first armed or disarmed
+        self._recordable_track_names: Optional[List[str]] = None
+        self._session_name: Optional[str] = None
+        self._sample_rate: Optional[int] = None
         pub.subscribe(
             self._place_marker_with_name, PyPubSubTopics.PLACE_MARKER_WITH_NAME
         )
@@ -39,100 +228,223 @@ class ProTools(Daw):
         self, start_managed_thread: Callable[[str, Any], None]
     ) -> None:
         logger.info("Starting Pro Tools Connection thread")
-        start_managed_thread("daw_connection_thread", self._open_protools_connection)
+        start_managed_thread("daw_connection_thread", self._connection.run)
+        start_managed_thread(
+            "daw_memory_location_thread", self._memory_location_check_thread
+        )
+        start_managed_thread("daw_transport_thread", self._transport_state_thread)
 
-    def _open_protools_connection(self) -> None:
-        # Open a connection to Pro Tools using the PTSL scripting interface
-        while not self._shutdown_server_event.is_set():
-            try:
-                self.pt_engine_connection = ptsl.engine.Engine(
-                    company_name=constants.APPLICATION_AUTHOR,
-                    application_name=constants.APPLICATION_NAME,
-                )
-                if self.pt_engine_connection is not None:
-                    logger.info(
-                        f"Connection established to Pro Tools, PTSL Version {self.pt_engine_connection.ptsl_version()}"
-                    )
-                    pub.sendMessage(
-                        PyPubSubTopics.DAW_CONNECTION_STATUS, connected=True
-                    )
-                    self.connected.set()
-                    # Subscribe to the channel connectivity status
-                    self.pt_engine_connection.client.channel.subscribe(
-                        self._on_connectivity_status
-                    )
-                    # Loop until the server is disconnected or restarted
-                    while (
-                        self.connected.is_set()
-                        and not self._shutdown_server_event.is_set()
-                    ):
-                        time.sleep(constants.MESSAGE_TIMEOUT_SECONDS)
-            except Exception:
-                logger.error("Unable to connect to Pro Tools. Retrying in 1 second")
-                time.sleep(1)
-
-    def _on_connectivity_status(self, status: ChannelConnectivity) -> None:
-        if status is not ChannelConnectivity.READY:
-            pub.sendMessage(PyPubSubTopics.DAW_CONNECTION_STATUS, connected=False)
-            self.connected.clear()
-            # Clear the engine connection so further messages can't be sent
-            # since this makes the app hang and gRPC gets mad
-            with self.pt_send_lock:
-                self.pt_engine_connection = None
+    def _connection_lost(self) -> None:
+        # Pro Tools may come back with a different session open
+        self._set_transport_state(None, None)
+        self._invalidate_tracks()
+        self._session_name = None
+        self._sample_rate = None
 
     @overload
     def _place_marker_with_name(self, marker_name: str) -> None:
         pass
 
     @overload
-    def _place_marker_with_name(self, marker_name: str, as_thread: bool = True) -> None:
+    def _place_marker_with_name(
+        self,
+        marker_name: str,
+        as_thread: bool = True,
+        arrival_time: Optional[float] = None,
+    ) -> None:
         pass
 
-    def _place_marker_with_name(self, marker_name: str, as_thread: bool = True) -> None:
+    def _place_marker_with_name(
+        self,
+        marker_name: str,
+        as_thread: bool = True,
+        arrival_time: Optional[float] = None,
+    ) -> None:
         if as_thread:
             threading.Thread(
-                target=self._place_marker_with_name, args=(marker_name, False)
+                target=self._place_marker_with_name,
+                args=(marker_name, False, arrival_time),
             ).start()
             return
-        with self.pt_send_lock:
-            assert self.pt_engine_connection
+        try:
+            with self._connection.session(CONNECTION_WAIT_SECONDS) as engine:
+                request_time = time.monotonic()
+                try:
+                    print(f"Creating marker: {marker_name}")
+                    engine.create_memory_location(
+                        memory_number=-1,
+                        start_time="cur_pos",
+                        name=marker_name,
+                        location="MLC_MainRuler",
+                    )
+                    # -1 seems to be a magic number for the next available memory_number.
+                except ptsl.errors.CommandError as e:
+                    if e.error_type == pt.PT_InvalidParameter:
+                        logger.error("Bad parameter input to create_memory_location")
+                created_time = time.monotonic()
+                try:
+                    new_memory_locs = self._refresh_memory_locations(engine)
+                    for new_memory_loc in new_memory_locs:
+                        if new_memory_loc.name == marker_name:
+                            break
+                    else:
+                        if not new_memory_locs:
+                            return
+                        # Pro Tools didn't keep the name, so set it on the new location
+                        new_memory_loc = new_memory_locs[-1]
+                    # Pro Tools read the playhead somewhere during the create call
+                    delay = self._get_cue_delay(
+                        arrival_time, (request_time + created_time) / 2
+                    )
+                    start_time = self._get_compensated_start_time(
+                        engine, new_memory_loc, delay
+                    )
+                    if (
+                        new_memory_loc.name != marker_name
+                        or start_time != new_memory_loc.start_time
+                    ):
+                        self._edit_memory_location(
+                            engine, new_memory_loc, marker_name, start_time
+                        )
+                    self._log_marker_placement(
+                        marker_name,
+                        delay,
+                        (
+                            (created_time - request_time) / 2
+                            if start_time != new_memory_loc.start_time
+                            else None
+                        ),
+                    )
+                except ptsl.errors.CommandError as e:
+                    if e.error_type == pt.PT_InvalidParameter:
+                        logger.error("Bad parameter input to create_memory_location")
+        except ProToolsNotConnected as e:
+            logger.error(f"Unable to place marker {marker_name}: {e}")
+
+    def _get_compensated_start_time(
+        self,
+        engine: _TimedEngine,
+        memory_loc: pt.MemoryLocation,
+        delay: Optional[float],
+    ) -> str:
+        """Returns the start time of a new location, moved back by the delay. Only
+        locations with a start time in samples can be moved."""
+        if not delay or not memory_loc.start_time.isdigit():
+            return memory_loc.start_time
+        sample_rate = self._get_sample_rate(engine)
+        if sample_rate is None:
+            return memory_loc.start_time
+        return str(max(0, int(memory_loc.start_time) - round(delay * sample_rate)))
+
+    def _get_sample_rate(self, engine: _TimedEngine) -> Optional[int]:
+        # The sample rate is kept until the session changes
+        if self._sample_rate is None:
             try:
-                print(f"Creating marker: {marker_name}")
-                self.pt_engine_connection.create_memory_location(
-                    memory_number=-1,
-                    start_time="cur_pos",
-                    name=marker_name,
-                    location="MLC_MainRuler",
+                # Sample rates are enum values, such as SR_48000
+                sample_rate = engine.session_sample_rate()
+                self._sample_rate = int(
+                    pt.SampleRate.Name(sample_rate).removeprefix("SR_")
                 )
-                # -1 seems to be a magic number for the next available memory_number.
-            except ptsl.errors.CommandError as e:
-                if e.error_type == pt.PT_InvalidParameter:
-                    logger.error("Bad parameter input to create_memory_location")
-            except grpc._channel._InactiveRpcError:
-                pub.sendMessage(PyPubSubTopics.DAW_CONNECTION_STATUS, connected=False)
-                logger.error("Pro Tools connection lost, Retrying connection")
-                self._open_protools_connection()
+            except (ptsl.errors.CommandError, ValueError) as e:
+                logger.warning(f"Unable to get the Pro Tools sample rate: {e}")
+        return self._sample_rate
+
+    def _edit_memory_location(
+        self,
+        engine: _TimedEngine,
+        memory_loc: pt.MemoryLocation,
+        name: str,
+        start_time: str,
+    ) -> None:
+        # Markers end where they start, so they're moved together
+        end_time = (
+            start_time
+            if memory_loc.end_time == memory_loc.start_time
+            else memory_loc.end_time
+        )
+        engine.edit_memory_location(
+            location_number=memory_loc.number,
+            name=name,
+            start_time=start_time,
+            end_time=end_time,
+            time_properties=memory_loc.time_properties,
+            reference=memory_loc.reference,
+            general_properties=memory_loc.general_properties,
+            comments=memory_loc.comments,
+        )
+        edited_memory_loc = pt.MemoryLocation()
+        edited_memory_loc.CopyFrom(memory_loc)
+        edited_memory_loc.name = name
+        edited_memory_loc.start_time = start_time
+        edited_memory_loc.end_time = end_time
+        self._add_memory_location(edited_memory_loc)
+
+    def _refresh_memory_locations(
+        self, engine: Optional[_TimedEngine] = None
+    ) -> List[pt.MemoryLocation]:
+        """Fetches the memory locations from Pro Tools and rebuilds the index if
+        anything changed. Returns the locations that weren't in the index before.
+        Pass the engine if a session is already open."""
+        if engine is not None:
+            memory_locs = engine.get_memory_locations()
+        else:
+            with self._connection.session() as engine:
+                memory_locs = engine.get_memory_locations()
+        fingerprint = tuple(
+            (memory_loc.number, memory_loc.name, memory_loc.start_time)
+            for memory_loc in memory_locs
+        )
+        with self._memory_locations_lock:
+            if fingerprint == self._memory_locations_fingerprint:
+                return []
+            new_memory_locs = [
+                memory_loc
+                for memory_loc in memory_locs
+                if memory_loc.number not in self._marker_index
+            ]
+            marker_index = self._new_marker_index()
+            for memory_loc in memory_locs:
+                marker_index.add(memory_loc.number, memory_loc.name, memory_loc)
+            self._marker_index = marker_index
+            self._memory_locations_fingerprint = fingerprint
+        logger.debug(f"Indexed {len(memory_locs)} Pro Tools memory locations")
+        return new_memory_locs
+
+    def _add_memory_location(self, memory_loc: pt.MemoryLocation) -> None:
+        """Adds or replaces a single location in the index, after MarkerMatic has
+        created or edited it"""
+        with self._memory_locations_lock:
+            self._marker_index.add(memory_loc.number, memory_loc.name, memory_loc)
+            # The next check should rebuild the index from Pro Tools
+            self._memory_locations_fingerprint = None
+
+    def _find_memory_location(
+        self, name: str, name_only_match: bool
+    ) -> Optional[pt.MemoryLocation]:
+        with self._memory_locations_lock:
+            memory_loc = self._marker_index.find(name, name_only_match)
+        return memory_loc.value if memory_loc is not None else None
+
+    def _memory_location_check_thread(self, stop_event: threading.Event) -> None:
+        # Keeps the index in step with locations the user adds or edits in Pro Tools
+        while not stop_event.wait(MEMORY_LOCATION_CHECK_SECONDS):
+            if not self._connection.is_connected():
+                continue
             try:
-                all_memory_locs = self.pt_engine_connection.get_memory_locations()
-                last_memory_loc = all_memory_locs[-1]
-                if last_memory_loc.name != marker_name:
-                    self.pt_engine_connection.edit_memory_location(
-                        location_number=last_memory_loc.number,
-                        name=marker_name,
-                        start_time=last_memory_loc.start_time,
-                        end_time=last_memory_loc.end_time,
-                        time_properties=last_memory_loc.time_properties,
-                        reference=last_memory_loc.reference,
-                        general_properties=last_memory_loc.general_properties,
-                        comments=last_memory_loc.comments,
-                    )
-            except ptsl.errors.CommandError as e:
-                if e.error_type == pt.PT_InvalidParameter:
-                    logger.error("Bad parameter input to create_memory_location")
-            except grpc._channel._InactiveRpcError:
-                pub.sendMessage(PyPubSubTopics.DAW_CONNECTION_STATUS, connected=False)
-                logger.error("Pro Tools connection lost, Retrying connection")
-                self._open_protools_connection()
+                self._check_session()
+                self._refresh_memory_locations()
+            except Exception as e:
+                logger.debug(f"Unable to check the Pro Tools memory locations: {e}")
+
+    def _check_session(self) -> None:
+        with self._connection.session() as engine:
+            session_name = engine.session_name()
+        if session_name != self._session_name:
+            if self._session_name is not None:
+                logger.info(f"Pro Tools session changed to {session_name}")
+            self._session_name = session_name
+            self._sample_rate = None
+            self._invalidate_tracks()
 
     def _incoming_transport_action(self, transport_action: TransportAction) -> None:
         # If transport actions are received from the console, send to Pro Tools
@@ -155,7 +467,7 @@ class ProTools(Daw):
         except Exception as e:
             logger.error(f"Error processing arming macros: {e}")
 
-    def _handle_cue_load(self, cue: str) -> None:
+    def _handle_cue_load(self, cue: str, arrival_time: Optional[float] = None) -> None:
         # Receives cue information from console and actions based on software mode
         from app_settings import settings
 
@@ -163,7 +475,7 @@ class ProTools(Daw):
             settings.marker_mode is PlaybackState.RECORDING
             and self._get_current_transport_state() == "TS_TransportRecording"
         ):
-            self._place_marker_with_name(cue)
+            self._place_marker_with_name(cue, arrival_time=arrival_time)
         elif settings.marker_mode is PlaybackState.PLAYBACK_TRACK:
             self._get_marker_id_by_name(cue)
 
@@ -177,35 +489,31 @@ class ProTools(Daw):
             transport_state != "TS_TransportPlaying"
             or settings.allow_loading_while_playing
         ):
-            if settings.name_only_match:
-                name_to_match = name_to_match.split(" ")
-                name_to_match = name_to_match[1:]
-                name_to_match = " ".join(name_to_match)
-            with self.pt_send_lock:
-                mem_locs = self.pt_engine_connection.get_memory_locations()
-            for memory_loc in mem_locs:
+            memory_loc = self._find_memory_location(
+                name_to_match, settings.name_only_match
+            )
+            if memory_loc is None:
+                # The location may have been added since the last check
                 try:
-                    test_name = memory_loc.name
-                    if settings.name_only_match:
-                        test_name = test_name.split(" ")
-                        test_name = test_name[1:]
-                        test_name = " ".join(test_name)
-                    if name_to_match == test_name:
-                        self._goto_marker_by_loc(memory_loc)
-                        if (
-                            transport_state == "TS_TransportPlaying"
-                            and settings.allow_loading_while_playing
-                        ):
-                            self._pro_tools_stop()
-                            self._pro_tools_play()
-                except Exception as e:
-                    logger.error(f"Pro Tools responded with an error: {e}")
-                except grpc._channel._InactiveRpcError:
-                    pub.sendMessage(
-                        PyPubSubTopics.DAW_CONNECTION_STATUS, connected=False
-                    )
-                    logger.error("Pro Tools connection lost, Retrying connection")
-                    self._open_protools_connection()
+                    self._refresh_memory_locations()
+                except ProToolsNotConnected as e:
+                    logger.error(f"Unable to find marker {name}: {e}")
+                    return
+                memory_loc = self._find_memory_location(
+                    name_to_match, settings.name_only_match
+                )
+            if memory_loc is None:
+                return
+            try:
+                self._goto_marker_by_loc(memory_loc)
+                if (
+                    transport_state == "TS_TransportPlaying"
+                    and settings.allow_loading_while_playing
+                ):
+                    self._pro_tools_stop()
+                    self._pro_tools_play()
+            except Exception as e:
+                logger.error(f"Pro Tools responded with an error: {e}")
 
     def _goto_marker_by_loc(self, memory_loc: pt.MemoryLocation) -> None:
         """Jump playhead to the given memory location"""
@@ -213,137 +521,185 @@ class ProTools(Daw):
         loc_type = "TLType_Samples"
         if "|" in match_loc_time:
             loc_type = "TLType_BarsBeats"
-        with self.pt_send_lock:
-            try:
-                self.pt_engine_connection.set_timeline_selection(in_time=match_loc_time, location_type=loc_type)
-            except grpc._channel._InactiveRpcError:
-                pub.sendMessage(PyPubSubTopics.DAW_CONNECTION_STATUS, connected=False)
-                logger.error("Pro Tools connection lost, Retrying connection")
-                self._open_protools_connection()
+        with self._connection.session() as engine:
+            engine.set_timeline_selection(
+                in_time=match_loc_time, location_type=loc_type
+            )
 
     def _get_current_transport_state(self):
-        with self.pt_send_lock:
+        try:
+            return self._get_transport_state()[0]
+        except ProToolsNotConnected as e:
+            logger.error(f"Unable to get the Pro Tools transport state: {e}")
+
+    def _get_transport_state(
+        self, engine: Optional[_TimedEngine] = None
+    ) -> Tuple[Optional[str], Optional[bool]]:
+        """Returns the transport state and whether the transport is armed, from
+        the cache if it's recent enough, otherwise from Pro Tools. Commands that
+        act on the state pass the engine of their session, so it can't change
+        before they do."""
+        with self._transport_lock:
+            if (
+                self._transport_state is not None
+                and self._transport_armed is not None
+                and time.monotonic() - self._transport_updated
+                < TRANSPORT_STATE_MAX_AGE_SECONDS
+            ):
+                return self._transport_state, self._transport_armed
+        if engine is not None:
+            return self._refresh_transport_state(engine)
+        with self._connection.session() as engine:
+            return self._refresh_transport_state(engine)
+
+    def _refresh_transport_state(
+        self, engine: _TimedEngine
+    ) -> Tuple[Optional[str], Optional[bool]]:
+        # Cached before the session ends, so a read can't replace the state a
+        # command that follows it expects to leave the transport in
+        transport_state = engine.transport_state()
+        transport_armed = engine.transport_armed()
+        self._set_transport_state(transport_state, transport_armed)
+        return transport_state, transport_armed
+
+    def _set_transport_state(
+        self, transport_state: Optional[str], transport_armed: Optional[bool]
+    ) -> None:
+        # Also called with the state a command is expected to leave the transport
+        # in, until the next refresh confirms it. None forces a refresh.
+        with self._transport_lock:
+            self._transport_state = transport_state
+            self._transport_armed = transport_armed
+            self._transport_updated = time.monotonic()
+
+    def _transport_state_thread(self, stop_event: threading.Event) -> None:
+        while not stop_event.wait(TRANSPORT_STATE_REFRESH_SECONDS):
+            if not self._connection.is_connected():
+                continue
             try:
-                return self.pt_engine_connection.transport_state()
-            except grpc._channel._InactiveRpcError:
-                pub.sendMessage(PyPubSubTopics.DAW_CONNECTION_STATUS, connected=False)
-                logger.error("Pro Tools connection lost, Retrying connection")
-                self._open_protools_connection()
+                with self._connection.session() as engine:
+                    self._refresh_transport_state(engine)
+            except Exception as e:
+                logger.debug(f"Unable to refresh the Pro Tools transport state: {e}")
 
     def _pro_tools_arm_all(self) -> None:
         print("Arming all tracks")
-        with self.pt_send_lock:
-            assert self.pt_engine_connection
-            try:
-                all_tracks = self.pt_engine_connection.track_list()
-                track_names = []
-                for track in all_tracks:
-                    if track.type == 1 or track.type == 2:
-                        track_names.append(track.name)
-                self.pt_engine_connection.set_track_record_enable_state(
-                    *track_names, new_state=True
-                )
-            except grpc._channel._InactiveRpcError:
-                logger.error("Pro Tools connection lost, Retrying connection")
-                self._open_protools_connection()
-            return None
+        self._set_tracks_record_enabled(True)
+        return None
 
     def _pro_tools_disarm_all(self) -> None:
         print("Disarming all tracks")
-        with self.pt_send_lock:
-            assert self.pt_engine_connection
+        self._set_tracks_record_enabled(False)
+        return None
+
+    def _get_recordable_track_names(self, engine: _TimedEngine) -> List[str]:
+        with self._tracks_lock:
+            if self._recordable_track_names is not None:
+                return self._recordable_track_names
+        all_tracks = engine.track_list()
+        track_names = []
+        for track in all_tracks:
+            if track.type == 1 or track.type == 2:
+                track_names.append(track.name)
+        with self._tracks_lock:
+            self._recordable_track_names = track_names
+        return track_names
+
+    def _invalidate_tracks(self) -> None:
+        with self._tracks_lock:
+            self._recordable_track_names = None
+
+    def _set_tracks_record_enabled(self, new_state: bool, retry: bool = True) -> None:
+        """Arms or disarms every audio and MIDI track, in chunks so that other
+        commands can be sent between them"""
+        start_time = time.monotonic()
+        with self._connection.session(CONNECTION_WAIT_SECONDS) as engine:
+            track_names = self._get_recordable_track_names(engine)
+        for index in range(0, len(track_names), TRACK_RECORD_ENABLE_CHUNK_SIZE):
+            chunk = track_names[index : index + TRACK_RECORD_ENABLE_CHUNK_SIZE]
             try:
-                all_tracks = self.pt_engine_connection.track_list()
-                track_names = []
-                for track in all_tracks:
-                    if track.type == 1 or track.type == 2:
-                        track_names.append(track.name)
-                self.pt_engine_connection.set_track_record_enable_state(
-                    *track_names, new_state=False
-                )
-            except grpc._channel._InactiveRpcError:
-                logger.error("Pro Tools connection lost, Retrying connection")
-                self._open_protools_connection()
-            return None
+                with self._connection.session(CONNECTION_WAIT_SECONDS) as engine:
+                    engine.set_track_record_enable_state(*chunk, new_state=new_state)
+            except ptsl.errors.CommandError:
+                # The tracks may have been renamed or removed since they were
+                # cached, so fetch them again and start over
+                self._invalidate_tracks()
+                if not retry:
+                    raise
+                self._set_tracks_record_enabled(new_state, retry=False)
+                return
+        logger.info(
+            f"{'Armed' if new_state else 'Disarmed'} {len(track_names)} Pro Tools tracks in {(time.monotonic() - start_time) * 1000:.0f} ms"
+        )
 
     def _pro_tools_play(self):
         # Since Pro Tools only has a toggle of play state, additional logic is here to validate the toggle to the
         # correct mode
-        with self.pt_send_lock:
-            assert self.pt_engine_connection
-            try:
-                current_transport_state = self.pt_engine_connection.transport_state()
-                if current_transport_state not in (
-                    "TS_TransportPlaying",
-                    "TS_TransportRecording",
-                ):
-                    try:
-                        self.pt_engine_connection.toggle_play_state()
-                    except ptsl.errors.CommandError as e:
-                        if e.error_type == pt.PT_NoOpenedSession:
-                            logger.error(
-                                "Play command failed, no session is currently open"
-                            )
-                            return False
-            except grpc._channel._InactiveRpcError:
-                pub.sendMessage(PyPubSubTopics.DAW_CONNECTION_STATUS, connected=False)
-                logger.error("Pro Tools connection lost, Retrying connection")
-                self._open_protools_connection()
-            return None
+        with self._connection.session(CONNECTION_WAIT_SECONDS) as engine:
+            current_transport_state, current_armed_state = self._get_transport_state(
+                engine
+            )
+            if current_transport_state not in (
+                "TS_TransportPlaying",
+                "TS_TransportRecording",
+            ):
+                try:
+                    engine.toggle_play_state()
+                    self._set_transport_state(
+                        "TS_TransportPlaying", current_armed_state
+                    )
+                except ptsl.errors.CommandError as e:
+                    if e.error_type == pt.PT_NoOpenedSession:
+                        logger.error(
+                            "Play command failed, no session is currently open"
+                        )
+                        return False
+        return None
 
     def _pro_tools_stop(self):
         # Since Pro Tools only has a toggle of play state, additional logic is here to validate the toggle to the
         # correct mode
-        with self.pt_send_lock:
-            assert self.pt_engine_connection
-            try:
-                current_transport_state = self.pt_engine_connection.transport_state()
-                if current_transport_state not in (
-                    "TS_TransportStopped",
-                    "TS_TransportStopping",
-                ):
+        with self._connection.session(CONNECTION_WAIT_SECONDS) as engine:
+            current_transport_state, _ = self._get_transport_state(engine)
+            if current_transport_state not in (
+                "TS_TransportStopped",
+                "TS_TransportStopping",
+            ):
+                try:
+                    engine.toggle_play_state()
+                    # Whether the transport stays armed is left to the refresh
+                    self._set_transport_state("TS_TransportStopped", None)
+                except ptsl.errors.CommandError as e:
+                    if e.error_type == pt.PT_NoOpenedSession:
+                        logger.error(
+                            "Play command failed, no session is currently open"
+                        )
+                        return False
+        return None
+
+    def _pro_tools_rec(self):
+        # Arm transport and validate proper play state
+        with self._connection.session(CONNECTION_WAIT_SECONDS) as engine:
+            current_transport_state, current_armed_state = self._get_transport_state(
+                engine
+            )
+            if not current_armed_state:
+                engine.toggle_record_enable()
+                self._set_transport_state(current_transport_state, True)
+                if current_transport_state != "TS_TransportRecording":
                     try:
-                        self.pt_engine_connection.toggle_play_state()
+                        engine.toggle_play_state()
+                        self._set_transport_state("TS_TransportRecording", True)
                     except ptsl.errors.CommandError as e:
                         if e.error_type == pt.PT_NoOpenedSession:
                             logger.error(
                                 "Play command failed, no session is currently open"
                             )
                             return False
-            except grpc._channel._InactiveRpcError:
-                pub.sendMessage(PyPubSubTopics.DAW_CONNECTION_STATUS, connected=False)
-                logger.error("Pro Tools connection lost, Retrying connection")
-                self._open_protools_connection()
-            return None
-
-    def _pro_tools_rec(self):
-        # Arm transport and validate proper play state
-        with self.pt_send_lock:
-            assert self.pt_engine_connection
-            try:
-                current_transport_state = self.pt_engine_connection.transport_state()
-                current_armed_state = self.pt_engine_connection.transport_armed()
-                if not current_armed_state:
-                    self.pt_engine_connection.toggle_record_enable()
-                    if current_transport_state != "TS_TransportRecording":
-                        try:
-                            self.pt_engine_connection.toggle_play_state()
-                        except ptsl.errors.CommandError as e:
-                            if e.error_type == pt.PT_NoOpenedSession:
-                                logger.error(
-                                    "Play command failed, no session is currently open"
-                                )
-                                return False
-            except grpc._channel._InactiveRpcError:
-                pub.sendMessage(PyPubSubTopics.DAW_CONNECTION_STATUS, connected=False)
-                logger.error("Pro Tools connection lost, Retrying connection")
-                self._open_protools_connection()
-            return None
+        return None
 
     def _shutdown_servers(self) -> None:
         try:
-            if self.pt_engine_connection:
-                self.pt_engine_connection.close()
-                logger.info("Disconnected from Pro Tools")
+            self._connection.close()
         except Exception as e:
             logger.error(f"Error closing Pro Tools connection: {e}")
@@ -1,15 +1,46 @@
+import queue
 import threading
 import time
-from typing import Any, Callable, Optional, overload
+from collections import deque
+from typing import Any, Callable, Deque, List, Optional, overload
 
 from pubsub import pub
-from pythonosc import dispatcher, osc_server, udp_client
+from pythonosc import dispatcher, osc_server
 
 import constants
+import osc_codec
 from constants import PlaybackState, PyPubSubTopics, TransportAction, ArmedAction
 from logger_config import logger
 
-from . import Daw, configure_reaper, DawFeature
+from . import Daw, configure_reaper, DawFeature, get_name_only
+
+# How long to wait for the time of a new marker, after Reaper reports its number
+LAST_MARKER_TIME_WAIT_SECONDS = 0.1
+
+
+class _MarkerPlacement:
+    """A marker waiting to be placed and named, and how long each step took"""
+
+    __slots__ = (
+        "marker_name",
+        "arrival_time",
+        "queued_time",
+        "sent_time",
+        "acknowledged_time",
+        "marker_number",
+        "marker_time",
+        "named",
+    )
+
+    def __init__(self, marker_name: str, arrival_time: Optional[float]) -> None:
+        self.marker_name = marker_name
+        self.arrival_time = arrival_time
+        self.queued_time = time.monotonic()
+        self.sent_time = 0.0
+        self.acknowledged_time = 0.0
+        self.marker_number: Optional[str] = None
+        self.marker_time: Optional[float] = None
+        self.named = threading.Event()
 
 
 class Reaper(Daw):
@@ -22,11 +53,20 @@ class Reaper(Daw):
         self._connected = threading.Event()
         self._connection_check_lock = threading.Lock()
         self._connection_timeout_counter = 0
-        self._last_marker_number = str()
-        self._last_marker_number_lock = threading.Lock()
-        self.last_marker_changed = threading.Event()
+        # Notified whenever Reaper reports a new last marker number or time. Each
+        # is kept with the time.monotonic() it arrived at.
+        self._last_marker_updated = threading.Condition()
+        self._last_marker_number = (0.0, str())
+        self._last_marker_time = (0.0, 0.0)
+        # Markers are placed one after another by the marker thread, so each new
+        # last marker number can be matched with the placement that caused it
+        self._marker_queue: "queue.Queue[_MarkerPlacement]" = queue.Queue()
+        # Seconds from each marker being queued to being named, for recent markers
+        self.marker_placement_latencies: Deque[float] = deque(maxlen=100)
         self.reaper_send_lock = threading.Lock()
         self.name_to_match: Optional[str] = None
+        # Guards the marker index, which holds the names Reaper has sent by marker ID
+        self._marker_index_lock = threading.Lock()
         self.is_playing = False
         self.is_recording = False
         self.reaper_osc_server = None
@@ -48,6 +88,7 @@ class Reaper(Daw):
             "validate_reaper_prefs_thread", self._validate_reaper_prefs
         )
         start_managed_thread("daw_connection_thread", self._build_reaper_osc_servers)
+        start_managed_thread("daw_marker_thread", self._marker_placement_thread)
         start_managed_thread("daw_connection_monitor", self._daw_connection_monitor)
 
     def _daw_connection_monitor(self) -> None:
@@ -71,29 +112,39 @@ class Reaper(Daw):
         # If the Reaper .ini file does not contain an entry for Digico-Reaper Link, add one.
         from app_settings import settings
 
+        retry_delay = 1
         while not self._shutdown_server_event.is_set():
             try:
+                # Finding the resource path means finding the Reaper process, so
+                # it's only done once per attempt
+                resource_path = configure_reaper.get_resource_path(True)
                 if not self._check_reaper_prefs(
-                    settings.reaper_receive_port, settings.reaper_port
+                    resource_path, settings.reaper_receive_port, settings.reaper_port
                 ):
                     self._add_reaper_prefs(
-                        settings.reaper_receive_port, settings.reaper_port
+                        resource_path,
+                        settings.reaper_receive_port,
+                        settings.reaper_port,
                     )
                     pub.sendMessage(
                         PyPubSubTopics.REQUEST_DAW_RESTART, daw_name="Reaper"
                     )
                 return True
             except RuntimeError:
-                # If reaper is not running, wait and try again
-                logger.error("Reaper not running. Will retry in 1 seconds.")
-                time.sleep(1)
+                # If reaper is not running, wait and try again, less often the
+                # longer it's been
+                logger.error(
+                    f"Reaper not running. Will retry in {retry_delay} seconds."
+                )
+                self._shutdown_server_event.wait(retry_delay)
+                retry_delay = min(
+                    retry_delay * 2, constants.CONNECTION_RECONNECTION_DELAY_SECONDS
+                )
         return None
 
     @staticmethod
-    def _check_reaper_prefs(rpr_rcv, rpr_send):
-        if configure_reaper.osc_interface_exists(
-            configure_reaper.get_resource_path(True), rpr_rcv, rpr_send
-        ):
+    def _check_reaper_prefs(resource_path, rpr_rcv, rpr_send):
+        if configure_reaper.osc_interface_exists(resource_path, rpr_rcv, rpr_send):
             logger.info("Reaper OSC interface config already exists")
             return True
         else:
@@ -101,10 +152,8 @@ class Reaper(Daw):
             return False
 
     @staticmethod
-    def _add_reaper_prefs(rpr_rcv, rpr_send):
-        configure_reaper.add_OSC_interface(
-            configure_reaper.get_resource_path(True), rpr_rcv, rpr_send
-        )
+    def _add_reaper_prefs(resource_path, rpr_rcv, rpr_send):
+        configure_reaper.add_OSC_interface(resource_path, rpr_rcv, rpr_send)
         logger.info("Added OSC interface to Reaper preferences")
 
     def _build_reaper_osc_servers(self):
@@ -112,7 +161,7 @@ class Reaper(Daw):
         from app_settings import settings
 
         logger.info("Starting Reaper OSC server")
-        self.reaper_client = udp_client.SimpleUDPClient(
+        self.reaper_client = osc_codec.BundleClient(
             constants.IP_LOOPBACK, settings.reaper_port
         )
         self.reaper_dispatcher = dispatcher.Dispatcher()
@@ -133,6 +182,7 @@ class Reaper(Daw):
         self.reaper_dispatcher.map("/play", self._current_transport_state)
         self.reaper_dispatcher.map("/record", self._current_transport_state)
         self.reaper_dispatcher.map("/lastmarker/number/str", self._last_marker_received)
+        self.reaper_dispatcher.map("/lastmarker/time", self._last_marker_time_changed)
         self.reaper_dispatcher.set_default_handler(self._message_received)
 
     def _message_received(self, *_) -> None:
@@ -144,22 +194,40 @@ class Reaper(Daw):
         with self._connection_check_lock:
             self._connection_timeout_counter = 0
 
-    @property
-    def last_marker_received(self) -> str:
-        with self._last_marker_number_lock:
-            return self._last_marker_number
-
-    @last_marker_received.setter
-    def last_marker_received(self, value: str) -> None:
-        with self._last_marker_number_lock:
-            if self._last_marker_number != value:
-                self.last_marker_changed.set()
-                self.last_marker_changed.clear()
-            self._last_marker_number = value
-
     def _last_marker_received(self, _, marker_number: str) -> None:
         self._message_received()
-        self.last_marker_received = marker_number
+        with self._last_marker_updated:
+            # Reaper repeats the number when other feedback is refreshed
+            if marker_number != self._last_marker_number[1]:
+                self._last_marker_number = (time.monotonic(), marker_number)
+                self._last_marker_updated.notify_all()
+
+    def _last_marker_time_changed(self, _, marker_time: float) -> None:
+        self._message_received()
+        with self._last_marker_updated:
+            self._last_marker_time = (time.monotonic(), marker_time)
+            self._last_marker_updated.notify_all()
+
+    def _get_last_marker_number(self, since: float, timeout: float) -> Optional[str]:
+        """Returns the last marker's number, if it has changed since the given
+        time.monotonic()"""
+        with self._last_marker_updated:
+            if self._last_marker_updated.wait_for(
+                lambda: self._last_marker_number[0] >= since, timeout
+            ):
+                return self._last_marker_number[1]
+        return None
+
+    def _get_last_marker_time(self, since: float) -> Optional[float]:
+        """Returns the last marker's time in seconds, if Reaper has sent one since
+        the given time.monotonic()"""
+        with self._last_marker_updated:
+            if self._last_marker_updated.wait_for(
+                lambda: self._last_marker_time[0] >= since,
+                LAST_MARKER_TIME_WAIT_SECONDS,
+            ):
+                return self._last_marker_time[1]
+        return None
 
     def _marker_matcher(self, osc_address: str, test_name: str) -> None:
         self._message_received()
@@ -168,8 +236,14 @@ class Reaper(Daw):
 
         address_split = osc_address.split("/")
         marker_id = address_split[2]
+        with self._marker_index_lock:
+            if not test_name:
+                # Reaper clears the names of slots that no longer hold a marker
+                self._marker_index.remove(marker_id)
+                return
+            marker = self._marker_index.add(marker_id, test_name)
         if settings.name_only_match:
-            test_name = " ".join(test_name.split(" ")[1:])
+            test_name = marker.name_only
         if test_name == self.name_to_match:
             self._goto_marker_by_id(marker_id)
             self.name_to_match = None
@@ -219,23 +293,116 @@ class Reaper(Daw):
         pass
 
     @overload
-    def _place_marker_with_name(self, marker_name: str, as_thread: bool = True) -> None:
+    def _place_marker_with_name(
+        self,
+        marker_name: str,
+        as_thread: bool = True,
+        arrival_time: Optional[float] = None,
+    ) -> None:
         pass
 
-    def _place_marker_with_name(self, marker_name: str, as_thread: bool = True) -> None:
-        if as_thread:
-            threading.Thread(
-                target=self._place_marker_with_name, args=(marker_name, False)
-            ).start()
-            return
-        logger.info(f"Placed marker for cue: {marker_name}")
-        with self.reaper_send_lock:
-            self.reaper_client.send_message("/action", 40157)
-        if not self.last_marker_changed.wait(constants.MESSAGE_TIMEOUT_SECONDS):
-            logger.error("REAPER probably didn't place a new marker")
-            return
-        with self.reaper_send_lock:
-            self.reaper_client.send_message("/lastmarker/name", marker_name)
+    def _place_marker_with_name(
+        self,
+        marker_name: str,
+        as_thread: bool = True,
+        arrival_time: Optional[float] = None,
+    ) -> None:
+        # Without a thread, waits until the marker has been named
+        placement = _MarkerPlacement(marker_name, arrival_time)
+        self._marker_queue.put(placement)
+        if not as_thread:
+            placement.named.wait(2 * constants.MESSAGE_TIMEOUT_SECONDS)
+
+    def _marker_placement_thread(self, stop_event: threading.Event) -> None:
+        # Each marker is named by its number while the next one is being placed,
+        # so a burst of cues doesn't wait on a name for every marker
+        placed: Optional[_MarkerPlacement] = None
+        while not stop_event.is_set():
+            try:
+                placement: Optional[_MarkerPlacement] = self._marker_queue.get(
+                    timeout=0 if placed else constants.CONNECTION_TIMEOUT_SECONDS
+                )
+            except queue.Empty:
+                placement = None
+            commands = [] if placed is None else self._get_marker_name_commands(placed)
+            if placement is not None:
+                commands.append(("/action", 40157))
+            if not commands:
+                continue
+            try:
+                with self.reaper_send_lock:
+                    if placement is not None:
+                        placement.sent_time = time.monotonic()
+                    self.reaper_client.send_bundle(commands)
+            except (AttributeError, OSError) as e:
+                logger.error(f"Unable to place markers in REAPER: {e}")
+                for unplaced in (placed, placement):
+                    if unplaced is not None:
+                        unplaced.named.set()
+                placed = None
+                continue
+            if placed is not None:
+                self._marker_named(placed)
+            placed = None
+            if placement is not None and self._wait_for_marker_number(placement):
+                placed = placement
+
+    def _wait_for_marker_number(self, placement: _MarkerPlacement) -> bool:
+        """Waits for Reaper to report the number of the marker it just placed.
+        Returns False if it didn't place one."""
+        placement.marker_number = self._get_last_marker_number(
+            placement.sent_time, constants.MESSAGE_TIMEOUT_SECONDS
+        )
+        placement.acknowledged_time = time.monotonic()
+        if placement.marker_number is None:
+            logger.error(
+                f"REAPER probably didn't place a marker for {placement.marker_name}"
+            )
+            placement.named.set()
+            return False
+        if self._get_cue_delay(placement.arrival_time, placement.sent_time):
+            placement.marker_time = self._get_last_marker_time(placement.sent_time)
+        return True
+
+    def _get_marker_name_commands(
+        self, placement: _MarkerPlacement
+    ) -> List[osc_codec.Command]:
+        # Markers are addressed by number, as the last marker may already be the
+        # next one
+        marker_address = f"/marker_id/{placement.marker_number}"
+        commands: List[osc_codec.Command] = [
+            (f"{marker_address}/name", placement.marker_name)
+        ]
+        delay = self._get_cue_delay(placement.arrival_time, placement.sent_time)
+        if placement.marker_time is not None and delay:
+            # Move the marker back to when the cue arrived
+            commands.append(
+                (f"{marker_address}/time", max(0.0, placement.marker_time - delay))
+            )
+        return commands
+
+    def _marker_named(self, placement: _MarkerPlacement) -> None:
+        named_time = time.monotonic()
+        placement.named.set()
+        self.marker_placement_latencies.append(named_time - placement.queued_time)
+        # Reaper placed the marker at the playhead somewhere between sending the
+        # action and hearing back about it
+        self._log_marker_placement(
+            placement.marker_name,
+            self._get_cue_delay(placement.arrival_time, placement.sent_time),
+            (
+                placement.acknowledged_time - placement.sent_time
+                if placement.marker_time is not None
+                else None
+            ),
+        )
+        logger.debug(
+            f"Marker {placement.marker_name} was queued for "
+            f"{(placement.sent_time - placement.queued_time) * 1000:.1f} ms, "
+            f"numbered {placement.marker_number} after "
+            f"{(placement.acknowledged_time - placement.sent_time) * 1000:.1f} ms, "
+            f"and named after {(named_time - placement.queued_time) * 1000:.1f} ms"
+        )
 
     def get_marker_id_by_name(self, name: str) -> None:
         # Asks for current marker information based upon number of markers.
@@ -244,9 +411,15 @@ class Reaper(Daw):
         if not self.is_recording and (
             not self.is_playing or settings.allow_loading_while_playing
         ):
+            with self._marker_index_lock:
+                marker = self._marker_index.find(name, settings.name_only_match)
+            if marker is not None:
+                # Reaper keeps sending name changes, so the index is current
+                self._goto_marker_by_id(marker.marker_id)
+                return
             self.name_to_match = name
             if settings.name_only_match and self.name_to_match is not None:
-                self.name_to_match = " ".join(self.name_to_match.split(" ")[1:])
+                self.name_to_match = get_name_only(self.name_to_match)
             with self.reaper_send_lock:
                 self.reaper_client.send_message("/device/marker/count", 0)
                 # Is there a better way to handle this in OSC only? Max of 512 markers.
@@ -283,12 +456,14 @@ class Reaper(Daw):
             logger.info("Reaper has disarmed all tracks")
 
     def _reaper_play(self) -> None:
+        commands: List[osc_codec.Command] = []
         if self.is_recording:
-            with self.reaper_send_lock:
-                self.reaper_client.send_message("/record", None)
+            commands.append(("/record", None))
         if not self.is_playing:
+            commands.append(("/play", None))
+        if commands:
             with self.reaper_send_lock:
-                self.reaper_client.send_message("/play", None)
+                self.reaper_client.send_bundle(commands)
 
     def _reaper_stop(self) -> None:
         with self.reaper_send_lock:
@@ -305,14 +480,13 @@ class Reaper(Daw):
                 selected_mode=PlaybackState.RECORDING,
             )
             with self.reaper_send_lock:
-                self.reaper_client.send_message("/action", 40043)
-                self.reaper_client.send_message("/record", None)
+                self.reaper_client.send_bundle([("/action", 40043), ("/record", None)])
 
-    def _handle_cue_load(self, cue: str) -> None:
+    def _handle_cue_load(self, cue: str, arrival_time: Optional[float] = None) -> None:
         from app_settings import settings
 
         if settings.marker_mode is PlaybackState.RECORDING and self.is_recording:
-            self._place_marker_with_name(cue, False)
+            self._place_marker_with_name(cue, arrival_time=arrival_time)
         elif settings.marker_mode is PlaybackState.PLAYBACK_TRACK:
             self.get_marker_id_by_name(cue)
 
@@ -69,13 +69,11 @@ def _handle_armed(_address: str, armed: list[ArmedAction], *_) -> None:
 
 
 def _handle_marker(_address: str, marker_name: Optional[str] = None) -> None:
-    if marker_name:
-        pub.sendMessage(PyPubSubTopics.PLACE_MARKER_WITH_NAME, marker_name=marker_name)
-    else:
-        pub.sendMessage(
-            PyPubSubTopics.PLACE_MARKER_WITH_NAME,
-            marker_name="Marker from External Control",
-        )
+    pub.sendMessage(
+        PyPubSubTopics.PLACE_MARKER_WITH_NAME,
+        marker_name=marker_name or "Marker from External Control",
+        arrival_time=time.monotonic(),
+    )
 
 
 def external_midi_control(stop_event: threading.Event):
@@ -2,6 +2,7 @@ import ipaddress
 import os.path
 import platform
 import threading
+import time
 import webbrowser
 from typing import Optional
 
@@ -339,7 +340,9 @@ class MainPanel(wx.Window):
     def place_marker(e):
         # Manually places a marker from the UI
         pub.sendMessage(
-            PyPubSubTopics.PLACE_MARKER_WITH_NAME, marker_name="Marker from UI"
+            PyPubSubTopics.PLACE_MARKER_WITH_NAME,
+            marker_name="Marker from UI",
+            arrival_time=time.monotonic(),
         )
 
     def update_playback_state(self, selected_mode: PlaybackState):
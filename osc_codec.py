@@ -0,0 +1,279 @@
+import struct
+from functools import lru_cache
+from typing import Any, Iterable, Iterator, List, Tuple, Union
+
+from pythonosc import udp_client
+from pythonosc.dispatcher import Dispatcher
+from pythonosc.osc_bundle import OscBundle
+from pythonosc.osc_bundle_builder import IMMEDIATELY, OscBundleBuilder
+from pythonosc.osc_message import OscMessage
+from pythonosc.osc_message_builder import OscMessageBuilder
+
+from logger_config import logger
+
+# A table-driven OSC decoder. Each type tag string is compiled once into a plan
+# of struct reads, and datagrams are read in place through a memoryview instead
+# of being sliced for every argument. Adapters that need it opt in by using the
+# DispatchClient below, nothing in python-osc is patched. Commands that have to
+# arrive together are sent as a single bundle by the clients below.
+
+BUNDLE_PREFIX = b"#bundle\x00"
+
+# An address and its arguments, with the same argument handling as python-osc's
+# SimpleUDPClient
+Command = Tuple[str, Union[Any, Iterable[Any]]]
+
+# Plan operations
+_OP_FIXED = 0  # Struct whose values are added to the parameters individually
+_OP_GROUPED = 1  # Struct whose values are added to the parameters as one tuple
+_OP_STRING = 2
+_OP_BLOB = 3
+_OP_CONSTANT = 4
+_OP_ARRAY_START = 5
+_OP_ARRAY_END = 6
+
+# Fixed width type tags that map to a single value
+_SCALAR_TYPE_TAGS = {
+    "i": "i",  # Integer
+    "h": "q",  # Int64
+    "f": "f",  # Float
+    "d": "d",  # Double
+    "r": "I",  # RGBA
+}
+
+# Type tags without any data
+_CONSTANT_TYPE_TAGS = {
+    "T": True,
+    "F": False,
+    "N": None,
+    "I": float("inf"),
+}
+
+# Fixed width type tags whose values are kept together as a tuple, extended with
+# register_type_tag()
+_grouped_type_tags = {
+    "m": struct.Struct(">4B"),  # MIDI
+    "t": struct.Struct(">II"),  # OSC time tag, as (seconds, fraction)
+}
+
+_INT = struct.Struct(">i")
+
+
+class ParseError(Exception):
+    """Raised when a datagram isn't valid OSC"""
+
+
+class DecodedMessage:
+    """An OSC message, compatible with python-osc's dispatcher handlers"""
+
+    __slots__ = ("address", "params")
+
+    def __init__(self, address: str, params: List[Any]) -> None:
+        self.address = address
+        self.params = params
+
+    def __iter__(self) -> Iterator[Any]:
+        return iter(self.params)
+
+    def __str__(self) -> str:
+        return f"{self.address} {' '.join(str(p) for p in self.params)}"
+
+
+def register_type_tag(type_tag: str, struct_format: str) -> None:
+    """Registers a non-standard, fixed width type tag. Its value is decoded with
+    the given big-endian struct format, and passed to handlers as a tuple."""
+    if len(type_tag) != 1 or type_tag in _SCALAR_TYPE_TAGS or type_tag in "sb[]":
+        raise ValueError(f"Type tag {type_tag!r} can't be registered")
+    _grouped_type_tags[type_tag] = struct.Struct(">" + struct_format.lstrip("><!=@"))
+    # Plans compiled before this may have skipped the new type tag
+    _get_plan.cache_clear()
+
+
+@lru_cache(maxsize=256)
+def _get_plan(type_tag: str) -> Tuple[Tuple[int, Any], ...]:
+    """Compiles a type tag string into the operations needed to decode it. Runs
+    of fixed width scalars are merged into a single struct read."""
+    plan: List[Tuple[int, Any]] = []
+    scalar_run = ""
+
+    def flush_scalar_run() -> None:
+        nonlocal scalar_run
+        if scalar_run:
+            plan.append((_OP_FIXED, struct.Struct(">" + scalar_run)))
+            scalar_run = ""
+
+    for tag in type_tag:
+        if tag in _SCALAR_TYPE_TAGS:
+            scalar_run += _SCALAR_TYPE_TAGS[tag]
+            continue
+        flush_scalar_run()
+        if tag == "s" or tag == "S":
+            plan.append((_OP_STRING, None))
+        elif tag == "b":
+            plan.append((_OP_BLOB, None))
+        elif tag in _CONSTANT_TYPE_TAGS:
+            plan.append((_OP_CONSTANT, _CONSTANT_TYPE_TAGS[tag]))
+        elif tag in _grouped_type_tags:
+            plan.append((_OP_GROUPED, _grouped_type_tags[tag]))
+        elif tag == "[":
+            plan.append((_OP_ARRAY_START, None))
+        elif tag == "]":
+            plan.append((_OP_ARRAY_END, None))
+        else:
+            logger.warning(f"Unhandled parameter type: {tag}")
+    flush_scalar_run()
+    return tuple(plan)
+
+
+def _read_string(
+    view: memoryview, dgram: bytes, index: int, end: int
+) -> Tuple[str, int]:
+    terminator = dgram.find(b"\x00", index, end)
+    if terminator == -1:
+        raise ParseError("Unterminated string")
+    # Strings are null terminated and padded to a multiple of 4 bytes
+    return str(view[index:terminator], "utf-8"), (terminator & ~3) + 4
+
+
+def _decode_message(
+    view: memoryview, dgram: bytes, index: int, end: int
+) -> DecodedMessage:
+    address, index = _read_string(view, dgram, index, end)
+    if index >= end:
+        # No params is legit
+        return DecodedMessage(address, [])
+    type_tag, index = _read_string(view, dgram, index, end)
+    if not type_tag.startswith(","):
+        raise ParseError(f"Missing type tag for {address}")
+    params: List[Any] = []
+    param_stack = [params]
+    for operation, argument in _get_plan(type_tag[1:]):
+        if operation == _OP_FIXED:
+            param_stack[-1].extend(argument.unpack_from(view, index))
+            index += argument.size
+        elif operation == _OP_STRING:
+            value, index = _read_string(view, dgram, index, end)
+            param_stack[-1].append(value)
+        elif operation == _OP_GROUPED:
+            param_stack[-1].append(argument.unpack_from(view, index))
+            index += argument.size
+        elif operation == _OP_CONSTANT:
+            param_stack[-1].append(argument)
+        elif operation == _OP_BLOB:
+            (size,) = _INT.unpack_from(view, index)
+            index += 4
+            if size < 0 or index + size > end:
+                raise ParseError("Blob is longer than the datagram")
+            param_stack[-1].append(bytes(view[index : index + size]))
+            index += (size + 3) & ~3
+        elif operation == _OP_ARRAY_START:
+            array: List[Any] = []
+            param_stack[-1].append(array)
+            param_stack.append(array)
+        elif operation == _OP_ARRAY_END:
+            if len(param_stack) < 2:
+                raise ParseError(f"Unexpected closing bracket in type tag: {type_tag}")
+            param_stack.pop()
+    if len(param_stack) != 1:
+        raise ParseError(f"Missing closing bracket in type tag: {type_tag}")
+    if index > end:
+        raise ParseError(f"Datagram is too short for type tag: {type_tag}")
+    return DecodedMessage(address, params)
+
+
+def _decode_element(
+    view: memoryview, dgram: bytes, index: int, end: int, messages: List[DecodedMessage]
+) -> None:
+    if dgram.startswith(BUNDLE_PREFIX, index):
+        # Skip the bundle header and time tag, everything is handled immediately
+        index += 16
+        while index < end:
+            (size,) = _INT.unpack_from(view, index)
+            index += 4
+            if size <= 0 or index + size > end:
+                raise ParseError("Bundle element is longer than the bundle")
+            _decode_element(view, dgram, index, index + size, messages)
+            index += size
+    elif dgram.startswith(b"/", index):
+        messages.append(_decode_message(view, dgram, index, end))
+    else:
+        raise ParseError("Datagram is neither a message nor a bundle")
+
+
+def decode_packet(dgram: bytes) -> List[DecodedMessage]:
+    """Decodes an OSC message or bundle into the messages it contains"""
+    messages: List[DecodedMessage] = []
+    try:
+        with memoryview(dgram) as view:
+            _decode_element(view, dgram, 0, len(dgram), messages)
+    except (struct.error, UnicodeDecodeError) as e:
+        raise ParseError(f"Found incorrect datagram: {e}") from e
+    return messages
+
+
+def call_handlers(
+    dispatcher: Dispatcher,
+    messages: List[DecodedMessage],
+    client_address: Tuple[str, int],
+) -> None:
+    """Invokes the dispatcher's handlers for each of the decoded messages"""
+    for message in messages:
+        for handler in dispatcher.handlers_for_address(message.address):
+            handler.invoke(client_address, message)  # type: ignore[arg-type]
+
+
+def build_message(address: str, value: Union[Any, Iterable[Any]]) -> OscMessage:
+    builder = OscMessageBuilder(address=address)
+    if value is None:
+        pass
+    elif not isinstance(value, Iterable) or isinstance(value, (str, bytes)):
+        builder.add_arg(value)
+    else:
+        for arg in value:
+            builder.add_arg(arg)
+    return builder.build()
+
+
+def build_bundle(
+    commands: Iterable[Command], timetag: float = IMMEDIATELY
+) -> OscBundle:
+    """Builds a bundle of commands, which the receiver handles in order at the
+    time tag, or as soon as it arrives by default"""
+    builder = OscBundleBuilder(timetag)
+    for address, value in commands:
+        builder.add_content(build_message(address, value))
+    return builder.build()
+
+
+class BundleClient(udp_client.SimpleUDPClient):
+    """UDP client that can send several commands in one datagram, so they can't
+    be lost or reordered separately"""
+
+    def send_bundle(
+        self, commands: Iterable[Command], timetag: float = IMMEDIATELY
+    ) -> None:
+        self.send(build_bundle(commands, timetag))
+
+
+class DispatchClient(BundleClient):
+    """UDP client that decodes incoming datagrams with this module, and hands the
+    messages to a python-osc dispatcher"""
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.dispatcher = Dispatcher()
+
+    def handle_messages(self, timeout: float | None = None) -> None:
+        """Handles incoming messages until none arrive for timeout seconds"""
+        dgram = self.receive(timeout)
+        while dgram:
+            self.call_handlers_for_packet(dgram)
+            dgram = self.receive(timeout)
+
+    def call_handlers_for_packet(self, dgram: bytes) -> None:
+        try:
+            messages = decode_packet(dgram)
+        except ParseError as e:
+            logger.debug(f"Ignoring a malformed OSC datagram: {e}")
+            return
+        call_handlers(self.dispatcher, messages, (self._address, self._port))
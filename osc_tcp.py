@@ -0,0 +1,263 @@
+import socket
+import struct
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Deque, Dict, Iterable, List, Optional, Tuple, Union
+
+from pythonosc.dispatcher import Dispatcher
+from pythonosc.osc_bundle_builder import IMMEDIATELY
+
+import constants
+import osc_codec
+from logger_config import logger
+
+# A persistent TCP connection to an OSC server. Incoming packets are framed with a
+# streaming decoder, handed to a python-osc dispatcher, and matched up with any
+# requests that are waiting on them.
+
+MODE_1_0 = "1.0"  # Packets are prefixed with their length
+MODE_1_1 = "1.1"  # Packets are SLIP encoded
+
+SLIP_END = b"\xc0"
+SLIP_ESC = b"\xdb"
+SLIP_ESC_END = b"\xdb\xdc"
+SLIP_ESC_ESC = b"\xdb\xdd"
+
+RECEIVE_BUFFER_SIZE = 65536
+# How often the receive loop wakes up to check for shutdown and expired requests
+RECEIVE_POLL_SECONDS = 0.5
+
+_LENGTH = struct.Struct(">i")
+
+
+def slip_encode(packet: bytes) -> bytes:
+    # Packets are wrapped in END bytes, as recommended by OSC 1.1
+    escaped = packet.replace(SLIP_ESC, SLIP_ESC_ESC).replace(SLIP_END, SLIP_ESC_END)
+    return SLIP_END + escaped + SLIP_END
+
+
+class SlipDecoder:
+    """Streaming decoder for SLIP framed packets, which may arrive split across or
+    combined within reads"""
+
+    def __init__(self) -> None:
+        self._buffer = bytearray()
+
+    def feed(self, data: bytes) -> List[bytes]:
+        self._buffer += data
+        if SLIP_END not in data:
+            return []
+        *frames, remainder = self._buffer.split(SLIP_END)
+        self._buffer = remainder
+        return [
+            bytes(frame).replace(SLIP_ESC_END, SLIP_END).replace(SLIP_ESC_ESC, SLIP_ESC)
+            for frame in frames
+            if frame
+        ]
+
+
+class LengthPrefixDecoder:
+    """Streaming decoder for OSC 1.0 packets, which are prefixed with their length"""
+
+    def __init__(self) -> None:
+        self._buffer = bytearray()
+
+    def feed(self, data: bytes) -> List[bytes]:
+        self._buffer += data
+        frames = []
+        index = 0
+        while len(self._buffer) - index >= _LENGTH.size:
+            (length,) = _LENGTH.unpack_from(self._buffer, index)
+            if len(self._buffer) - index - _LENGTH.size < length:
+                break
+            index += _LENGTH.size
+            frames.append(bytes(self._buffer[index : index + length]))
+            index += length
+        del self._buffer[:index]
+        return frames
+
+
+class _PendingRequest:
+    __slots__ = ("future", "address", "sent_time", "deadline")
+
+    def __init__(self, address: str, timeout: float) -> None:
+        self.future: Future = Future()
+        self.address = address
+        self.sent_time = time.monotonic()
+        self.deadline = self.sent_time + timeout
+
+
+class OscTcpConnection:
+    """Persistent TCP connection to an OSC server. Messages are handed to the
+    dispatcher by handle_messages(), and request() returns a future that resolves
+    with the matching reply."""
+
+    def __init__(
+        self,
+        address: str,
+        port: int,
+        dispatcher: Dispatcher,
+        mode: str = MODE_1_1,
+        request_timeout: float = constants.MESSAGE_TIMEOUT_SECONDS,
+    ) -> None:
+        self.address = address
+        self.port = port
+        self.dispatcher = dispatcher
+        self.mode = mode
+        self.request_timeout = request_timeout
+        self._socket: Optional[socket.socket] = None
+        self._decoder: Union[SlipDecoder, LengthPrefixDecoder]
+        self._send_lock = threading.Lock()
+        self._pending_lock = threading.Lock()
+        # Requests waiting on a reply, oldest first, by the address of the reply
+        self._pending: Dict[str, Deque[_PendingRequest]] = {}
+        # Round trip times of recent requests, in seconds
+        self.latencies: Deque[float] = deque(maxlen=100)
+
+    def connect(self, timeout: float = constants.CONNECTION_TIMEOUT_SECONDS) -> None:
+        """Opens the connection, raising OSError if the server can't be reached"""
+        self._decoder = (
+            SlipDecoder() if self.mode == MODE_1_1 else LengthPrefixDecoder()
+        )
+        self._socket = socket.create_connection((self.address, self.port), timeout)
+        self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._socket.settimeout(RECEIVE_POLL_SECONDS)
+        logger.info(f"Connected to OSC over TCP at {self.address}:{self.port}")
+
+    @property
+    def connected(self) -> bool:
+        return self._socket is not None
+
+    def send(self, dgram: bytes) -> None:
+        if self._socket is None:
+            raise ConnectionError("Not connected")
+        if self.mode == MODE_1_1:
+            packet = slip_encode(dgram)
+        else:
+            packet = _LENGTH.pack(len(dgram)) + dgram
+        with self._send_lock:
+            self._socket.sendall(packet)
+
+    def send_message(
+        self, address: str, value: Union[Any, Iterable[Any]] = None
+    ) -> None:
+        """Sends a message, with the same argument handling as python-osc's
+        SimpleUDPClient"""
+        self.send(osc_codec.build_message(address, value).dgram)
+
+    def send_bundle(
+        self, commands: Iterable[osc_codec.Command], timetag: float = IMMEDIATELY
+    ) -> None:
+        """Sends (address, value) pairs as a single OSC bundle, to be handled
+        immediately unless a time tag is given"""
+        self.send(osc_codec.build_bundle(commands, timetag).dgram)
+
+    def request(
+        self,
+        address: str,
+        value: Union[Any, Iterable[Any]] = None,
+        reply_address: Optional[str] = None,
+        timeout: Optional[float] = None,
+    ) -> "Future[osc_codec.DecodedMessage]":
+        """Sends a message, returning a future for the first reply to arrive at
+        reply_address (which defaults to the request's own address). The future
+        fails with TimeoutError if no reply arrives in time."""
+        if reply_address is None:
+            reply_address = address
+        pending_request = _PendingRequest(
+            reply_address, self.request_timeout if timeout is None else timeout
+        )
+        # Register before sending, so a fast reply can't be missed
+        with self._pending_lock:
+            self._pending.setdefault(reply_address, deque()).append(pending_request)
+        try:
+            self.send_message(address, value)
+        except OSError as e:
+            self._remove_pending(pending_request)
+            pending_request.future.set_exception(e)
+        return pending_request.future
+
+    def handle_messages(self, stop_event: threading.Event) -> None:
+        """Reads from the connection until it's closed, or stop_event is set.
+        Raises ConnectionError if the server closes the connection."""
+        client_address = (self.address, self.port)
+        while not stop_event.is_set():
+            sock = self._socket
+            if sock is None:
+                raise ConnectionError("Not connected")
+            try:
+                data = sock.recv(RECEIVE_BUFFER_SIZE)
+            except (TimeoutError, socket.timeout):
+                self._expire_requests()
+                continue
+            if not data:
+                raise ConnectionError(
+                    f"{self.address}:{self.port} closed the connection"
+                )
+            for frame in self._decoder.feed(data):
+                try:
+                    messages = osc_codec.decode_packet(frame)
+                except osc_codec.ParseError as e:
+                    logger.debug(f"Ignoring a malformed OSC packet: {e}")
+                    continue
+                for message in messages:
+                    self._resolve_request(message)
+                osc_codec.call_handlers(self.dispatcher, messages, client_address)
+            self._expire_requests()
+
+    def _resolve_request(self, message: osc_codec.DecodedMessage) -> None:
+        with self._pending_lock:
+            waiting = self._pending.get(message.address)
+            if not waiting:
+                return
+            pending_request = waiting.popleft()
+            if not waiting:
+                del self._pending[message.address]
+        latency = time.monotonic() - pending_request.sent_time
+        self.latencies.append(latency)
+        logger.debug(f"{message.address} replied in {latency * 1000:.1f} ms")
+        pending_request.future.set_result(message)
+
+    def _remove_pending(self, pending_request: _PendingRequest) -> None:
+        with self._pending_lock:
+            waiting = self._pending.get(pending_request.address)
+            if waiting and pending_request in waiting:
+                waiting.remove(pending_request)
+                if not waiting:
+                    del self._pending[pending_request.address]
+
+    def _expire_requests(self) -> None:
+        now = time.monotonic()
+        expired: List[_PendingRequest] = []
+        with self._pending_lock:
+            for reply_address in list(self._pending):
+                waiting = self._pending[reply_address]
+                while waiting and waiting[0].deadline <= now:
+                    expired.append(waiting.popleft())
+                if not waiting:
+                    del self._pending[reply_address]
+        for pending_request in expired:
+            pending_request.future.set_exception(
+                TimeoutError(f"No reply to {pending_request.address}")
+            )
+
+    def close(self) -> None:
+        sock, self._socket = self._socket, None
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            sock.close()
+        with self._pending_lock:
+            pending: List[Tuple[str, Deque[_PendingRequest]]] = list(
+                self._pending.items()
+            )
+            self._pending.clear()
+        for reply_address, waiting in pending:
+            for pending_request in waiting:
+                pending_request.future.set_exception(
+                    ConnectionError(f"Connection closed waiting on {reply_address}")
+                )